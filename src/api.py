@@ -1,31 +1,71 @@
 import asyncio
+import json
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Optional
 
-from quart import Quart, redirect, render_template, request, url_for
+from quart import Quart, Response, redirect, render_template, request, url_for
 
-from src.controllers.utils.instances import get_spotify_controller
-from src.main import monitor_and_control_speakers, turn_off_speakers, turn_on_speakers
+from src.controllers.smart_plug_controller import disconnect_plugs
+from src.controllers.utils.instances import get_energy_monitor, get_spotify_accounts
+from src.main import (
+    monitor_and_control_speakers,
+    start_up,
+    stop_audio_capture,
+    turn_off_speakers,
+    turn_on_speakers,
+)
 from src.system_state import SystemState
-from src.utils.logging import HEALTH_LOG_FILE
+from src.utils.history import MAX_QUERY_EVENTS, query_events
+from src.utils.http_client import close_http_session
+from src.utils.log_reader import (
+    MAX_PAGE_BYTES,
+    MAX_TAIL_LINES,
+    LineFilter,
+    follow_lines,
+    read_page,
+    tail_lines,
+)
+from src.utils.logging import get_health_entries
+from src.utils.metrics import render_metrics
+
+# Log files that can be read through the API: the app log and its backups
+LOG_FILE_PATTERN = re.compile(r"^app\.log(\.[0-9_-]+)?$")
 
 app = Quart(__name__)
-system_state = SystemState()
+_system_state: Optional[SystemState] = None
+_monitor_task: Optional[asyncio.Task] = None
+
 
-spotify_controller = get_spotify_controller()
+def get_system_state() -> SystemState:
+    """Returns the state shared by the monitor and the pages, built on first use."""
+    global _system_state
+    if _system_state is None:
+        _system_state = SystemState()
+    return _system_state
 
 
 @app.route("/authorize")
 async def authorize():
-    """Endpoint to initiate authorization with Spotify."""
-    auth_url = spotify_controller.get_authorization_url()
-    return redirect(auth_url)
+    """Endpoint to initiate authorization with Spotify, of the account named in
+    `account` or the unnamed one."""
+    account = get_spotify_accounts().get_account(request.args.get("account", ""))
+    if account is None:
+        return "Account not found", 404
+    return redirect(account.get_authorization_url())
 
 
 @app.route("/callback")
 async def callback():
-    """Callback endpoint after authorization with Spotify."""
+    """Callback endpoint after authorization with Spotify. The account being
+    authorized is passed back as the state."""
     code = request.args.get("code")
+    account = get_spotify_accounts().get_account(request.args.get("state", ""))
+    if account is None:
+        return "Account not found", 404
     if code:
-        access_token = spotify_controller.get_access_token(code)
+        access_token = await account.get_access_token(code)
         if access_token:
             return redirect(url_for("control_speakers"))
         return "Failed to get access token."
@@ -38,22 +78,168 @@ async def health_check():
     return "OK", 200
 
 
+@app.route("/metrics")
+async def metrics():
+    """Endpoint exposing performance metrics in Prometheus format."""
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
 @app.route("/logs")
 async def get_logs():
-    """Endpoint to view latest log."""
+    """Endpoint to view latest health log entries."""
+    entries = get_health_entries()
+    if not entries:
+        return "No health entries yet.", 404
+    return "".join(reversed(entries)), 200
+
+
+@app.route("/logs/<name>")
+async def get_log_file(name):
+    """Endpoint to read a log file without loading all of it.
+
+    By default returns the last `lines` lines. With `cursor`, returns up to
+    `limit` bytes from that byte offset instead. Either can be filtered by
+    minimum `level` and by a `since`/`until` time window. With `follow=true`,
+    streams new lines as they are written, starting from `cursor` if given."""
+    if not LOG_FILE_PATTERN.match(name):
+        return "Unknown log file.", 404
+    args = request.args
     try:
-        with open(HEALTH_LOG_FILE, "r") as file:
-            logs = file.read()
-        return logs, 200
+        min_level = None
+        if "level" in args:
+            min_level = logging.getLevelName(args["level"].upper())
+            if not isinstance(min_level, int):
+                raise ValueError(f"Unknown level {args['level']}")
+        since = datetime.fromisoformat(args["since"]) if "since" in args else None
+        until = datetime.fromisoformat(args["until"]) if "until" in args else None
+        cursor = int(args["cursor"]) if "cursor" in args else None
+        if cursor is not None and cursor < 0:
+            raise ValueError("cursor must not be negative")
+        limit = min(int(args.get("limit", 65536)), MAX_PAGE_BYTES)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        line_count = min(int(args.get("lines", 100)), MAX_TAIL_LINES)
+        if line_count < 0:
+            raise ValueError("lines must not be negative")
+    except ValueError as e:
+        return f"Invalid parameter: {e}", 400
+    line_filter = LineFilter(min_level, since, until)
+
+    try:
+        if args.get("follow") == "true":
+            if cursor is None:
+                _, cursor = await asyncio.to_thread(tail_lines, name, 0)
+
+            async def stream():
+                async for line in follow_lines(name, cursor):
+                    if line_filter([line]):
+                        yield line.encode()
+
+            response = Response(stream(), mimetype="text/plain")
+            response.timeout = None  # Stream until the client disconnects
+            return response
+
+        if cursor is not None:
+            lines, next_cursor = await asyncio.to_thread(read_page, name, cursor, limit)
+        else:
+            lines, next_cursor = await asyncio.to_thread(tail_lines, name, line_count)
     except FileNotFoundError:
         return "Log file not found.", 404
 
+    body = {
+        "lines": line_filter(lines),
+        "next_cursor": next_cursor,
+    }
+    return json.dumps(body), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/history")
+async def get_history():
+    """Endpoint to query recorded activity: controller poll results, state
+    transitions and power actions.
+
+    Returns events between `since` and `until` (ISO times, by default the last
+    day), oldest first, optionally only those of one `zone` or `kind`."""
+    args = request.args
+    try:
+        until = datetime.fromisoformat(args["until"]) if "until" in args else datetime.now()
+        since = (
+            datetime.fromisoformat(args["since"])
+            if "since" in args
+            else until - timedelta(days=1)
+        )
+        limit = min(int(args.get("limit", 1000)), MAX_QUERY_EVENTS)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return f"Invalid parameter: {e}", 400
+
+    events = await asyncio.to_thread(
+        query_events,
+        since.timestamp(),
+        until.timestamp(),
+        zone=args.get("zone"),
+        kind=args.get("kind"),
+        limit=limit,
+    )
+    for event in events:
+        event["time"] = datetime.fromtimestamp(event["time"]).isoformat()
+    return json.dumps({"events": events}), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/circuits")
+async def get_circuits():
+    """Endpoint for the circuit breaker state of each controller and plug:
+    closed when healthy, open while skipped, half_open while being probed."""
+    body = get_system_state().circuit_states()
+    return json.dumps(body), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/energy")
+async def get_energy():
+    """Endpoint for the latest power draw in watts of each sampled plug."""
+    histories = get_energy_monitor().histories
+    body = {name: history.latest() for name, history in histories.items()}
+    return json.dumps(body), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/energy/<plug>")
+async def get_plug_energy(plug: str):
+    """Endpoint for the power readings of one plug.
+
+    Returns [time, mean, min, max] readings at the given `resolution` (second,
+    minute or hour), optionally only those `since` an ISO time."""
+    history = get_energy_monitor().histories.get(plug)
+    if history is None:
+        return "Plug not found", 404
+    # Imported here since numpy is only needed when sampling is enabled
+    from src.utils.energy import RESOLUTIONS
+
+    resolution = request.args.get("resolution", "minute")
+    if resolution not in RESOLUTIONS:
+        return f"Invalid resolution: {resolution}", 400
+    try:
+        since = (
+            datetime.fromisoformat(request.args["since"]).timestamp()
+            if "since" in request.args
+            else 0
+        )
+    except ValueError as e:
+        return f"Invalid parameter: {e}", 400
+
+    readings = history.query(resolution, since)
+    for reading in readings:
+        reading[0] = datetime.fromtimestamp(reading[0]).isoformat()
+    body = {"resolution": resolution, "readings": readings}
+    return json.dumps(body), 200, {"Content-Type": "application/json"}
+
 
 @app.route("/", methods=["GET", "POST"])
 async def control_speakers():
     """Main page of app, giving visibility into current state and
     allowing for control of the speakers."""
-    if not spotify_controller.access_token:
+    system_state = get_system_state()
+    if not get_spotify_accounts().access_token:
         return await render_template(
             "control_speakers.html",
             message="Please authorize with Spotify to control the speakers.",
@@ -85,19 +271,59 @@ async def control_speakers():
             status_message=status_message,
         )
 
-    status_message = await system_state.get_status_message()
+    # Open dashboards are kept up to date by /status/stream, so only query the
+    # plug if the monitor hasn't learned its state yet
+    if system_state.speakers_on is None:
+        status_message = await system_state.get_status_message()
+    else:
+        status_message = system_state.describe()
     return await render_template("control_speakers.html", status_message=status_message)
 
 
+@app.route("/status/stream")
+async def status_stream():
+    """Endpoint streaming status messages as server-sent events.
+
+    Sends the current status on connect and then each change published by the
+    monitor, so open dashboards cost no device I/O."""
+
+    async def stream():
+        async for message in get_system_state().subscribe():
+            yield f"data: {message}\n\n".encode()
+
+    response = Response(
+        stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+    response.timeout = None  # Stream until the client disconnects
+    return response
+
+
 @app.before_serving
 async def before_serving():
     """Initiates monitoring task before API is available"""
+    global _monitor_task
     # start monitoring speakers
-    asyncio.create_task(monitor_and_control_speakers(system_state))
+    _monitor_task = asyncio.create_task(
+        monitor_and_control_speakers(get_system_state())
+    )
+
+
+@app.after_serving
+async def after_serving():
+    """Stops the monitor, along with its background tasks such as TV
+    notifications, then closes pooled connections and stops audio capture once
+    the API stops serving"""
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        await asyncio.gather(_monitor_task, return_exceptions=True)
+    await close_http_session()
+    await disconnect_plugs()
+    stop_audio_capture()
 
 
 def main():
     """Starts app."""
+    start_up()
     app.run(host="0.0.0.0", port=8888)
 
 
@@ -0,0 +1,275 @@
+import logging
+import os
+import stat
+import subprocess
+import threading
+import time
+import wave
+from typing import BinaryIO, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.controllers.controller_interface import Controller
+
+# Capture format used for ALSA devices and raw PCM files: 16-bit mono. A low rate
+# is plenty to tell music from silence and keeps the CPU cost small on a Pi.
+SAMPLE_RATE = 8000
+
+# Audio is measured in chunks of this length, and the level averaged over a window
+# of them. With the defaults the buffers take about 5 KB, however long it runs.
+CHUNK_SECONDS = 0.1
+WINDOW_SECONDS = 5.0
+
+# Level in dBFS above which something is considered to be playing. Silence through
+# a mixer is usually around -70 dBFS and quiet music above -40 dBFS.
+DEFAULT_THRESHOLD_DB = -50.0
+
+# Least time between restarts of a capture that ended, e.g. a FIFO being closed
+RESTART_SECONDS = 30.0
+
+
+class LevelMeter:
+    """Windowed RMS level of 16-bit PCM audio, measured in fixed-size chunks.
+
+    The chunk buffer, the samples viewing it and the per-chunk energies are all
+    allocated once, so measuring a chunk neither copies the audio nor allocates."""
+
+    def __init__(self, chunk_samples: int, window_chunks: int):
+        self.buffer = bytearray(chunk_samples * 2)
+        # A view of the buffer, so reading into it updates the samples in place
+        self.samples = np.frombuffer(self.buffer, dtype="<i2")
+        self._scaled = np.empty(chunk_samples, dtype=np.float32)
+        self._energies = np.zeros(window_chunks, dtype=np.float32)
+        self._next = 0
+        self.chunks = 0
+
+    def measure(self) -> None:
+        """Adds the mean square of the samples in the buffer to the window."""
+        np.multiply(self.samples, 1 / 32768, out=self._scaled)
+        self._energies[self._next] = np.dot(self._scaled, self._scaled) / len(self._scaled)
+        self._next = (self._next + 1) % len(self._energies)
+        self.chunks += 1
+
+    @property
+    def level_db(self) -> Optional[float]:
+        """RMS level over the window in dBFS, or None before the first chunk."""
+        filled = min(self.chunks, len(self._energies))
+        if not filled:
+            return None
+        energy = float(self._energies[:filled].mean())
+        return 10 * float(np.log10(max(energy, 1e-10)))
+
+
+class AudioCapture:
+    """
+    Reads an audio input in the background and measures its level.
+
+    One capture is shared by everything using the same source, e.g. zones
+    listening to the same input with their own thresholds, since a capture
+    device can only be opened once. Audio is read from an ALSA capture device
+    through `arecord`, or from a file: a FIFO or WAV file, e.g. for tests. Raw
+    files and FIFOs must hold 16-bit PCM at `sample_rate`.
+
+    Attributes:
+        source (str): An ALSA device such as "plughw:1,0", or a path to a file.
+        window_seconds (float): How long the level is averaged over.
+        sample_rate (int): Samples per second of the captured audio.
+        chunk_seconds (float): Length of each chunk read and measured at once.
+    """
+
+    _instances: Dict[str, "AudioCapture"] = {}
+
+    def __new__(
+        cls,
+        source,
+        window_seconds=WINDOW_SECONDS,
+        sample_rate=SAMPLE_RATE,
+        chunk_seconds=CHUNK_SECONDS,
+    ):
+        if source not in cls._instances:
+            cls._instances[source] = super().__new__(cls)
+            cls._instances[source].__init__(
+                source, window_seconds, sample_rate, chunk_seconds
+            )
+        return cls._instances[source]
+
+    def __init__(
+        self,
+        source: str,
+        window_seconds: float = WINDOW_SECONDS,
+        sample_rate: int = SAMPLE_RATE,
+        chunk_seconds: float = CHUNK_SECONDS,
+    ):
+        if hasattr(self, "initialized"):
+            return
+        self.source = source
+        self.window_seconds = window_seconds
+        self.sample_rate = sample_rate
+        self.chunk_seconds = chunk_seconds
+        self.meter: Optional[LevelMeter] = None
+        self.last_chunk_at: Optional[float] = None
+        self._reader: Optional[threading.Thread] = None
+        self._process: Optional[subprocess.Popen] = None
+        self._started_at = 0.0
+        self._stopped = False
+        self.initialized = True
+
+    @property
+    def is_device(self) -> bool:
+        """Whether the source is an ALSA device rather than a file."""
+        return not os.path.exists(self.source) and "/" not in self.source
+
+    @property
+    def level_db(self) -> Optional[float]:
+        """Level over the window in dBFS, or None while no audio is arriving."""
+        if (
+            self.meter is None
+            or self.last_chunk_at is None
+            or time.monotonic() - self.last_chunk_at > self.window_seconds
+        ):
+            return None
+        return self.meter.level_db
+
+    def start(self) -> None:
+        """Starts capturing in the background, unless it already is. Devices and
+        FIFOs are restarted if they stop, while regular files are read once."""
+        if self._reader is not None:
+            if self._reader.is_alive() or not self._can_restart():
+                return
+        self._stopped = False
+        self._started_at = time.monotonic()
+        self._reader = threading.Thread(
+            target=self._read, name=f"AudioCapture {self.source}", daemon=True
+        )
+        self._reader.start()
+
+    def stop(self) -> None:
+        """Stops capturing, e.g. when shutting down."""
+        self._stopped = True
+        process = self._process
+        if process is not None:
+            process.terminate()
+
+    def _can_restart(self) -> bool:
+        if self._stopped or time.monotonic() - self._started_at < RESTART_SECONDS:
+            return False
+        if self.is_device:
+            return True
+        try:
+            return stat.S_ISFIFO(os.stat(self.source).st_mode)
+        except OSError:
+            return False
+
+    def _open(self) -> Tuple[BinaryIO, int]:
+        """Opens the audio stream, positioned at the first sample, and returns it
+        with the number of samples per second."""
+        if self.is_device:
+            self._process = subprocess.Popen(
+                [
+                    "arecord", "-q", "-D", self.source, "-t", "raw", "-f", "S16_LE",
+                    "-c", "1", "-r", str(self.sample_rate),
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            return self._process.stdout, self.sample_rate  # type: ignore
+        file = open(self.source, "rb")
+        if file.peek(4)[:4] != b"RIFF":
+            return file, self.sample_rate
+        wav = wave.open(file)
+        if wav.getsampwidth() != 2:
+            file.close()
+            raise ValueError(f"{self.source} is not 16-bit PCM")
+        # Interleaved channels are measured together, as one stream of samples
+        return file, wav.getframerate() * wav.getnchannels()
+
+    def _read(self) -> None:
+        try:
+            stream, samples_per_second = self._open()
+        except (OSError, ValueError, wave.Error) as e:
+            logging.error("Unable to capture audio from %s: %s", self.source, e)
+            return
+        chunk_samples = max(int(samples_per_second * self.chunk_seconds), 1)
+        window_chunks = max(round(self.window_seconds / self.chunk_seconds), 1)
+        meter = self.meter = LevelMeter(chunk_samples, window_chunks)
+        view = memoryview(meter.buffer)
+        logging.info("Capturing audio levels from %s.", self.source)
+        try:
+            with stream:
+                while not self._stopped and self._read_chunk(stream, view):
+                    meter.measure()
+                    self.last_chunk_at = time.monotonic()
+        except OSError as e:
+            logging.error("Audio capture from %s failed: %s", self.source, e)
+        finally:
+            if self._process is not None:
+                self._process.terminate()
+                self._process.wait()
+                self._process = None
+        logging.info("Audio capture from %s ended.", self.source)
+
+    @staticmethod
+    def _read_chunk(stream: BinaryIO, view: memoryview) -> bool:
+        """Fills the chunk buffer, returning False once the stream has ended."""
+        filled = 0
+        while filled < len(view):
+            read = stream.readinto(view[filled:])
+            if not read:
+                return False
+            filled += read
+        return True
+
+
+class AudioLevelController(Controller):
+    """
+    Detects playback from analog sources, e.g. a record player, by the level of
+    the audio reaching the mixer.
+
+    The controller is active while the level of its `source` over the capture's
+    window is at or above `threshold_db`.
+
+    Attributes:
+        source (str): An ALSA device such as "plughw:1,0", or a path to a file.
+        name (str): The name of the controller.
+        threshold_db (float): Level in dBFS that counts as playing.
+        capture (AudioCapture): The capture of the source, shared with any other
+            controller of the same source.
+    """
+
+    POLL_TIMEOUT_SECONDS = 1.0
+    KIND = "Audio"
+
+    def __init__(
+        self,
+        source: str,
+        name: str = "Audio",
+        threshold_db: float = DEFAULT_THRESHOLD_DB,
+        window_seconds: float = WINDOW_SECONDS,
+        sample_rate: int = SAMPLE_RATE,
+        chunk_seconds: float = CHUNK_SECONDS,
+    ):
+        self.source = source
+        self.name = name
+        self.threshold_db = threshold_db
+        self.capture = AudioCapture(source, window_seconds, sample_rate, chunk_seconds)
+
+    @property
+    def NAME(self) -> str:
+        return self.name
+
+    async def is_active(self) -> bool:
+        """Determines whether the audio level is above the threshold. Starts
+        capturing on first use, and reports inactive until there is enough audio."""
+        self.capture.start()
+        level = self.capture.level_db
+        return level is not None and level >= self.threshold_db
+
+    def stop(self) -> None:
+        """Stops capturing, e.g. when shutting down."""
+        self.capture.stop()
+
+
+def stop_audio_captures() -> None:
+    """Stops capturing every audio input."""
+    for capture in AudioCapture._instances.values():
+        capture.stop()
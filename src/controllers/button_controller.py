@@ -1,62 +1,92 @@
 import asyncio
 import logging
+import time
+from typing import Optional
+
 import RPi.GPIO as GPIO  # type: ignore
 
 from src.controllers.singleton_base import SingletonMeta
-from src.controllers.smart_plug_controller import SmartPlugController
-from src.controllers.utils.instances import get_playback_counter
+from src.controllers.utils.instances import (
+    get_playback_counter,
+    get_power_state_machine,
+)
+from src.utils.history import record_event
+from src.utils.metrics import BUTTON_PRESS_SECONDS, BUTTON_PRESSES
+
+# Presses closer together than this are treated as the same press
+DEBOUNCE_SECONDS = 1.0
 
 
 class ButtonController(metaclass=SingletonMeta):
-    def __init__(
-        self,
-        speakers_controller: SmartPlugController,
-        mixer_controller: SmartPlugController,
-        pin: int = 2,
-    ):
-        self.speakers_controller = speakers_controller
-        self.mixer_controller = mixer_controller
+    """Toggles the speakers when the physical button is pressed.
+
+    GPIO callbacks run on their own thread, so presses are handed to the main
+    event loop, where they are handled one at a time alongside the monitor."""
+
+    def __init__(self, pin: int = 2, debounce_seconds: float = DEBOUNCE_SECONDS):
         self.pin = pin
+        self.debounce_seconds = debounce_seconds
+        self._last_press_at = float("-inf")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._presses: Optional["asyncio.Queue[float]"] = None
         self.setup_gpio()
 
     def setup_gpio(self):
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+        # Debounced in button_callback, which can tell presses apart more finely
         GPIO.add_event_detect(
-            self.pin, GPIO.RISING, callback=self.button_callback, bouncetime=5000
+            self.pin, GPIO.RISING, callback=self.button_callback, bouncetime=50
         )
 
+    def start(self) -> "asyncio.Task[None]":
+        """Starts handling presses on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._presses = asyncio.Queue()
+        return asyncio.create_task(self._handle_presses())
+
     def button_callback(self, channel):
-        """Callback function that runs when the button is pressed"""
+        """Callback function that runs on the GPIO thread when the button is pressed"""
+        pressed_at = time.perf_counter()
+        if pressed_at - self._last_press_at < self.debounce_seconds:
+            BUTTON_PRESSES.inc("ignored")
+            return
+        self._last_press_at = pressed_at
         logging.info("Button pressed.")
 
-        # Reset the playback counter when the button is pressed
-        playback_counter = get_playback_counter()
-        playback_counter.reset()
+        if self._loop is None or self._presses is None:
+            logging.warning("Button pressed before monitoring started, so ignoring it.")
+            return
+        self._loop.call_soon_threadsafe(self._presses.put_nowait, pressed_at)
+
+    async def _handle_presses(self) -> None:
+        assert self._presses is not None
+        while True:
+            pressed_at = await self._presses.get()
+            BUTTON_PRESSES.inc("handled")
 
-        # Create a new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+            # Reset the playback counter when the button is pressed
+            playback_counter = get_playback_counter()
+            playback_counter.reset()
 
-        # Run the coroutine in the event loop
-        loop.run_until_complete(self.toggle_speakers())
+            await self.toggle_speakers()
+            BUTTON_PRESS_SECONDS.observe(time.perf_counter() - pressed_at)
 
     def read_button_state(self):
         logging.info(f"The button value is {GPIO.input(self.pin)}")
-        print(f"For Shree, the button value is {GPIO.input(self.pin)}")
 
     async def toggle_speakers(self):
         """Toggles the state of the speakers.
 
-        Speakers must turn off before mixer, but mixer must turn on before speakers."""
+        Runs the same power sequence as the monitor loop, holding the power
+        state machine's lock, so it never switches the plugs at the same time."""
+        power_state_machine = get_power_state_machine()
         try:
-            is_on = await self.speakers_controller.is_on()
-
-            if is_on:
-                await self.speakers_controller.turn_off()
-                logging.info("Speakers turned off manually.")
-            else:
-                await self.mixer_controller.turn_on()
+            if await power_state_machine.toggle():
                 logging.info("Speakers turned on manually.")
+                record_event("Main", "power", "button", "on")
+            else:
+                logging.info("Speakers turned off manually.")
+                record_event("Main", "power", "button", "off")
         except Exception as e:
             logging.error("Unable to check state of speakers, so ignoring button press")
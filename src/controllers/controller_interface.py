@@ -4,6 +4,12 @@ from src.controllers.singleton_base import SingletonMeta
 
 
 class Controller(ABC, metaclass=SingletonMeta):
+    # Deadline for a single is_active() check when polling concurrently
+    POLL_TIMEOUT_SECONDS: float = 10.0
+    # The type of device, e.g. "TV", by which settings such as poll intervals
+    # apply to every controller of that type whatever its name
+    KIND: str = ""
+
     @property
     @abstractmethod
     def NAME(self) -> str:
@@ -2,9 +2,13 @@ from abc import ABCMeta
 
 
 class SingletonMeta(ABCMeta):
+    """Returns the same instance for the same class and constructor arguments, so
+    that e.g. each TV gets one controller however many zones it is used in."""
+
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
-        return cls._instances[cls]
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        if key not in cls._instances:
+            cls._instances[key] = super().__call__(*args, **kwargs)
+        return cls._instances[key]
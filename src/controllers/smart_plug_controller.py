@@ -1,61 +1,245 @@
-from kasa import SmartPlug
+import asyncio
 import logging
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.utils.clock import SYSTEM_CLOCK, Clock
+from src.utils.concurrency import device_io_slot
+from src.utils.metrics import PLUG_COMMAND_SECONDS
+
+if TYPE_CHECKING:
+    from kasa import SmartPlug
+
+# How long a known plug state can be reused before querying the plug again
+DEFAULT_STATE_TTL_SECONDS = 5.0
 
 
 class SmartPlugController:
     _instances = {}
 
-    def __new__(cls, ip_address, name):
+    def __new__(
+        cls,
+        ip_address,
+        name,
+        state_ttl_seconds=DEFAULT_STATE_TTL_SECONDS,
+        clock=SYSTEM_CLOCK,
+    ):
         key = (name, ip_address)
         if key not in cls._instances:
             cls._instances[key] = super().__new__(cls)
-            cls._instances[key].__init__(ip_address, name)
+            cls._instances[key].__init__(ip_address, name, state_ttl_seconds, clock)
         return cls._instances[key]
 
-    def __init__(self, ip_address, name: str):
+    def __init__(
+        self,
+        ip_address,
+        name: str,
+        state_ttl_seconds: float = DEFAULT_STATE_TTL_SECONDS,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
         if hasattr(self, "initialized"):
             return
         self.ip_address = ip_address
-        self.plug = SmartPlug(ip_address)
+        self._plug: Optional["SmartPlug"] = None
         self.name = name
+        self.state_ttl_seconds = state_ttl_seconds
+        self.clock = clock
+        # Skips the plug for a while once it keeps failing
+        self.breaker = CircuitBreaker(f"plug:{name}", clock=clock)
+        self._state: Optional[bool] = None
+        self._state_updated_at = 0.0
+        self._update_task: Optional[asyncio.Task] = None
         self.initialized = True
 
-    async def turn_off(self):
+    @property
+    def plug(self) -> "SmartPlug":
+        """The Kasa device, created on first use so that importing python-kasa,
+        which is slow, doesn't delay startup."""
+        if self._plug is None:
+            from kasa import DeviceConfig, SmartPlug
+
+            # The address may include a port, e.g. for a local plug simulator
+            host, _, port = str(self.ip_address).partition(":")
+            if port:
+                self._plug = SmartPlug(
+                    host, config=DeviceConfig(host, port_override=int(port))
+                )
+            else:
+                self._plug = SmartPlug(self.ip_address)
+        return self._plug
+
+    @plug.setter
+    def plug(self, plug: "SmartPlug") -> None:
+        self._plug = plug
+
+    def _set_state(self, is_on: Optional[bool]) -> None:
+        """Records the latest known state of the plug."""
+        self._state = is_on
+        self._state_updated_at = self.clock.monotonic()
+
+    @property
+    def known_state(self) -> Optional[bool]:
+        """The last known state of the plug, however old, or None if unknown."""
+        return self._state
+
+    def invalidate(self) -> None:
+        """Forgets the cached state so the next check queries the plug."""
+        self._state = None
+
+    def _is_cache_valid(self) -> bool:
+        return (
+            self._state is not None
+            and self.clock.monotonic() - self._state_updated_at < self.state_ttl_seconds
+        )
+
+    async def _query_plug(self) -> bool:
         try:
-            await self.plug.update()
-            logging.debug(f"Plug {self.name} status: {self.plug.is_on}")
-            if self.plug.is_on:
-                await self.plug.turn_off()
+            # The plug keeps its connection open between queries
+            async with device_io_slot():
+                with PLUG_COMMAND_SECONDS.time(self.name, "update"):
+                    await self.plug.update()
+            self._set_state(self.plug.is_on)
+            self.breaker.record_success()
+            return self.plug.is_on
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            self.invalidate()
+            await self.disconnect()
+            raise
+        finally:
+            if self._update_task is asyncio.current_task():
+                self._update_task = None
+
+    async def _get_state(self, fresh: bool = False) -> bool:
+        """Returns the plug state, reusing the cached state unless `fresh` is set.
+
+        Concurrent queries to the same plug share a single in-flight request.
+        Raises CircuitOpenError instead of querying a plug that keeps failing."""
+        if not fresh and self._is_cache_valid():
+            logging.debug(f"Using cached state of plug {self.name}: {self._state}")
+            return self._state  # type: ignore
+
+        loop = asyncio.get_running_loop()
+        task = self._update_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(self.name)
+            task = self._update_task = loop.create_task(self._query_plug())
+        # Shield so one caller being cancelled doesn't cancel the shared query
+        return await asyncio.shield(task)
+
+    async def disconnect(self) -> None:
+        """Closes the connection to the plug. The next query reconnects."""
+        if self._plug is None:
+            return  # Never connected
+        try:
+            await self.plug.disconnect()
+        except Exception as e:
+            logging.debug(f"Error while disconnecting from {self.name}: {e}")
+
+    async def turn_off(self, fresh: bool = False) -> bool:
+        """Turns off the plug. Returns whether it had to be switched."""
+        try:
+            is_on = await self._get_state(fresh)
+            logging.debug(f"Plug {self.name} status: {is_on}")
+            if is_on:
+                async with device_io_slot():
+                    with PLUG_COMMAND_SECONDS.time(self.name, "turn_off"):
+                        await self.plug.turn_off()
+                self._set_state(False)
                 logging.info(f"Plug {self.name} turned off.")
-            else:
-                logging.debug(f"Plug {self.name} are already off.")
+                return True
+            logging.debug(f"Plug {self.name} are already off.")
         except Exception as e:
-            logging.error(f"An error occurred while turning off {self.name}: {e}")
-            logging.error("Ensure the Kasa plug is online and accessible.")
-            logging.error(f"Attempted to connect to IP: {self.ip_address}")
+            self._log_error("turning off", e)
+        return False
 
-    async def turn_on(self):
+    async def turn_on(self, fresh: bool = False) -> bool:
+        """Turns on the plug. Returns whether it had to be switched."""
         try:
-            await self.plug.update()
-            logging.debug(f"Plug status: {self.plug.is_on}")
-            if self.plug.is_on:
+            is_on = await self._get_state(fresh)
+            logging.debug(f"Plug status: {is_on}")
+            if is_on:
                 logging.debug(f"Plug {self.name} is already on.")
             else:
-                await self.plug.turn_on()
+                async with device_io_slot():
+                    with PLUG_COMMAND_SECONDS.time(self.name, "turn_on"):
+                        await self.plug.turn_on()
+                self._set_state(True)
                 logging.info(f"Plug {self.name} turned on.")
+                return True
         except Exception as e:
-            logging.error(f"An error occurred while turning on {self.name}: {e}")
-            logging.error("Ensure the Kasa plug is online and accessible.")
-            logging.error(f"Attempted to connect to IP: {self.ip_address}")
+            self._log_error("turning on", e)
+        return False
+
+    async def read_power(self) -> Optional[float]:
+        """Reads the current power draw in watts, or None if the plug has no
+        energy meter."""
+        from kasa import Module
 
-    async def is_on(self) -> bool:
+        # Modules are only known once the plug has been queried, usually from cache
+        await self._get_state()
+        energy = self.plug.modules.get(Module.Energy)
+        if energy is None:
+            return None
+        async with device_io_slot():
+            with PLUG_COMMAND_SECONDS.time(self.name, "read_power"):
+                status = await energy.get_status()
+        return status.power
+
+    async def is_on(self, fresh: bool = False) -> bool:
+        """Checks whether the plug is on. Set `fresh` to bypass the cached state."""
         logging.debug(f"Checking state of the plug {self.name}")
         try:
-            await self.plug.update()
-            logging.debug(f"Speaker state came back as {self.plug.is_on}")
-            return self.plug.is_on
+            is_on = await self._get_state(fresh)
+            logging.debug(f"Speaker state came back as {is_on}")
+            return is_on
         except Exception as e:
-            logging.error(f"An error occurred while checking state: {e}")
-            logging.error("Ensure the Kasa plug is online and accessible.")
-            logging.error(f"Attempted to connect to IP: {self.ip_address}")
+            self._log_error("checking the state of", e)
             raise e
+
+    def _log_error(self, action: str, error: Exception) -> None:
+        """Logs a failed command in one line. Plugs skipped by their circuit
+        breaker were already reported when it opened, so they are only debug logs."""
+        self.invalidate()
+        if isinstance(error, CircuitOpenError):
+            logging.debug(str(error))
+            return
+        logging.error(
+            f"An error occurred while {action} {self.name} at {self.ip_address}: "
+            f"{error}. Ensure the Kasa plug is online and accessible."
+        )
+
+
+async def query_plugs(
+    controllers: List[SmartPlugController], fresh: bool = False
+) -> Dict[str, Optional[bool]]:
+    """Fetches the state of every plug concurrently in one step.
+
+    Returns the state of each plug by name, or None for plugs that could not be
+    reached. The results are cached like any other query."""
+    results = await asyncio.gather(
+        *(controller._get_state(fresh) for controller in controllers),
+        return_exceptions=True,
+    )
+    states: Dict[str, Optional[bool]] = {}
+    for controller, result in zip(controllers, results):
+        if isinstance(result, CircuitOpenError):
+            logging.debug(str(result))
+            states[controller.name] = None
+        elif isinstance(result, BaseException):
+            logging.error(f"Unable to query plug {controller.name}: {result}")
+            states[controller.name] = None
+        else:
+            states[controller.name] = result
+    return states
+
+
+async def disconnect_plugs() -> None:
+    """Closes the connections to every plug."""
+    await asyncio.gather(
+        *(controller.disconnect() for controller in SmartPlugController._instances.values())
+    )
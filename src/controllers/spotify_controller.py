@@ -1,35 +1,80 @@
+import asyncio
 import base64
 import logging
 import time
+from typing import TYPE_CHECKING, List, Optional
+from urllib.parse import urlencode
 
-import requests
-from quart import Response, redirect
+import aiohttp
 from tenacity import *
 
 from src.controllers.controller_interface import Controller
+from src.utils.http_client import get_http_session
+from src.utils.logging import write_file_atomically
+from src.utils.metrics import TOKEN_REFRESH_SECONDS, TOKEN_REFRESHES
+from src.utils.rate_limiter import RequestBudget
+
+if TYPE_CHECKING:
+    from quart import Response
+
+# Access tokens are refreshed this long before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = 300.0
+
+# Time to wait before trying again when a refresh failed despite its retries
+TOKEN_RETRY_SECONDS = 30.0
 
 
 class SpotifyController(Controller):
+    """Polls the playback state of one Spotify account and manages its tokens.
+
+    Each account has its own token file, e.g. spotify_token_alice.txt for the
+    account "alice". The unnamed account keeps using spotify_token.txt."""
+
+    KIND = "Spotify"
+
     def __init__(
-        self, client_id, client_secret, redirect_uri, token_file="spotify_token.txt"
+        self,
+        client_id,
+        client_secret,
+        redirect_uri,
+        token_file=None,
+        max_requests=20,
+        window_seconds=30.0,
+        account="",
     ):
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
-        self.token_file = token_file
+        self.account = account
+        self.token_file = token_file or (
+            f"spotify_token_{account}.txt" if account else "spotify_token.txt"
+        )
         self.token_url = "https://accounts.spotify.com/api/token"
         self.auth_url = "https://accounts.spotify.com/authorize"
+        self.player_url = "https://api.spotify.com/v1/me/player"
         self.access_token = None
         self.refresh_token = None
         self.expires_in = None
         self.token_issued_at = None  # New attribute to track token issue time
 
+        # Spotify rate limits per app, so the budget is shared per client ID by
+        # every account
+        self.request_budget = RequestBudget(
+            f"spotify:{client_id}", max_requests, window_seconds
+        )
+        self.is_playing = False  # Last known playback state
+        self.player_etag = None  # For conditional requests to the player endpoint
+
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._token_manager_task: Optional[asyncio.Task] = None
+        self._token_changed: Optional[asyncio.Event] = None
+
         # Load the saved tokens if available
         self.load_tokens()
 
     @property
     def NAME(self) -> str:
-        return "Spotify"
+        return f"Spotify ({self.account})" if self.account else "Spotify"
 
     def load_tokens(self) -> None:
         """Loads Spotify tokens from token file, if it exists"""
@@ -47,36 +92,43 @@ class SpotifyController(Controller):
                         self.token_issued_at = float(line.strip().split("=")[1])
 
         except FileNotFoundError:
-            logging.warning("Token file not found, Spotify authentication required.")
+            logging.warning(
+                "Token file %s not found, Spotify authentication required.",
+                self.token_file,
+            )
 
     def get_authorization_url(self):
-        """Generate the Spotify authorization URL."""
-        return (
-            f"https://accounts.spotify.com/authorize"
-            f"?client_id={self.client_id}"
-            f"&response_type=code"
-            f"&redirect_uri={self.redirect_uri}"
-            f"&scope=user-read-playback-state"
+        """Generate the Spotify authorization URL. The account is passed back to
+        the callback as its state, so each account can be authorized in turn."""
+        query = urlencode(
+            {
+                "client_id": self.client_id,
+                "response_type": "code",
+                "redirect_uri": self.redirect_uri,
+                "scope": "user-read-playback-state",
+                "state": self.account,
+            }
         )
+        return f"https://accounts.spotify.com/authorize?{query}"
 
     def save_tokens(self) -> None:
-        with open(self.token_file, "w") as file:
-            file.write(f"access_token={self.access_token}\n")
-            file.write(f"refresh_token={self.refresh_token}\n")
-            file.write(f"expires_in={self.expires_in}\n")
-            file.write(f"token_issued_at={self.token_issued_at}\n")
-
-    def authorize(self) -> Response:
-        auth_url = (
-            f"{self.auth_url}"
-            f"?client_id={self.client_id}"
-            f"&response_type=code"
-            f"&redirect_uri={self.redirect_uri}"
-            f"&scope=user-read-playback-state"
+        """Saves the tokens to the token file, replacing it in one step so a crash
+        never leaves it half written."""
+        write_file_atomically(
+            self.token_file,
+            f"access_token={self.access_token}\n"
+            f"refresh_token={self.refresh_token}\n"
+            f"expires_in={self.expires_in}\n"
+            f"token_issued_at={self.token_issued_at}\n",
         )
-        return redirect(auth_url)
 
-    def get_access_token(self, auth_code: str) -> str:
+    def authorize(self) -> "Response":
+        # Only the web app authorizes, so the monitor doesn't need to import Quart
+        from quart import redirect
+
+        return redirect(self.get_authorization_url())
+
+    async def get_access_token(self, auth_code: str) -> str:
         headers = {
             "Authorization": "Basic "
             + base64.b64encode(
@@ -88,15 +140,17 @@ class SpotifyController(Controller):
             "code": auth_code,
             "redirect_uri": self.redirect_uri,
         }
-        response = requests.post(self.token_url, headers=headers, data=data)
-        response_data = response.json()
+        session = get_http_session()
+        async with session.post(self.token_url, headers=headers, data=data) as response:
+            response_data = await response.json()
         self.access_token = response_data.get("access_token")
         self.refresh_token = response_data.get("refresh_token")
         self.expires_in = response_data.get("expires_in")
         self.token_issued_at = time.time()
 
         # Save tokens to file
-        self.save_tokens()
+        await asyncio.to_thread(self.save_tokens)
+        self._wake_token_manager()
         return self.access_token
 
     @retry(
@@ -104,7 +158,9 @@ class SpotifyController(Controller):
         wait=wait_exponential(
             multiplier=2, min=1, max=10
         ),  # Exponential backoff (2^x seconds)
-        retry=retry_if_exception_type(requests.HTTPError),  # Retry only for HTTP errors
+        retry=retry_if_exception_type(
+            aiohttp.ClientResponseError
+        ),  # Retry only for HTTP errors
         reraise=True,  # Reraise the exception if retries fail
         before=before_log(logging.getLogger("SpotifyController"), logging.INFO),
         after=after_log(logging.getLogger("SpotifyController"), logging.INFO),
@@ -126,10 +182,19 @@ class SpotifyController(Controller):
             "refresh_token": self.refresh_token,
         }
 
-        response = requests.post(self.token_url, headers=headers, data=data)
-        response.raise_for_status()  # Raise HTTPError for bad responses
+        session = get_http_session()
+        with TOKEN_REFRESH_SECONDS.time():
+            try:
+                async with session.post(
+                    self.token_url, headers=headers, data=data
+                ) as response:
+                    response.raise_for_status()  # Raise ClientResponseError for bad responses
+                    response_data = await response.json()
+            except Exception:
+                TOKEN_REFRESHES.inc("failure")
+                raise
+        TOKEN_REFRESHES.inc("success")
 
-        response_data = response.json()
         self.access_token = response_data.get("access_token")
         # Keep old refresh token if missing
         self.refresh_token = response_data.get("refresh_token", self.refresh_token)
@@ -137,29 +202,204 @@ class SpotifyController(Controller):
         self.token_issued_at = time.time()
 
         # Save the new access token
-        self.save_tokens()
+        await asyncio.to_thread(self.save_tokens)
         logging.info("Access token refreshed successfully.")
 
-    def should_refresh_token(self) -> bool:
-        """Check if the access token has expired."""
+    def _token_expires_at(self) -> Optional[float]:
         if not self.token_issued_at or not self.expires_in:
-            return True
-        return time.time() > (
-            float(self.token_issued_at) + float(self.expires_in) - 300.0
+            return None
+        return float(self.token_issued_at) + float(self.expires_in)
+
+    def _token_refresh_at(self) -> Optional[float]:
+        expires_at = self._token_expires_at()
+        if expires_at is None:
+            return None
+        # Short-lived tokens are refreshed halfway through their lifetime
+        return expires_at - min(TOKEN_REFRESH_MARGIN_SECONDS, float(self.expires_in) / 2)
+
+    def is_token_valid(self) -> bool:
+        """Check if the access token can be used as it is."""
+        expires_at = self._token_expires_at()
+        return (
+            bool(self.access_token)
+            and expires_at is not None
+            and time.time() < expires_at
         )
 
+    def should_refresh_token(self) -> bool:
+        """Check if the access token has expired or is about to."""
+        refresh_at = self._token_refresh_at()
+        return refresh_at is None or time.time() > refresh_at
+
     async def ensure_token_valid(self) -> None:
-        """Refresh the token if it has expired."""
+        """Refresh the token if it has expired or is about to."""
         if self.should_refresh_token():
+            await self.refresh_token_once()
+
+    async def refresh_token_once(self) -> None:
+        """Refreshes the token, or waits for the refresh already in progress, so
+        that concurrent callers share one round-trip."""
+        task = self._refresh_task
+        if (
+            task is None
+            or task.done()
+            or task.get_loop() is not asyncio.get_running_loop()
+        ):
             logging.info("Spotify access token should be refreshed. Refreshing...")
-            await self.refresh_access_token()
+            task = self._refresh_task = asyncio.create_task(
+                self.refresh_access_token()
+            )
+        # Shielded so that a cancelled caller doesn't cancel it for the others
+        await asyncio.shield(task)
+
+    def start_token_manager(self) -> asyncio.Task:
+        """Starts refreshing the access token in the background ahead of its
+        expiry, so that polling never waits on a refresh."""
+        task = self._token_manager_task
+        if (
+            task is None
+            or task.done()
+            or task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._token_changed = asyncio.Event()
+            task = self._token_manager_task = asyncio.create_task(
+                self._manage_tokens()
+            )
+        return task
+
+    def _wake_token_manager(self) -> None:
+        """Has the token manager check the token again, starting it if needed."""
+        try:
+            self.start_token_manager()
+        except RuntimeError:
+            return  # No running event loop, it will check once started
+        if self._token_changed is not None:
+            self._token_changed.set()
+
+    async def _manage_tokens(self) -> None:
+        assert self._token_changed is not None
+        while True:
+            self._token_changed.clear()
+            delay: Optional[float] = None  # Without a refresh token, wait for one
+            if self.refresh_token:
+                if self.should_refresh_token():
+                    try:
+                        await self.refresh_token_once()
+                    except Exception as e:
+                        logging.error("Unable to refresh Spotify access token: %s", e)
+                refresh_at = self._token_refresh_at()
+                if refresh_at is None or refresh_at <= time.time():
+                    delay = TOKEN_RETRY_SECONDS
+                else:
+                    delay = refresh_at - time.time()
+            try:
+                await asyncio.wait_for(self._token_changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
 
     async def is_active(self) -> bool:
-        await self.ensure_token_valid()
-        url = "https://api.spotify.com/v1/me/player"
+        """Checks whether Spotify is playing.
+
+        The last known state is reused while rate limited, out of request budget
+        or waiting on the token manager for a valid token. A 204 response means
+        no device is active, which is not treated as a failure."""
+        if not self.is_token_valid():
+            logging.warning("No valid Spotify access token yet, reusing last state.")
+            self.start_token_manager()
+            return self.is_playing
+        if not self.request_budget.try_acquire():
+            logging.debug("Spotify request budget exhausted, reusing last state.")
+            return self.is_playing
+
         headers = {"Authorization": f"Bearer {self.access_token}"}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("is_playing", False)
-        return False
+        if self.player_etag:
+            headers["If-None-Match"] = self.player_etag
+        session = get_http_session()
+        async with session.get(self.player_url, headers=headers) as response:
+            if response.status == 200:
+                self.player_etag = response.headers.get("ETag")
+                data = await response.json()
+                self.is_playing = data.get("is_playing", False)
+            elif response.status == 204:
+                logging.debug("No active Spotify device.")
+                self.player_etag = None
+                self.is_playing = False
+            elif response.status == 304:
+                logging.debug("Spotify playback state unchanged.")
+            elif response.status == 429:
+                retry_after = float(response.headers.get("Retry-After", 1))
+                self.request_budget.block_for(retry_after)
+            else:
+                if response.status == 401:
+                    # Have the token manager refresh the token right away
+                    self.token_issued_at = None
+                    self._wake_token_manager()
+                response.raise_for_status()
+        return self.is_playing
+
+
+class SpotifyAccounts(Controller):
+    """
+    Polls several Spotify accounts as one controller, active while any of them
+    is playing, so that music played from anyone's account in the household
+    keeps the speakers on.
+
+    The accounts are polled at the same time over the shared HTTP session, so a
+    check takes as long as the slowest account rather than all of them. Each
+    manages its own tokens. Accounts with the same client ID share one request
+    budget, so the order they are polled in rotates to share it fairly.
+
+    Attributes:
+        accounts (List[SpotifyController]): The controller of each account.
+        active_account (Optional[str]): The account found playing last, if any.
+    """
+
+    KIND = "Spotify"
+
+    def __init__(self, *accounts: SpotifyController):
+        self.accounts = list(accounts)
+        self.active_account: Optional[str] = None
+        self._first = 0
+
+    @property
+    def NAME(self) -> str:
+        return "Spotify"
+
+    @property
+    def access_token(self) -> Optional[str]:
+        """The access token of the first authorized account, if any."""
+        return next(
+            (account.access_token for account in self.accounts if account.access_token),
+            None,
+        )
+
+    def get_account(self, name: str) -> Optional[SpotifyController]:
+        return next(
+            (account for account in self.accounts if account.account == name), None
+        )
+
+    def start_token_manager(self) -> List[asyncio.Task]:
+        """Starts refreshing the tokens of every account in the background."""
+        return [account.start_token_manager() for account in self.accounts]
+
+    async def is_active(self) -> bool:
+        """Checks whether any account is playing. Errors from some accounts are
+        logged and ignored, and only raised if every account failed."""
+        order = self.accounts[self._first :] + self.accounts[: self._first]
+        self._first = (self._first + 1) % len(self.accounts)
+        results = await asyncio.gather(
+            *(account.is_active() for account in order), return_exceptions=True
+        )
+        errors = []
+        self.active_account = None
+        for account, result in zip(order, results):
+            if isinstance(result, Exception):
+                logging.error("Error while checking %s: %s", account.NAME, result)
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            elif result and self.active_account is None:
+                self.active_account = account.account
+        if self.active_account is None and len(errors) == len(order):
+            raise errors[0]
+        return self.active_account is not None
@@ -1,31 +1,143 @@
-import requests
+import asyncio
+import logging
+from typing import Callable, Optional
+
+import aiohttp
 
 from src.controllers.controller_interface import Controller
+from src.utils.http_client import get_http_session
+
+# Wait between attempts to re-subscribe to notifications, doubling up to the max
+RECONNECT_MIN_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 60.0
 
 
 class TVController(Controller):
-    def __init__(self, ip_address):
+    POLL_TIMEOUT_SECONDS = 5.0
+    KIND = "TV"
+
+    def __init__(
+        self, ip_address, push_notifications: bool = False, name: str = "TV"
+    ):
         self.ip_address = ip_address
+        self.name = name
         self.url = f"http://{self.ip_address}/sony/system"
+        self.ws_url = f"ws://{self.ip_address}/sony/system"
         self.headers = {"Content-Type": "application/json"}
+        self.push_notifications = push_notifications
+        # Power state pushed by the TV, or None while not subscribed
+        self.pushed_power: Optional[bool] = None
+        self.on_power_change: Optional[Callable[[bool], None]] = None
+        self._notifications_task: Optional[asyncio.Task] = None
 
     @property
     def NAME(self) -> str:
-        return "TV"
+        return self.name
 
     async def is_active(self) -> bool:
-        """Determines whether the Sony TV is turned on"""
+        """Determines whether the Sony TV is turned on.
+
+        Uses the power state pushed by the TV when subscribed to its
+        notifications, and polls it otherwise. Raises if the TV can't be
+        reached or doesn't report its power status."""
+        if self.pushed_power is not None:
+            return self.pushed_power
+
         payload = {
             "method": "getPowerStatus",
             "params": [{}],
             "id": 1,
             "version": "1.0",
         }
-        try:
-            response = requests.post(self.url, json=payload, headers=self.headers)
-            if response.status_code == 200:
-                power_status = response.json().get("result", [{}])[0].get("status")
-                return power_status == "active"
-        except requests.ConnectionError:
-            return False
-        return False
+        # Connection errors and timeouts are raised rather than taken for standby,
+        # so that a TV switched off at the wall trips its circuit breaker
+        session = get_http_session()
+        async with session.post(
+            self.url, json=payload, headers=self.headers
+        ) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        power_status = data.get("result", [{}])[0].get("status")
+        if power_status is None:
+            raise ValueError(f"{self.name} did not report its power status: {data}")
+        return power_status == "active"
+
+    def start_notifications(
+        self, on_power_change: Optional[Callable[[bool], None]] = None
+    ) -> asyncio.Task:
+        """Subscribes to power status notifications from the TV in the background.
+
+        `on_power_change` is called with the new power state whenever it changes."""
+        self.on_power_change = on_power_change
+        if self._notifications_task is None or self._notifications_task.done():
+            self._notifications_task = asyncio.create_task(
+                self._listen_for_notifications()
+            )
+        return self._notifications_task
+
+    async def stop_notifications(self) -> None:
+        """Unsubscribes from notifications and falls back to polling."""
+        task = self._notifications_task
+        self._notifications_task = None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.pushed_power = None
+
+    async def _listen_for_notifications(self) -> None:
+        """Keeps one long-lived connection to the TV, reconnecting with backoff."""
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                session = get_http_session()
+                async with session.ws_connect(self.ws_url, heartbeat=30) as ws:
+                    await ws.send_json(
+                        {
+                            "method": "switchNotifications",
+                            "params": [
+                                {
+                                    "enabled": [
+                                        {"name": "notifyPowerStatus", "version": "1.0"}
+                                    ],
+                                    "disabled": [],
+                                }
+                            ],
+                            "id": 1,
+                            "version": "1.0",
+                        }
+                    )
+                    # Ask for the current state, since notifications only carry changes
+                    await ws.send_json(
+                        {"method": "getPowerStatus", "params": [], "id": 2, "version": "1.0"}
+                    )
+                    logging.info("Subscribed to %s power notifications.", self.name)
+                    delay = RECONNECT_MIN_SECONDS
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self._handle_notification(message.json())
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.debug(f"{self.name} notifications unavailable: {e}")
+
+            if self.pushed_power is not None:
+                logging.info(
+                    "%s notifications dropped, falling back to polling.", self.name
+                )
+            self.pushed_power = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    def _handle_notification(self, data: dict) -> None:
+        if data.get("method") == "notifyPowerStatus":
+            status = data.get("params", [{}])[0].get("status")
+        elif data.get("id") == 2 and "result" in data:
+            status = data["result"][0].get("status")
+        else:
+            return
+
+        is_active = status == "active"
+        changed = is_active != self.pushed_power
+        self.pushed_power = is_active
+        if changed:
+            logging.info(f"{self.name} power status changed to {status}.")
+            if self.on_power_change:
+                self.on_power_change(is_active)
@@ -1,11 +1,8 @@
 import logging
 from typing import Optional
-from src.controllers.smart_plug_controller import SmartPlugController
 
 
-def instantiate_button_controller(
-    speakers_controller: SmartPlugController, mixer_controller: SmartPlugController
-) -> Optional["ButtonController"]:  # type: ignore
+def instantiate_button_controller() -> Optional["ButtonController"]:  # type: ignore
     GPIO_INSTALLED = False
     try:
         import RPi.GPIO as GPIO  # type: ignore
@@ -17,9 +14,7 @@ def instantiate_button_controller(
 
     if GPIO_INSTALLED:
         logging.info("Setting up button controller.")
-        return ButtonController(
-            speakers_controller=speakers_controller, mixer_controller=mixer_controller
-        )
+        return ButtonController()
     else:
         logging.info("Button controller not active.")
         return None
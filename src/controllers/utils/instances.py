@@ -1,42 +1,162 @@
+import json
 import os
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
 
 from dotenv import load_dotenv
 
+from src.controllers.controller_interface import Controller
 from src.controllers.smart_plug_controller import SmartPlugController
-from src.controllers.spotify_controller import SpotifyController
+from src.controllers.spotify_controller import SpotifyAccounts, SpotifyController
 from src.controllers.tv_controller import TVController
 from src.controllers.utils.gpio_setup import instantiate_button_controller
 from src.utils.counter import PlaybackCounter
+from src.utils.power_state import PowerStateMachine
+from src.utils.scheduler import PollIntervals, PollScheduler
+from src.utils.sequencer import Edge, PowerSequencer
+from src.zones import Zone
 
-load_dotenv()
+if TYPE_CHECKING:
+    from src.controllers.audio_level_controller import AudioLevelController
+    from src.utils.energy import EnergyMonitor
 
+_settings_instance = None
 _playback_counter_instance = None
+_power_state_machine_instance = None
+_poll_scheduler_instance = None
+_zones: Optional[List[Zone]] = None
+_energy_monitor_instance = None
 
 
-def get_spotify_controller():
+class Settings(NamedTuple):
+    """
+    Settings read from the environment, or the .env file.
+
+    Attributes:
+        plug_state_ttl_seconds (float): Seconds a known plug state is reused
+            before the plug is queried again.
+        spotify_max_requests (int): Spotify requests allowed per rolling window
+            for this app. Lower this when several instances share one client ID.
+        spotify_window_seconds (float): Length of the Spotify rolling window.
+        energy_sample_seconds (float): Seconds between power readings of plugs
+            with an energy meter. 0 disables it.
+        prewarm_minutes (float): Minutes before a session is expected, from past
+            usage, to turn on the mixer. 0 disables pre-warming.
+        concurrent_polling (bool): Poll all controllers at the same time instead
+            of one after another.
+        tv_push_notifications (bool): Subscribe to the TV's power notifications.
+        audio_threshold_db (float): Audio input level in dBFS above which
+            something is considered to be playing.
+    """
+
+    plug_state_ttl_seconds: float
+    spotify_max_requests: int
+    spotify_window_seconds: float
+    energy_sample_seconds: float
+    prewarm_minutes: float
+    concurrent_polling: bool
+    tv_push_notifications: bool
+    audio_threshold_db: float
+
+
+def get_settings() -> Settings:
+    """Returns the settings, loading the .env file on first use rather than on
+    import."""
+    global _settings_instance
+    if _settings_instance is None:
+        load_dotenv()
+        _settings_instance = Settings(
+            plug_state_ttl_seconds=float(os.getenv("PLUG_STATE_TTL_SECONDS", "5")),
+            spotify_max_requests=int(os.getenv("SPOTIFY_MAX_REQUESTS", "20")),
+            spotify_window_seconds=float(os.getenv("SPOTIFY_WINDOW_SECONDS", "30")),
+            energy_sample_seconds=float(os.getenv("ENERGY_SAMPLE_SECONDS", "0")),
+            prewarm_minutes=float(os.getenv("PREWARM_MINUTES", "0")),
+            concurrent_polling=(
+                os.getenv("CONCURRENT_POLLING", "true").lower() != "false"
+            ),
+            tv_push_notifications=(
+                os.getenv("TV_PUSH_NOTIFICATIONS", "false").lower() == "true"
+            ),
+            audio_threshold_db=float(os.getenv("AUDIO_THRESHOLD_DB", "-50")),
+        )
+    return _settings_instance
+
+
+def getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Reads an environment variable, after loading the .env file."""
+    get_settings()
+    return os.getenv(name, default)
+
+
+# Default poll intervals per controller kind, or name. Spotify can't turn the
+# speakers on, so there is no need to check it often while they are off.
+POLL_INTERVALS = {
+    "Spotify": PollIntervals(speakers_off=300, playing=60, idle=30, near_shutoff=10),
+    "TV": PollIntervals(speakers_off=30, playing=60, idle=30, near_shutoff=10),
+}
+
+
+def get_spotify_account_names() -> List[str]:
+    """Returns the Spotify accounts to poll: the unnamed one, followed by any
+    listed in SPOTIFY_ACCOUNTS, e.g. "alice,bob"."""
+    names = (getenv("SPOTIFY_ACCOUNTS") or "").split(",")
+    return [""] + [name.strip() for name in names if name.strip()]
+
+
+def get_spotify_controller(account: str = ""):
+    """Returns the controller of one Spotify account, the unnamed one by default."""
+    settings = get_settings()
     return SpotifyController(
-        client_id=os.getenv("CLIENT_ID"),
-        client_secret=os.getenv("CLIENT_SECRET"),
+        client_id=getenv("CLIENT_ID"),
+        client_secret=getenv("CLIENT_SECRET"),
         redirect_uri="http://localhost:8888/callback",
+        max_requests=settings.spotify_max_requests,
+        window_seconds=settings.spotify_window_seconds,
+        account=account,
+    )
+
+
+def get_spotify_accounts():
+    """Returns the controller polling every Spotify account together."""
+    return SpotifyAccounts(
+        *(get_spotify_controller(name) for name in get_spotify_account_names())
     )
 
 
 def get_tv_controller():
-    return TVController(os.getenv("TV_IP"))
+    return TVController(
+        getenv("TV_IP"),
+        push_notifications=get_settings().tv_push_notifications,
+    )
+
+
+def get_audio_level_controller() -> Optional["AudioLevelController"]:
+    """Returns the controller listening to the audio input set in AUDIO_INPUT, or
+    None if it isn't set."""
+    source = getenv("AUDIO_INPUT")
+    if not source:
+        return None
+    # Imported here since numpy is only needed when listening to audio
+    from src.controllers.audio_level_controller import AudioLevelController
+
+    return AudioLevelController(
+        source, threshold_db=get_settings().audio_threshold_db
+    )
 
 
 def get_speakers_controller():
-    return SmartPlugController(os.getenv("SPEAKERS_IP"), "Speakers")
+    return SmartPlugController(
+        getenv("SPEAKERS_IP"), "Speakers", get_settings().plug_state_ttl_seconds
+    )
 
 
 def get_mixer_controller():
-    return SmartPlugController(os.getenv("MIXER_IP"), "Mixer")
+    return SmartPlugController(
+        getenv("MIXER_IP"), "Mixer", get_settings().plug_state_ttl_seconds
+    )
 
 
 def get_button_controller():
-    return instantiate_button_controller(  # type: ignore
-        get_speakers_controller(), get_mixer_controller()
-    )
+    return instantiate_button_controller()
 
 
 def get_playback_counter():
@@ -44,3 +164,180 @@ def get_playback_counter():
     if _playback_counter_instance is None:
         _playback_counter_instance = PlaybackCounter()
     return _playback_counter_instance
+
+
+def _make_sequencer(
+    speakers: SmartPlugController,
+    mixer: SmartPlugController,
+    sequence: Optional[List[dict]],
+    plugs: Optional[Dict[str, SmartPlugController]] = None,
+) -> Optional[PowerSequencer]:
+    """Builds the power sequence of a zone from its configured edges, e.g.
+    [{"from": "mixer", "to": "speakers", "rule": "ready"}], or None to use the
+    default fixed delay between the mixer and the speakers."""
+    if sequence is None:
+        return None
+    return PowerSequencer(
+        {"mixer": mixer, "speakers": speakers, **(plugs or {})},
+        [Edge.from_config(edge) for edge in sequence],
+    )
+
+
+def get_power_state_machine():
+    global _power_state_machine_instance
+    if _power_state_machine_instance is None:
+        speakers = get_speakers_controller()
+        mixer = get_mixer_controller()
+        sequence = getenv("POWER_SEQUENCE")
+        _power_state_machine_instance = PowerStateMachine(
+            speakers,
+            mixer,
+            sequencer=_make_sequencer(
+                speakers, mixer, json.loads(sequence) if sequence else None
+            ),
+        )
+    return _power_state_machine_instance
+
+
+def get_energy_monitor() -> "EnergyMonitor":
+    global _energy_monitor_instance
+    if _energy_monitor_instance is None:
+        # Imported here since numpy is only needed when sampling is enabled
+        from src.utils.energy import EnergyMonitor
+
+        _energy_monitor_instance = EnergyMonitor(get_settings().energy_sample_seconds)
+    return _energy_monitor_instance
+
+
+def get_poll_intervals():
+    """Returns poll intervals per controller kind, or name. They can be overridden
+    with a JSON object in POLL_INTERVALS, e.g. {"TV": {"speakers_off": 15}} for
+    every TV or {"Kitchen TV": {"speakers_off": 15}} for one."""
+    intervals = dict(POLL_INTERVALS)
+    overrides = json.loads(getenv("POLL_INTERVALS", "{}"))
+    for name, values in overrides.items():
+        defaults = intervals.get(name, PollIntervals())
+        intervals[name] = PollIntervals(**{**vars(defaults), **values})
+    return intervals
+
+
+def get_poll_scheduler():
+    global _poll_scheduler_instance
+    if _poll_scheduler_instance is None:
+        _poll_scheduler_instance = PollScheduler(
+            get_playback_counter(), get_poll_intervals()
+        )
+    return _poll_scheduler_instance
+
+
+def _make_controller(config: dict, zone_name: str) -> Controller:
+    """Builds a trigger or source controller from its zone configuration."""
+    kind = config.get("type")
+    if kind == "tv":
+        if not config.get("ip"):
+            raise ValueError(f"A TV in zone {zone_name!r} has no ip")
+        return TVController(
+            config["ip"],
+            push_notifications=bool(config.get("push_notifications", False)),
+            name=config.get("name", f"{zone_name} TV"),
+        )
+    if kind == "spotify":
+        # Accounts are shared by every zone that uses them
+        if "account" in config:
+            return get_spotify_controller(config["account"])
+        return get_spotify_accounts()
+    if kind == "audio":
+        from src.controllers.audio_level_controller import AudioLevelController
+
+        return AudioLevelController(
+            config["input"],
+            name=config.get("name", f"{zone_name} audio"),
+            threshold_db=config.get(
+                "threshold_db", get_settings().audio_threshold_db
+            ),
+        )
+    raise ValueError(f"Unknown controller type {kind!r} in zone {zone_name!r}")
+
+
+def _make_zone(config: dict, scheduler: PollScheduler) -> Zone:
+    """Builds a zone from its configuration, e.g.
+    {"name": "Kitchen", "triggers": [{"type": "tv", "ip": "192.168.1.20"}],
+    "sources": [{"type": "spotify"}], "mixer": "192.168.1.30",
+    "speakers": "192.168.1.31", "idle_minutes": 20}
+
+    More plugs can be switched with the speakers by naming them in "plugs" and
+    giving the order to switch them in in "sequence"."""
+    name = config["name"]
+    hosts = {"mixer": config.get("mixer"), "speakers": config.get("speakers")}
+    hosts.update(config.get("plugs", {}))
+    missing = [plug for plug, host in hosts.items() if not host]
+    if missing:
+        raise ValueError(f"Zone {name!r} has no host for {', '.join(missing)}")
+    ttl = get_settings().plug_state_ttl_seconds
+    speakers = SmartPlugController(config["speakers"], f"{name} speakers", ttl)
+    mixer = SmartPlugController(config["mixer"], f"{name} mixer", ttl)
+    plugs = {
+        plug: SmartPlugController(ip, f"{name} {plug}", ttl)
+        for plug, ip in config.get("plugs", {}).items()
+    }
+    playback_counter = PlaybackCounter(
+        threshold_minutes=config.get("idle_minutes", 20)
+    )
+    return Zone(
+        name=name,
+        triggers=[_make_controller(c, name) for c in config.get("triggers", [])],
+        sources=[_make_controller(c, name) for c in config.get("sources", [])],
+        power_state_machine=PowerStateMachine(
+            speakers,
+            mixer,
+            mixer_delay_seconds=config.get("mixer_delay_seconds", 2),
+            sequencer=_make_sequencer(speakers, mixer, config.get("sequence"), plugs),
+        ),
+        playback_counter=playback_counter,
+        # Sharing the wake event lets one loop sleep until any zone needs it
+        poll_scheduler=PollScheduler(
+            playback_counter, get_poll_intervals(), wake=scheduler.wake
+        ),
+    )
+
+
+def _get_main_zone(scheduler: PollScheduler) -> Optional[Zone]:
+    """Returns the main zone configured through the variables above, or None if
+    none of its hosts are set."""
+    hosts = {name: getenv(name) for name in ("SPEAKERS_IP", "MIXER_IP", "TV_IP")}
+    if not any(hosts.values()):
+        return None
+    missing = [name for name, host in hosts.items() if not host]
+    if missing:
+        raise ValueError(f"The main zone needs {', '.join(missing)} to be set")
+    audio = get_audio_level_controller()
+    return Zone(
+        name="Main",
+        triggers=[get_tv_controller()],
+        sources=[get_spotify_accounts()] + ([audio] if audio else []),
+        power_state_machine=get_power_state_machine(),
+        playback_counter=get_playback_counter(),
+        poll_scheduler=scheduler,
+    )
+
+
+def get_zones() -> List[Zone]:
+    """Returns every zone: the main one, if configured through the variables
+    above, followed by any listed in the JSON file at ZONES_FILE."""
+    global _zones
+    if _zones is None:
+        scheduler = get_poll_scheduler()
+        main_zone = _get_main_zone(scheduler)
+        zones = [main_zone] if main_zone else []
+        zones_file = getenv("ZONES_FILE")
+        if zones_file:
+            with open(zones_file) as file:
+                configs = json.load(file)
+            zones.extend(_make_zone(config, scheduler) for config in configs)
+        if not zones:
+            raise ValueError(
+                "No zones are configured. Set SPEAKERS_IP, MIXER_IP and TV_IP, "
+                "or ZONES_FILE."
+            )
+        _zones = zones
+    return _zones
@@ -1,150 +1,357 @@
 import asyncio
 import atexit
+import importlib
 import logging
+import sys
+import time
 from typing import List, Optional, Tuple
 
-from dotenv import load_dotenv
-
 from src.controllers.controller_interface import Controller
+from src.controllers.smart_plug_controller import disconnect_plugs
+from src.controllers.tv_controller import TVController
 from src.controllers.utils.instances import (
     get_button_controller,
-    get_mixer_controller,
+    get_energy_monitor,
     get_playback_counter,
-    get_speakers_controller,
-    get_spotify_controller,
-    get_tv_controller,
+    get_poll_scheduler,
+    get_settings,
+    get_spotify_accounts,
+    get_zones,
 )
 from src.system_state import SystemState
+from src.utils.history import record_event
+from src.utils.http_client import close_http_session
 from src.utils.logging import set_up_logging, update_health_log
-
-# Load environment variables from .env file
-load_dotenv()
-set_up_logging()
-
-
-try:
-    import RPi.GPIO as GPIO  # type: ignore
-
-    button_controller = get_button_controller()
-
-    GPIO_INSTALLED = True
-except ImportError:
-    GPIO_INSTALLED = False
-
-
-spotify_controller = get_spotify_controller()
-tv_controller = get_tv_controller()
-speakers_controller = get_speakers_controller()
-mixer_controller = get_mixer_controller()
-
-playback_counter = get_playback_counter()
+from src.utils.metrics import CYCLE_SECONDS, measure_event_loop_lag
+from src.utils.polling import (
+    poll_controllers_concurrently,
+    poll_controllers_sequentially,
+)
+from src.utils.power_state import PowerState
+from src.utils.prewarm import Prewarmer
+from src.zones import Zone
 
 
-async def check_all_controllers(
+async def check_controllers(
+    controllers_turn_on_speakers: List[Controller],
     controllers: List[Controller],
-) -> Tuple[bool, Optional[str]]:
-    """Check all controllers to see if any are active."""
-    for controller in controllers:
-        if await controller.is_active():
-            return True, controller.NAME
-    return False, None
-
-
-async def turn_on_speakers():
-    """Turns on speakers (and any other required controllers)."""
-    await mixer_controller.turn_on()
-    await asyncio.sleep(2)
-    await speakers_controller.turn_on()
-    playback_counter.reset()
-
-
-async def turn_off_speakers():
-    """Turns off speakers (and any other related controllers)."""
-    await speakers_controller.turn_off()
-    await asyncio.sleep(2)
-    await mixer_controller.turn_off()
+) -> Tuple[bool, Optional[str], bool, List[str]]:
+    """Check whether any controller is active.
+
+    Returns whether one is active, its name, whether it is one of the
+    controllers that should turn on the speakers, and the names of controllers
+    that could not be reached. Controllers that turn on the speakers take
+    priority, so the rest only matter if none of them is active."""
+    if not get_settings().concurrent_polling:
+        result = await poll_controllers_sequentially(controllers_turn_on_speakers)
+        is_trigger = result.is_active
+        timed_out, failed = result.timed_out, result.failed
+        if not result.is_active:
+            result = await poll_controllers_sequentially(controllers)
+            timed_out += result.timed_out
+            failed += result.failed
+    else:
+        # Start both groups at once so a cycle costs the slowest answer, not the sum
+        others_task = asyncio.create_task(poll_controllers_concurrently(controllers))
+        try:
+            result = await poll_controllers_concurrently(controllers_turn_on_speakers)
+            is_trigger = result.is_active
+            timed_out, failed = result.timed_out, result.failed
+            if not result.is_active:
+                result = await others_task
+                timed_out += result.timed_out
+                failed += result.failed
+        finally:
+            others_task.cancel()
+
+    if timed_out:
+        logging.warning("Controllers timed out: %s", ", ".join(timed_out))
+    return result.is_active, result.active_name, is_trigger, timed_out + failed
+
+
+async def turn_on_speakers(zone: Optional[Zone] = None):
+    """Turns on speakers (and any other required controllers) of the zone, or
+    of the main zone if not given.
+
+    Does nothing but reset the counter if the speakers are already on."""
+    zone = zone or get_zones()[0]
+    if await zone.power_state_machine.turn_on():
+        record_event(zone.name, "power", "turn_on", describe_power_state(zone))
+    zone.playback_counter.reset()
+
+
+async def turn_off_speakers(zone: Optional[Zone] = None):
+    """Turns off speakers (and any other related controllers) of the zone, or of
+    the main zone if not given."""
+    zone = zone or get_zones()[0]
+    if await zone.power_state_machine.turn_off():
+        record_event(zone.name, "power", "turn_off", describe_power_state(zone))
+
+
+def describe_power_state(zone: Zone) -> str:
+    state = zone.power_state_machine.state
+    return state.value if state else "unknown"
+
+
+def record_poll_results(
+    zone: Zone, polled: List[Controller], active_name: Optional[str], unreachable: List[str]
+) -> None:
+    """Records the outcome of each controller polled this cycle. Checks cancelled
+    because another controller was found active first have no outcome."""
+    for controller in polled:
+        if controller.NAME == active_name:
+            record_event(zone.name, "poll", controller.NAME, "active")
+        elif controller.NAME in unreachable:
+            record_event(zone.name, "poll", controller.NAME, "unreachable")
+        elif active_name is None:
+            record_event(zone.name, "poll", controller.NAME, "inactive")
+
+
+async def run_zone_cycle(zone: Zone) -> float:
+    """Checks the zone's controllers and turns its speakers on or off as needed.
+
+    Returns the seconds until the zone needs checking again."""
+    system_state = zone.system_state
+    assert system_state is not None
+    poll_scheduler = zone.poll_scheduler
+    playback_counter = zone.playback_counter
+
+    # Only poll the controllers whose next poll time has come
+    due_turn_on_speakers = poll_scheduler.due_controllers(zone.triggers)
+    due_controllers = poll_scheduler.due_controllers(zone.sources)
+    polled = due_turn_on_speakers + due_controllers
+
+    # Check if any controller is active, giving priority to those
+    # that should trigger speaker turn on
+    _, active_name, _, unreachable = await check_controllers(
+        due_turn_on_speakers, due_controllers
+    )
+    record_poll_results(zone, polled, active_name, unreachable)
+    last_active_name = poll_scheduler.last_active_name
+    active_name = poll_scheduler.resolve_activity(polled, active_name)
+    if active_name != last_active_name:
+        record_event(zone.name, "state", "service", active_name)
+    is_any_active = active_name is not None
+    is_trigger = any(controller.NAME == active_name for controller in zone.triggers)
+
+    # If a trigger controller is active, turn on speakers
+    if is_trigger:
+        await turn_on_speakers(zone)
+        system_state.update_state(
+            current_service=active_name,
+        )
+
+    if not is_any_active:
+        system_state.update_state(
+            current_service=None,
+            turn_off_time=playback_counter.shutoff_time,
+        )
+        logging.info(
+            "%s: No playback detected. %s minutes until speaker shutoff if necessary.",
+            zone.name,
+            round(playback_counter.get_minutes_left(), 1),
+        )
+    else:
+        playback_counter.reset()
+        system_state.update_state(
+            current_service=active_name,
+        )
+        logging.info(
+            "%s: Speakers are in use through %s. Counter reset.", zone.name, active_name
+        )
+
+    if playback_counter.should_turn_off_speakers():
+        logging.info(
+            "%s: No playback for threshold duration. Turning off speakers.", zone.name
+        )
+        await turn_off_speakers(zone)
+        system_state.update_state(current_service=None)
+        playback_counter.reset()
+
+    speakers_on = zone.power_state_machine.state not in (
+        PowerState.OFF,
+        PowerState.STANDBY,
+    )
+    poll_scheduler.schedule(polled, unreachable, speakers_on, is_any_active)
+    system_state.publish()
+    return poll_scheduler.seconds_until_next_poll(speakers_on, is_any_active)
+
+
+def describe_zone_health(zone: Zone) -> str:
+    """Summarizes the state of the zone for the health log."""
+    system_state = zone.system_state
+    if system_state is not None and system_state.current_service:
+        return f"Speakers are in use through {system_state.current_service}."
+    return (
+        f"{round(zone.playback_counter.get_minutes_left(), 1)} minutes "
+        f"until speaker shutoff if necessary"
+    )
 
 
 async def monitor_and_control_speakers(system_state: SystemState):
     """The main loop of the script, which checks to see when the speakers were last
-    in use, and attempts to shut them off after idling."""
-    logging.info("Beginning monitoring of speakers.")
+    in use, and attempts to shut them off after idling.
 
-    controllers: list[Controller] = [spotify_controller]
-    controllers_turn_on_speakers: list[Controller] = [tv_controller]
+    Every zone is checked in each cycle at the same time, so a cycle takes as
+    long as the slowest zone rather than the sum of them all. Device I/O is
+    bounded by `device_io_slot`."""
+    logging.info("Beginning monitoring of speakers.")
 
-    while True:
-        if not spotify_controller.access_token:
-            logging.error(
-                "Access token not found. Please run the authorization script first."
+    settings = get_settings()
+    spotify = get_spotify_accounts()
+    zones = get_zones()
+    # The given state, shown on the dashboard, describes the first zone, which is
+    # only the main one if that is configured
+    first = zones[0]
+    system_state.speakers_controller = first.power_state_machine.speakers_controller
+    system_state.playback_counter = first.playback_counter
+    system_state.power_state_machine = first.power_state_machine
+    first.system_state = system_state
+    for zone in zones:
+        if zone.system_state is None:
+            zone.system_state = SystemState(
+                zone.power_state_machine.speakers_controller,
+                zone.playback_counter,
+                zone.power_state_machine,
             )
-            await asyncio.sleep(playback_counter.get_check_interval())
-            continue
-
-        try:
-            update_health_log("Service is running... starting checks.")
-
-            # Check if any controller is on that should trigger speaker turn on
-            is_any_active, active_name = await check_all_controllers(
-                controllers_turn_on_speakers
+        zone.power_state_machine.on_state_change = (
+            lambda state, name=zone.name: record_event(
+                name, "state", "power", state.value if state else "unknown"
             )
-
-            # If yes, turn on speakers
-            if is_any_active:
-                await turn_on_speakers()
-                system_state.update_state(
-                    current_service=active_name,
+        )
+
+    # Keep references so the tasks aren't garbage collected, and are stopped
+    # along with the loop
+    background_tasks: List[asyncio.Task] = [
+        asyncio.create_task(measure_event_loop_lag())
+    ]
+
+    # Plugs import python-kasa on first use. Importing it in the background
+    # meanwhile keeps the first power sequence from waiting for it.
+    background_tasks.append(
+        asyncio.create_task(asyncio.to_thread(importlib.import_module, "kasa"))
+    )
+
+    # Refresh each Spotify account's token in the background, ahead of its expiry
+    background_tasks.extend(spotify.start_token_manager())
+
+    if settings.energy_sample_seconds > 0:
+        # Sample the power draw of every zone's plugs that have an energy meter
+        plugs = [
+            controller
+            for zone in zones
+            for controller in zone.power_state_machine.sequencer.plugs.values()
+        ]
+        background_tasks.append(asyncio.create_task(get_energy_monitor().run(plugs)))
+
+    if settings.prewarm_minutes > 0:
+        # Turn on the mixers ahead of the sessions expected from past usage
+        background_tasks.append(
+            asyncio.create_task(Prewarmer(zones, settings.prewarm_minutes).run())
+        )
+
+    button_task = start_button_controller()
+    if button_task is not None:
+        background_tasks.append(button_task)
+
+    def poll_trigger_now(name: str) -> None:
+        for zone in zones:
+            if any(trigger.NAME == name for trigger in zone.triggers):
+                zone.poll_scheduler.poll_now(name)
+
+    tvs = {
+        controller
+        for zone in zones
+        for controller in zone.triggers
+        if isinstance(controller, TVController)
+    }
+    subscribed_tvs = [tv for tv in tvs if tv.push_notifications]
+    for tv in subscribed_tvs:
+        # Check the TV as soon as it reports a power change, in every zone
+        tv.start_notifications(lambda is_active, name=tv.NAME: poll_trigger_now(name))
+
+    try:
+        while True:
+            if not spotify.access_token:
+                logging.error(
+                    "Access token not found. Please run the authorization script first."
                 )
+                await asyncio.sleep(get_playback_counter().get_check_interval())
+                continue
 
-            # Otherwise, check the rest of the controllers
-            if not is_any_active:
-                is_any_active, active_name = await check_all_controllers(controllers)
+            cycle_started = time.perf_counter()
+            update_health_log("Service is running... starting checks.")
+            results = await asyncio.gather(
+                *(run_zone_cycle(zone) for zone in zones), return_exceptions=True
+            )
 
-            if not is_any_active:
-                system_state.update_state(
-                    current_service=None,
-                    turn_off_time=playback_counter.shutoff_time,
-                )
-                logging.info(
-                    "No playback detected. %s minutes until speaker shutoff if necessary.",
-                    round(playback_counter.get_minutes_left(), 1),
-                )
+            waits = []
+            crashed = False
+            for zone, result in zip(zones, results):
+                if isinstance(result, BaseException):
+                    crashed = True
+                    logging.error(
+                        "An error occurred in %s: %s",
+                        zone.name,
+                        result,
+                        exc_info=result,
+                    )
+                    waits.append(5)
+                else:
+                    waits.append(result)
+
+            if crashed:
+                update_health_log("Service has crashed. Will attempt to restart.")
+            elif len(zones) == 1:
                 update_health_log(
-                    f"Service is running. {round(playback_counter.get_minutes_left(), 1)} minutes "
-                    f"until speaker shutoff if necessary"
+                    f"Service is running. {describe_zone_health(zones[0])}"
                 )
             else:
-                playback_counter.reset()
-                system_state.update_state(
-                    current_service=active_name,
-                )
-                logging.info(
-                    "Speakers are in use through %s. Counter reset.", active_name
-                )
                 update_health_log(
-                    f"Service is running. Speakers are in use through {active_name}."
-                )
-
-            if playback_counter.should_turn_off_speakers():
-                logging.info(
-                    "No playback for threshold duration. Turning off speakers."
+                    "Service is running. "
+                    + " ".join(
+                        f"{zone.name}: {describe_zone_health(zone)}" for zone in zones
+                    )
                 )
-                await turn_off_speakers()
-                system_state.update_state(current_service=None)
-                playback_counter.reset()
-
-            await asyncio.sleep(playback_counter.get_check_interval())
-        except Exception as e:
-            update_health_log("Service has crashed. Will attempt to restart.")
-            logging.error("An error occurred: %s", e, exc_info=True)
-            await asyncio.sleep(5)
+            CYCLE_SECONDS.observe(time.perf_counter() - cycle_started)
+            # The zones' schedulers share one wake event, so any of them can sleep
+            await get_poll_scheduler().sleep(min(waits))
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(
+            *background_tasks,
+            *(tv.stop_notifications() for tv in subscribed_tvs),
+            return_exceptions=True,
+        )
+
+
+def start_button_controller() -> Optional[asyncio.Task]:
+    """Handles button presses on this loop, one at a time, if running on a
+    Raspberry Pi."""
+    try:
+        import RPi.GPIO  # type: ignore # noqa: F401
+    except ImportError:
+        return None
+    button_controller = get_button_controller()
+    if button_controller is None:
+        return None
+    return button_controller.start()
 
 
 def cleanup_gpio():
     """Cleans up GPIO used by Raspberry Pi, if necessary"""
     logging.info("Exiting gracefully.")
-    if GPIO_INSTALLED:
-        GPIO.cleanup()
+    gpio = sys.modules.get("RPi.GPIO")
+    if gpio is not None:
+        gpio.cleanup()
+
+
+def stop_audio_capture():
+    """Stops capturing audio inputs, if any were listened to"""
+    audio = sys.modules.get("src.controllers.audio_level_controller")
+    if audio is not None:
+        audio.stop_audio_captures()
 
 
 def shutoff_health_log():
@@ -152,5 +359,33 @@ def shutoff_health_log():
     update_health_log("Service is not running.")
 
 
-atexit.register(cleanup_gpio)
-atexit.register(shutoff_health_log)
+def start_up():
+    """Sets up logging and the hooks run on exit. Called once by whichever
+    entry point starts the service, rather than on import."""
+    set_up_logging()
+    atexit.register(cleanup_gpio)
+    atexit.register(shutoff_health_log)
+
+
+async def run_monitor():
+    """Runs the monitor loop on its own, closing connections once it stops."""
+    try:
+        await monitor_and_control_speakers(SystemState())
+    finally:
+        await close_http_session()
+        await disconnect_plugs()
+        stop_audio_capture()
+
+
+def main():
+    """Starts the monitor without the web API, which starts faster since the
+    web stack is never imported."""
+    start_up()
+    try:
+        asyncio.run(run_monitor())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
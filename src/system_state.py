@@ -1,20 +1,39 @@
+import asyncio
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Dict, Optional, Set
 
+from src.controllers.smart_plug_controller import SmartPlugController
 from src.controllers.utils.instances import (
     get_playback_counter,
+    get_power_state_machine,
     get_speakers_controller,
 )
+from src.utils.circuit_breaker import CircuitState, get_circuit_states
+from src.utils.counter import PlaybackCounter
+from src.utils.power_state import PowerStateMachine
 
 
 class SystemState:
-    """Current state of application, used to display state in main screen"""
+    """Current state of application, used to display state in main screen.
 
-    def __init__(self):
-        self.speakers_on = False
+    Status changes are published to subscribers, such as open dashboards, so
+    they can be shown without querying the devices again. Describes the main
+    zone unless given the speakers, counter and state machine of another."""
+
+    def __init__(
+        self,
+        speakers_controller: Optional[SmartPlugController] = None,
+        playback_counter: Optional[PlaybackCounter] = None,
+        power_state_machine: Optional[PowerStateMachine] = None,
+    ):
+        self.speakers_on: Optional[bool] = None  # None until first known
         self.current_service = None  # What system is using the speakers
         self.turn_off_time: Optional[datetime] = None
-        self.speakers_controller = get_speakers_controller()
+        self.speakers_controller = speakers_controller or get_speakers_controller()
+        self.playback_counter = playback_counter or get_playback_counter()
+        self.power_state_machine = power_state_machine or get_power_state_machine()
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._published_message: Optional[str] = None
 
     def update_state(
         self,
@@ -28,9 +47,26 @@ class SystemState:
         else:
             self.turn_off_time = None
 
-    async def get_status_message(self) -> str:
-        """Generate a human-readable status message."""
-        self.speakers_on = await self.speakers_controller.is_on()
+    @staticmethod
+    def circuit_states() -> Dict[str, str]:
+        """State of the circuit breaker of each polled controller and plug."""
+        return {key: state.value for key, state in get_circuit_states().items()}
+
+    def describe(self) -> str:
+        """Human-readable status message from the known state, without device I/O."""
+        message = self._describe_speakers()
+        skipped = [
+            key.split(":", 1)[1]
+            for key, state in get_circuit_states().items()
+            if state != CircuitState.CLOSED
+        ]
+        if skipped:
+            message += f" Not responding: {', '.join(sorted(skipped))}."
+        return message
+
+    def _describe_speakers(self) -> str:
+        if self.speakers_on is None:
+            return "Speakers state is unknown."
         if self.speakers_on:
             if self.current_service:
                 return f"Speakers are ON and being used by {self.current_service}."
@@ -40,6 +76,41 @@ class SystemState:
                     f"{self.turn_off_time.strftime('%H:%M:%S')}."
                 )
             return "Speakers are ON."
-        playback_counter = get_playback_counter()
-        playback_counter.reset()
         return "Speakers are OFF."
+
+    async def get_status_message(self) -> str:
+        """Generate a human-readable status message."""
+        self.speakers_on = await self.speakers_controller.is_on()
+        self.power_state_machine.observe_speakers(self.speakers_on)
+        if not self.speakers_on:
+            self.playback_counter.reset()
+        self.publish()
+        return self.describe()
+
+    def publish(self) -> None:
+        """Sends the status message to subscribers if it changed.
+
+        Uses the last known speakers state, so it never queries the plug."""
+        known_state = self.speakers_controller.known_state
+        if known_state is not None:
+            self.speakers_on = known_state
+        message = self.describe()
+        if message == self._published_message:
+            return
+        self._published_message = message
+        for queue in self._subscribers:
+            # Subscribers only need the latest message, so replace any unread one
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yields the current status message, then each change to it."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        try:
+            yield self._published_message or self.describe()
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
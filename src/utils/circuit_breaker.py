@@ -0,0 +1,148 @@
+import logging
+from enum import Enum
+from typing import Dict
+
+from src.utils.clock import SYSTEM_CLOCK, Clock
+from src.utils.metrics import CIRCUIT_BREAKER_STATE
+
+# Consecutive failures before a device is skipped
+FAILURE_THRESHOLD = 3
+
+# How long a device is skipped at first, doubling each time a probe fails
+COOLDOWN_SECONDS = 30.0
+MAX_COOLDOWN_SECONDS = 600.0
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"  # Requests go through
+    OPEN = "open"  # Requests are skipped until the cooldown is over
+    HALF_OPEN = "half_open"  # One probe is let through to test recovery
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of contacting a device that is being skipped."""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} is not responding, skipping it for now.")
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Stops contacting a device after repeated failures, so that an unreachable
+    device doesn't add its timeout to every cycle or an error to every log line.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests
+    are skipped for a cooldown. Then a single probe is let through: if it
+    succeeds the circuit closes, otherwise it opens again for twice as long.
+    Shared by everything using the same key, e.g. zones sharing a controller.
+
+    Attributes:
+        key (str): The device, e.g. "plug:Speakers".
+        failure_threshold (int): Consecutive failures before the circuit opens.
+        cooldown_seconds (float): How long the circuit first stays open.
+        max_cooldown_seconds (float): Longest the circuit stays open.
+        clock (Clock): Tells the time the cooldown is measured in.
+    """
+
+    _instances: Dict[str, "CircuitBreaker"] = {}
+
+    def __new__(
+        cls,
+        key,
+        failure_threshold=FAILURE_THRESHOLD,
+        cooldown_seconds=COOLDOWN_SECONDS,
+        max_cooldown_seconds=MAX_COOLDOWN_SECONDS,
+        clock=SYSTEM_CLOCK,
+    ):
+        if key not in cls._instances:
+            cls._instances[key] = super().__new__(cls)
+            cls._instances[key].__init__(
+                key, failure_threshold, cooldown_seconds, max_cooldown_seconds, clock
+            )
+        return cls._instances[key]
+
+    def __init__(
+        self,
+        key: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        cooldown_seconds: float = COOLDOWN_SECONDS,
+        max_cooldown_seconds: float = MAX_COOLDOWN_SECONDS,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        if hasattr(self, "initialized"):
+            return
+        self.key = key
+        self.clock = clock
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._cooldown = cooldown_seconds
+        self._opened_at = 0.0
+        self._probing = False
+        self.initialized = True
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.OPEN
+            and self.clock.monotonic() - self._opened_at >= self._cooldown
+        ):
+            return CircuitState.HALF_OPEN
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether the device should be contacted now. When the cooldown is
+        over, lets through one probe at a time until it reports back."""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.OPEN or self._probing:
+            return False
+        self._set_state(CircuitState.HALF_OPEN)
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        if self._state != CircuitState.CLOSED:
+            logging.info("%s is responding again.", self.key)
+            self._set_state(CircuitState.CLOSED)
+        self._failures = 0
+        self._cooldown = self.cooldown_seconds
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN:
+            # The probe failed, so wait longer before the next one
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown_seconds)
+            self._open()
+        elif self._state == CircuitState.CLOSED and self._failures >= self.failure_threshold:
+            logging.warning(
+                "%s failed %s times in a row, skipping it for %s seconds.",
+                self.key,
+                self._failures,
+                self._cooldown,
+            )
+            self._open()
+
+    def release(self) -> None:
+        """Gives up a probe without an outcome, e.g. because it was cancelled,
+        so that another can be sent."""
+        self._probing = False
+
+    def _open(self) -> None:
+        self._set_state(CircuitState.OPEN)
+        self._opened_at = self.clock.monotonic()
+        self._probing = False
+
+    def _set_state(self, state: CircuitState) -> None:
+        self._state = state
+        CIRCUIT_BREAKER_STATE.set(list(CircuitState).index(state), self.key)
+
+
+def get_circuit_states() -> Dict[str, CircuitState]:
+    """Returns the state of every device's circuit by key."""
+    return {key: breaker.state for key, breaker in CircuitBreaker._instances.items()}
@@ -0,0 +1,76 @@
+import asyncio
+import selectors
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+
+class Clock:
+    """Tells the time. Code that decides based on elapsed time takes a clock, so
+    that replays can run it on virtual time. The default is the system clock."""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """
+    Time that only moves forward when advanced, starting at `start`.
+
+    Event loops made by `new_event_loop` run on this time: when nothing is ready
+    to run they skip ahead to their next timer instead of waiting for it, so
+    sleeps and timeouts take no real time.
+
+    Attributes:
+        start (datetime): The time when the clock was created.
+        elapsed (float): Seconds of virtual time since then.
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.start = start or datetime(2024, 1, 1)
+        self.elapsed = 0.0
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def advance(self, seconds: float) -> None:
+        self.elapsed += max(seconds, 0)
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        return _VirtualTimeEventLoop(self)
+
+
+class _SkippingSelector(selectors.DefaultSelector):  # type: ignore
+    """Advances the clock by the time the event loop would wait for I/O, rather
+    than waiting, whenever no I/O is ready. Waiting for no timer at all, e.g. on
+    a worker thread, still blocks as usual."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout: Optional[float] = None) -> List[Tuple]:
+        if timeout is None:
+            return super().select(None)
+        events = super().select(0)
+        if not events:
+            self.clock.advance(timeout)
+        return events
+
+
+class _VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        super().__init__(_SkippingSelector(clock))
+
+    def time(self) -> float:
+        return self.clock.monotonic()
@@ -0,0 +1,23 @@
+import asyncio
+from typing import Optional
+
+# Device and network calls allowed in flight at once. Keeps many zones from
+# flooding the network or a Raspberry Pi with simultaneous connections.
+MAX_CONCURRENT_DEVICE_IO = 16
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def device_io_slot() -> asyncio.Semaphore:
+    """Returns the semaphore to hold while talking to a device, e.g.
+    `async with device_io_slot(): ...`
+
+    Must be called from inside a running event loop. The semaphore is bound to
+    that loop, so a new one is created if the loop has changed."""
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_DEVICE_IO)
+        _semaphore_loop = loop
+    return _semaphore
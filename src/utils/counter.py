@@ -1,7 +1,9 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Optional
 
+from src.utils.clock import SYSTEM_CLOCK, Clock
+
 
 class PlaybackCounter:
     """
@@ -13,24 +15,31 @@ class PlaybackCounter:
         check_frequency_minutes (float): The interval in minutes to check the shutoff condition.
         last_active_time (Optional[datetime]): The last recorded time of activity.
         shutoff_time (Optional[datetime]): The calculated time to shut off the speakers.
+        clock (Clock): Tells the time, e.g. a virtual clock in replays.
     """
 
-    def __init__(self, threshold_minutes=20, check_frequency_minutes=0.5):
+    def __init__(
+        self,
+        threshold_minutes=20,
+        check_frequency_minutes=0.5,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
         self.threshold_minutes = threshold_minutes
         self.check_frequency_minutes = check_frequency_minutes
-        self.shutoff_time = datetime.now() + timedelta(minutes=self.threshold_minutes)
+        self.clock = clock
+        self.shutoff_time = clock.now() + timedelta(minutes=self.threshold_minutes)
         self.shutoff_time.replace(second=0, microsecond=0)
 
     def reset(self) -> None:
         """Reset the last active time to now."""
-        shutoff_time = datetime.now() + timedelta(minutes=self.threshold_minutes)
+        shutoff_time = self.clock.now() + timedelta(minutes=self.threshold_minutes)
         self.shutoff_time = shutoff_time.replace(second=0, microsecond=0)
         logging.info("New shutoff time is %s.", self.shutoff_time)
 
     def get_minutes_left(self) -> Optional[float]:
         """Calculates the minutes left until the next attempt to turn off speakers."""
         if self.shutoff_time is not None:
-            time_left = self.shutoff_time - datetime.now()
+            time_left = self.shutoff_time - self.clock.now()
             return max(time_left.total_seconds() / 60, 0)
         # This way, it won't turn off until shutoff time is set for first time
         return -1
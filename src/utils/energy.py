@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from src.controllers.smart_plug_controller import SmartPlugController
+
+# Readings kept at each resolution: seconds between buckets and number of buckets.
+# With the defaults this is about 150 KB per plug, however long the service runs.
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "second": (1, 3600),
+    "minute": (60, 1440),  # One day
+    "hour": (3600, 24 * 90),  # 90 days
+}
+
+
+class RingBuffer:
+    """Fixed-size buffer of timestamped power readings (mean, min, max watts),
+    overwriting the oldest once full."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.readings = np.zeros((capacity, 3), dtype=np.float32)
+        self.size = 0
+        self._next = 0
+
+    def append(self, timestamp: float, mean: float, minimum: float, maximum: float) -> None:
+        self.times[self._next] = timestamp
+        self.readings[self._next] = (mean, minimum, maximum)
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def window(
+        self, since: float = -np.inf, until: float = np.inf
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the times and readings from `since` up to `until`, oldest first."""
+        indices = (self._next - self.size + np.arange(self.size)) % self.capacity
+        times = self.times[indices]
+        mask = (times >= since) & (times < until)
+        return times[mask], self.readings[indices[mask]]
+
+
+class EnergyHistory:
+    """Power readings of one plug at several resolutions.
+
+    Readings are stored per second. As each minute and hour ends, the finer
+    readings within it are rolled up into one bucket of the coarser resolution."""
+
+    def __init__(self):
+        self.buffers = {
+            resolution: RingBuffer(capacity)
+            for resolution, (_, capacity) in RESOLUTIONS.items()
+        }
+        self._bucket_starts: Dict[str, Optional[float]] = {
+            resolution: None for resolution in RESOLUTIONS
+        }
+
+    def add(self, timestamp: float, watts: float) -> None:
+        self.buffers["second"].append(float(int(timestamp)), watts, watts, watts)
+        self._roll_up(timestamp)
+
+    def _roll_up(self, timestamp: float) -> None:
+        resolutions = list(RESOLUTIONS.items())
+        for (finer, _), (coarser, (seconds, _)) in zip(resolutions, resolutions[1:]):
+            bucket_start = timestamp // seconds * seconds
+            previous_start = self._bucket_starts[coarser]
+            self._bucket_starts[coarser] = bucket_start
+            if previous_start is None or bucket_start == previous_start:
+                continue
+            # The previous bucket has ended, so aggregate everything within it
+            _, readings = self.buffers[finer].window(
+                previous_start, previous_start + seconds
+            )
+            if len(readings):
+                self.buffers[coarser].append(
+                    previous_start,
+                    float(readings[:, 0].mean()),
+                    float(readings[:, 1].min()),
+                    float(readings[:, 2].max()),
+                )
+
+    def latest(self) -> Optional[float]:
+        """Returns the most recent reading in watts, if any."""
+        buffer = self.buffers["second"]
+        if not buffer.size:
+            return None
+        return float(buffer.readings[(buffer._next - 1) % buffer.capacity][0])
+
+    def query(self, resolution: str, since: float = 0) -> List[List[float]]:
+        """Returns [time, mean, min, max] readings at the resolution since a time."""
+        times, readings = self.buffers[resolution].window(since)
+        return np.column_stack((times, readings)).tolist()
+
+
+class EnergyMonitor:
+    """Samples the power draw of energy-monitoring plugs at a fixed interval.
+
+    Plugs without an energy meter are skipped after the first attempt."""
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self.histories: Dict[str, EnergyHistory] = {}
+        self._unsupported: set = set()
+
+    async def sample(self, controllers: List["SmartPlugController"]) -> None:
+        """Reads every plug at the same time and stores the readings."""
+        controllers = [c for c in controllers if c.name not in self._unsupported]
+        results = await asyncio.gather(
+            *(controller.read_power() for controller in controllers),
+            return_exceptions=True,
+        )
+        now = time.time()
+        for controller, watts in zip(controllers, results):
+            if isinstance(watts, BaseException):
+                logging.debug("Unable to read power of %s: %s", controller.name, watts)
+            elif watts is None:
+                logging.info("%s has no energy meter, not sampling it.", controller.name)
+                self._unsupported.add(controller.name)
+            else:
+                self.histories.setdefault(controller.name, EnergyHistory()).add(now, watts)
+
+    async def run(self, controllers: List["SmartPlugController"]) -> None:
+        """Samples the plugs until cancelled."""
+        while True:
+            await self.sample(controllers)
+            await asyncio.sleep(self.interval)
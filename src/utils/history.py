@@ -0,0 +1,230 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from src.utils.clock import Clock
+
+# Activity history database
+HISTORY_DB_FILE = "history.db"
+
+# Events older than this are deleted
+HISTORY_RETENTION_DAYS = 90
+
+# Events recorded within this many seconds are written in one transaction
+HISTORY_FLUSH_INTERVAL_SECONDS = 2.0
+HISTORY_BATCH_SIZE = 500
+
+# How often old events are deleted
+COMPACTION_INTERVAL_SECONDS = 3600.0
+
+# Most events that can be queried in one request
+MAX_QUERY_EVENTS = 10000
+
+_history_writer: Optional["HistoryWriter"] = None
+
+# Events collected by `capture_events` instead of being written, with their clock
+_captured: Optional[Tuple[List["Event"], "Clock"]] = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    zone TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_zone_time ON events (zone, time);
+"""
+
+
+class Event(NamedTuple):
+    """Something that happened in a zone.
+
+    `kind` is "poll" for controller poll results, "state" for state transitions
+    and "power" for power actions. `name` says what it concerns, e.g. the
+    controller polled, and `value` what happened, e.g. "active"."""
+
+    time: float
+    zone: str
+    kind: str
+    name: str
+    value: Optional[str]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Opens the history database, creating it if needed.
+
+    WAL mode lets the writer thread and readers use it at the same time, and
+    means each batch costs one sequential write on an SD card."""
+    connection = sqlite3.connect(path, timeout=10)
+    # Must be set before the first table is created to have an effect
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class HistoryWriter(threading.Thread):
+    """Writes recorded events to the history database in the background.
+
+    Events are queued without blocking and written in batches, each in a single
+    transaction. Events older than `retention_days` are deleted periodically."""
+
+    def __init__(
+        self,
+        path: str = HISTORY_DB_FILE,
+        retention_days: float = HISTORY_RETENTION_DAYS,
+        interval: float = HISTORY_FLUSH_INTERVAL_SECONDS,
+    ):
+        super().__init__(name="HistoryWriter", daemon=True)
+        self.path = path
+        self.retention_days = retention_days
+        self.interval = interval
+        self._events: "queue.SimpleQueue[Optional[Event]]" = queue.SimpleQueue()
+        self._compacted_at = 0.0
+
+    def submit(self, event: Event) -> None:
+        self._events.put(event)
+
+    def run(self) -> None:
+        connection = connect(self.path)
+        try:
+            stopped = False
+            while not stopped:
+                # Wait for an event, then give others a moment to join the batch
+                batch = [self._events.get()]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < HISTORY_BATCH_SIZE:
+                    try:
+                        batch.append(
+                            self._events.get(timeout=max(deadline - time.monotonic(), 0))
+                        )
+                    except queue.Empty:
+                        break
+                    if batch[-1] is None:
+                        break
+                stopped = batch[-1] is None
+                self._write(connection, [event for event in batch if event is not None])
+                if time.monotonic() - self._compacted_at > COMPACTION_INTERVAL_SECONDS:
+                    self.compact(connection)
+        finally:
+            connection.close()
+
+    def _write(self, connection: sqlite3.Connection, events: List[Event]) -> None:
+        if not events:
+            return
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO events (time, zone, kind, name, value) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    events,
+                )
+        except sqlite3.Error as e:
+            logging.error("Unable to write %s history events: %s", len(events), e)
+
+    def compact(self, connection: sqlite3.Connection) -> None:
+        """Deletes events older than the retention period and frees their space."""
+        self._compacted_at = time.monotonic()
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with connection:
+                deleted = connection.execute(
+                    "DELETE FROM events WHERE time < ?", (cutoff,)
+                ).rowcount
+            if deleted:
+                connection.execute("PRAGMA incremental_vacuum")
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                logging.info("Deleted %s history events past retention.", deleted)
+        except sqlite3.Error as e:
+            logging.error("Unable to compact history: %s", e)
+
+    def stop(self) -> None:
+        self._events.put(None)
+        self.join(timeout=5)
+
+
+def _get_history_writer() -> HistoryWriter:
+    global _history_writer
+    if _history_writer is None:
+        _history_writer = HistoryWriter()
+        _history_writer.start()
+        atexit.register(shutdown_history)
+    return _history_writer
+
+
+def shutdown_history() -> None:
+    """Writes out any events not yet written."""
+    global _history_writer
+    if _history_writer is not None:
+        _history_writer.stop()
+        _history_writer = None
+
+
+def record_event(zone: str, kind: str, name: str, value: Optional[str] = None) -> None:
+    """Records an event in the history. Returns immediately; the event is
+    written in the background."""
+    if _captured is not None:
+        events, clock = _captured
+        events.append(Event(clock.now().timestamp(), zone, kind, name, value))
+        return
+    _get_history_writer().submit(Event(time.time(), zone, kind, name, value))
+
+
+@contextmanager
+def capture_events(clock: "Clock") -> Iterator[List[Event]]:
+    """Collects the events recorded within the block in a list, timed by the
+    clock, instead of writing them to the history, e.g. during a replay."""
+    global _captured
+    previous = _captured
+    _captured = ([], clock)
+    try:
+        yield _captured[0]
+    finally:
+        _captured = previous
+
+
+def query_events(
+    since: float,
+    until: float,
+    zone: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 1000,
+    path: str = HISTORY_DB_FILE,
+    name: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Returns up to `limit` events between two Unix times, oldest first.
+
+    Blocks on the database, so call it from a worker thread, e.g. with
+    `asyncio.to_thread`. Returns nothing if no events were recorded yet."""
+    sql = "SELECT time, zone, kind, name, value FROM events WHERE time >= ? AND time <= ?"
+    params: List[Any] = [since, until]
+    if zone is not None:
+        sql += " AND zone = ?"
+        params.append(zone)
+    if kind is not None:
+        sql += " AND kind = ?"
+        params.append(kind)
+    if name is not None:
+        sql += " AND name = ?"
+        params.append(name)
+    sql += " ORDER BY time LIMIT ?"
+    params.append(limit)
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    except sqlite3.OperationalError:
+        return []
+    try:
+        rows = connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+    return [Event(*row)._asdict() for row in rows]
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+# Deadlines applied to every request unless a caller passes its own timeout
+CONNECT_TIMEOUT_SECONDS = 3.0
+READ_TIMEOUT_SECONDS = 5.0
+
+# Connection pool limits for keep-alive connections shared by all controllers
+MAX_CONNECTIONS = 20
+MAX_CONNECTIONS_PER_HOST = 4
+KEEPALIVE_TIMEOUT_SECONDS = 60.0
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_session_closer: Optional["asyncio.Task[None]"] = None
+
+
+def make_timeout(
+    connect: float = CONNECT_TIMEOUT_SECONDS, read: float = READ_TIMEOUT_SECONDS
+) -> aiohttp.ClientTimeout:
+    """Builds a per-request timeout with separate connect and read deadlines."""
+    return aiohttp.ClientTimeout(total=connect + read, sock_connect=connect, sock_read=read)
+
+
+async def _close_on_shutdown(session: aiohttp.ClientSession) -> None:
+    """Closes the session when cancelled, as `asyncio.run` does with the tasks
+    still pending as it ends, while the session's connections can still be
+    closed on its loop."""
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await session.close()
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Returns the shared HTTP session, creating it on first use.
+
+    Must be called from inside a running event loop. The session is bound to
+    that loop, so it is closed as the loop shuts down, and a new one is created
+    if the loop has changed."""
+    global _session, _session_loop, _session_closer
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS,
+        )
+        _session = aiohttp.ClientSession(connector=connector, timeout=make_timeout())
+        _session_loop = loop
+        _session_closer = loop.create_task(_close_on_shutdown(_session))
+        logging.debug("Created shared HTTP session.")
+    return _session
+
+
+async def close_http_session() -> None:
+    """Closes the shared HTTP session, if one is open."""
+    global _session, _session_loop, _session_closer
+    if _session is not None and not _session.closed:
+        await _session.close()
+    if _session_closer is not None:
+        _session_closer.cancel()
+    _session = None
+    _session_loop = None
+    _session_closer = None
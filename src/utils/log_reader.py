@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+# Matches the format set in set_up_logging: "<asctime> - <levelname> - <message>"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+TIMESTAMP_LENGTH = len("2024-01-01 00:00:00,000")
+
+BLOCK_SIZE = 8192
+
+# Most lines and bytes that can be read from a log file in one request
+MAX_TAIL_LINES = 10000
+MAX_PAGE_BYTES = 1024 * 1024
+
+
+def tail_lines(path: str, count: int) -> Tuple[List[str], int]:
+    """Returns the last `count` lines of the file, reading blocks backwards from
+    the end instead of the whole file, along with the file size."""
+    with open(path, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        data = b""
+        # One extra newline is needed to know the first line is complete
+        while position > 0 and data.count(b"\n") <= count:
+            read_size = min(BLOCK_SIZE, position)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + data
+    lines = data.decode(errors="replace").splitlines(keepends=True)
+    return lines[-count:] if count else [], end
+
+
+def read_page(
+    path: str, cursor: int, limit: int, whole_lines: bool = False
+) -> Tuple[List[str], int]:
+    """Reads up to `limit` bytes of lines starting at byte `cursor`.
+
+    A line cut off by the limit is left for the next page. With `whole_lines`,
+    so is a last line that hasn't been finished yet. Returns the lines and the
+    cursor of the next page."""
+    with open(path, "rb") as file:
+        file.seek(cursor)
+        data = file.read(limit)
+    if len(data) == limit or whole_lines:
+        last_newline = data.rfind(b"\n")
+        if last_newline >= 0:
+            data = data[: last_newline + 1]
+        elif len(data) < limit:
+            data = b""
+    return data.decode(errors="replace").splitlines(keepends=True), cursor + len(data)
+
+
+def parse_line(line: str) -> Tuple[Optional[datetime], Optional[int]]:
+    """Returns the timestamp and level of a log line, or None for lines that
+    continue the previous record, such as tracebacks."""
+    parts = line.split(" - ", 2)
+    if len(parts) < 3 or len(parts[0]) != TIMESTAMP_LENGTH:
+        return None, None
+    try:
+        timestamp = datetime.strptime(parts[0], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None, None
+    level = logging.getLevelName(parts[1])
+    return timestamp, level if isinstance(level, int) else None
+
+
+class LineFilter:
+    """Keeps records at or above `min_level` within the time window. Lines that
+    continue a record are kept or dropped along with it, also when the record
+    and its continuation lines are filtered in separate calls, e.g. as they are
+    followed."""
+
+    def __init__(
+        self,
+        min_level: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ):
+        self.min_level = min_level
+        self.since = since
+        self.until = until
+        self._keep = False
+
+    def __call__(self, lines: List[str]) -> List[str]:
+        if self.min_level is None and self.since is None and self.until is None:
+            return lines
+        kept = []
+        for line in lines:
+            timestamp, level = parse_line(line)
+            if timestamp is not None:
+                self._keep = (
+                    (self.min_level is None or (level or 0) >= self.min_level)
+                    and (self.since is None or timestamp >= self.since)
+                    and (self.until is None or timestamp <= self.until)
+                )
+            if self._keep:
+                kept.append(line)
+        return kept
+
+
+async def follow_lines(
+    path: str, cursor: int, poll_interval: float = 1.0
+) -> AsyncIterator[str]:
+    """Yields lines appended to the file from byte `cursor` on, as they are written.
+
+    Starts over from the beginning when the file is rotated or truncated."""
+    while True:
+        try:
+            size = await asyncio.to_thread(os.path.getsize, path)
+        except FileNotFoundError:
+            size = 0
+        if size < cursor:
+            cursor = 0
+        if size > cursor:
+            lines, cursor = await asyncio.to_thread(
+                read_page, path, cursor, BLOCK_SIZE, True
+            )
+            for line in lines:
+                yield line
+            if lines:
+                continue
+        await asyncio.sleep(poll_interval)
@@ -1,14 +1,34 @@
 # Set up logging
+import atexit
+from collections import deque
 from datetime import datetime
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+import os
+import queue
+import threading
+from typing import Deque, List, Optional
 
 # Health check log file
 HEALTH_LOG_FILE = "health.log"
 
+# Number of recent health entries kept in memory
+HEALTH_HISTORY_SIZE = 100
+
+# Health updates arriving within this many seconds are written to disk together
+HEALTH_FLUSH_INTERVAL_SECONDS = 5.0
+
+_health_entries: Deque[str] = deque(maxlen=HEALTH_HISTORY_SIZE)
+_health_writer: Optional["HealthLogWriter"] = None
+_log_listener: Optional[QueueListener] = None
+
 
 def set_up_logging():
-    """Sets up logging with 3-day rolling period"""
+    """Sets up logging with 3-day rolling period.
+
+    Records are put on a queue and written to the console and file by a
+    background thread, so logging never blocks the event loop."""
+    global _log_listener
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
@@ -30,14 +50,99 @@ def set_up_logging():
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
 
-    # Add handlers to the logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Hand records to a background thread that runs the handlers
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _log_listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Writes out any queued log records and health entries."""
+    global _log_listener, _health_writer
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+    if _health_writer is not None:
+        _health_writer.stop()
+        _health_writer = None
+
+
+def write_file_atomically(path: str, content: str) -> None:
+    """Writes the file in full or not at all, by replacing it with a temp file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+
+class HealthLogWriter(threading.Thread):
+    """Writes the latest health entry to the health log in the background.
+
+    Entries submitted within `interval` seconds of each other are written
+    together, and only the latest one is kept, like the file itself."""
+
+    def __init__(
+        self,
+        path: str = HEALTH_LOG_FILE,
+        interval: float = HEALTH_FLUSH_INTERVAL_SECONDS,
+    ):
+        super().__init__(name="HealthLogWriter", daemon=True)
+        self.path = path
+        self.interval = interval
+        self._pending: Optional[str] = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def submit(self, entry: str) -> None:
+        self._pending = entry
+        self._wake.set()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self._flush()
+            # Let further updates accumulate before writing again
+            self._stopped.wait(self.interval)
+        self._flush()
+
+    def _flush(self) -> None:
+        entry, self._pending = self._pending, None
+        if entry is None:
+            return
+        try:
+            write_file_atomically(self.path, entry)
+        except OSError as e:
+            logging.error("Unable to write health log: %s", e)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        self.join(timeout=5)
+
+
+def _get_health_writer() -> HealthLogWriter:
+    global _health_writer
+    if _health_writer is None:
+        _health_writer = HealthLogWriter()
+        _health_writer.start()
+    return _health_writer
 
 
 def update_health_log(status_message):
-    """Updates the health.log file that is visible through an endpoint"""
+    """Updates the health status that is visible through an endpoint.
+
+    Entries are kept in memory and written to health.log in the background."""
     pretty_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S %Z%z")
+    entry = f"{status_message} - {pretty_time}\n"
+    _health_entries.append(entry)
+    _get_health_writer().submit(entry)
+
 
-    with open(HEALTH_LOG_FILE, "w") as file:
-        file.write(f"{status_message} - {pretty_time}\n")
+def get_health_entries() -> List[str]:
+    """Returns the most recent health entries, oldest first."""
+    return list(_health_entries)
@@ -0,0 +1,197 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Upper bounds in seconds, suited to LAN and internet round-trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry: List["Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base for metrics exposed on the /metrics endpoint.
+
+    Updates are plain attribute and list writes, so they need no locks and are
+    cheap enough to leave on in production."""
+
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for label_values, value in list(self._values.items()):
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    TYPE = "gauge"
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+
+class Histogram(Metric):
+    """Counts observations in fixed buckets, along with their sum and count."""
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        # Per label values: count in each bucket (last is +Inf), sum of observations
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts = self._counts.get(label_values)
+        if counts is None:
+            counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[label_values] = self._sums.get(label_values, 0.0) + value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """Observes how long the body of the `with` block takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def get_count(self, *label_values: str) -> int:
+        return sum(self._counts.get(label_values, ()))
+
+    def get_sum(self, *label_values: str) -> float:
+        return self._sums.get(label_values, 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for label_values, counts in list(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(self.label_names, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {self._sums[label_values]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def measure_event_loop_lag(interval: float = 0.5) -> None:
+    """Records how late the event loop wakes up, which shows how long something
+    blocked it."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - start - interval, 0)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+        EVENT_LOOP_LAG_LAST_SECONDS.set(lag)
+
+
+CONTROLLER_CHECK_SECONDS = Histogram(
+    "speakersaver_controller_check_seconds",
+    "Time taken by is_active checks of each controller.",
+    ["controller"],
+)
+PLUG_COMMAND_SECONDS = Histogram(
+    "speakersaver_plug_command_seconds",
+    "Time taken by commands sent to each Kasa plug.",
+    ["plug", "command"],
+)
+TOKEN_REFRESHES = Counter(
+    "speakersaver_spotify_token_refreshes_total",
+    "Spotify access token refresh attempts by result.",
+    ["result"],
+)
+TOKEN_REFRESH_SECONDS = Histogram(
+    "speakersaver_spotify_token_refresh_seconds",
+    "Time taken by Spotify access token refresh attempts.",
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "speakersaver_event_loop_lag_seconds",
+    "How late the event loop woke up from a sleep.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+EVENT_LOOP_LAG_LAST_SECONDS = Gauge(
+    "speakersaver_event_loop_lag_last_seconds",
+    "Most recent event loop lag measurement.",
+)
+BUTTON_PRESS_SECONDS = Histogram(
+    "speakersaver_button_press_seconds",
+    "Time from a button press to the speakers being toggled.",
+)
+BUTTON_PRESSES = Counter(
+    "speakersaver_button_presses_total",
+    "Button presses by whether they were handled or ignored as bounces.",
+    ["result"],
+)
+POWER_SEQUENCE_SECONDS = Histogram(
+    "speakersaver_power_sequence_seconds",
+    "Time taken to switch every plug of a power sequence on or off.",
+    ["direction"],
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "speakersaver_circuit_breaker_state",
+    "State of each device's circuit breaker: 0 closed, 1 open, 2 half open.",
+    ["device"],
+)
+CYCLE_SECONDS = Histogram(
+    "speakersaver_monitor_cycle_seconds",
+    "Duration of each monitor_and_control_speakers cycle, excluding the sleep.",
+)
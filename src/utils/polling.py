@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from src.controllers.controller_interface import Controller
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.utils.clock import SYSTEM_CLOCK, Clock
+from src.utils.concurrency import device_io_slot
+from src.utils.metrics import CONTROLLER_CHECK_SECONDS
+
+# Checks in progress, shared by everyone checking the same controller, and how
+# many callers are waiting for each
+_checks_in_flight: Dict[Controller, asyncio.Task] = {}
+_check_waiters: Dict[asyncio.Task, int] = {}
+
+
+class PollResult(NamedTuple):
+    """Outcome of polling a group of controllers."""
+
+    is_active: bool
+    active_name: Optional[str]
+    timed_out: List[str]
+    failed: List[str]
+
+
+def controller_breaker(controller: Controller, clock: Clock = SYSTEM_CLOCK) -> CircuitBreaker:
+    """Returns the circuit breaker of the controller. The clock only applies when
+    it is created, e.g. by a replay ahead of polling."""
+    return CircuitBreaker(f"controller:{controller.NAME}", clock=clock)
+
+
+async def _timed_check(controller: Controller) -> bool:
+    """Checks the controller within its `POLL_TIMEOUT_SECONDS` deadline, skipping
+    it while its circuit breaker is open."""
+    breaker = controller_breaker(controller)
+    if not breaker.allow_request():
+        raise CircuitOpenError(controller.NAME)
+    try:
+        async with device_io_slot():
+            start = time.perf_counter()
+            is_active = await asyncio.wait_for(
+                controller.is_active(), controller.POLL_TIMEOUT_SECONDS
+            )
+    except asyncio.CancelledError:
+        # Checks cancelled because another controller won are not recorded
+        breaker.release()
+        raise
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        CONTROLLER_CHECK_SECONDS.observe(controller.POLL_TIMEOUT_SECONDS, controller.NAME)
+        raise
+    except Exception:
+        breaker.record_failure()
+        CONTROLLER_CHECK_SECONDS.observe(time.perf_counter() - start, controller.NAME)
+        raise
+    breaker.record_success()
+    CONTROLLER_CHECK_SECONDS.observe(time.perf_counter() - start, controller.NAME)
+    return is_active
+
+
+async def check_controller(controller: Controller) -> bool:
+    """Checks whether the controller is active, recording how long it took.
+
+    Concurrent checks of the same controller, e.g. by zones that share it, wait
+    for one call instead of each making their own. The call is cancelled once
+    nobody is waiting for it."""
+    task = _checks_in_flight.get(controller)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.create_task(_timed_check(controller))
+        _checks_in_flight[controller] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if _checks_in_flight.get(controller) is done:
+                del _checks_in_flight[controller]
+
+        task.add_done_callback(forget)
+    _check_waiters[task] = _check_waiters.get(task, 0) + 1
+    try:
+        # Shielded so that a caller giving up doesn't cancel it for the others
+        return await asyncio.shield(task)
+    finally:
+        _check_waiters[task] -= 1
+        if not _check_waiters[task]:
+            del _check_waiters[task]
+            task.cancel()  # Does nothing if it already finished
+
+
+def _report_error(
+    controller: Controller,
+    error: Exception,
+    timed_out: List[str],
+    failed: List[str],
+) -> None:
+    """Logs a check that raised, and adds the controller to `timed_out` or
+    `failed`."""
+    if isinstance(error, asyncio.TimeoutError):
+        logging.warning(
+            "%s did not respond within %s seconds.",
+            controller.NAME,
+            controller.POLL_TIMEOUT_SECONDS,
+        )
+        timed_out.append(controller.NAME)
+    elif isinstance(error, CircuitOpenError):
+        # Logged by the breaker when it opened, not on every skip
+        logging.debug(str(error))
+        failed.append(controller.NAME)
+    else:
+        logging.error("Error while checking %s: %s", controller.NAME, error)
+        failed.append(controller.NAME)
+
+
+async def poll_controllers_sequentially(controllers: List[Controller]) -> PollResult:
+    """Checks the controllers one after another and returns as soon as one is
+    active. Controllers that time out or fail are reported as by
+    `poll_controllers_concurrently`, and the rest are still checked."""
+    timed_out: List[str] = []
+    failed: List[str] = []
+    for controller in controllers:
+        try:
+            if await check_controller(controller):
+                return PollResult(True, controller.NAME, timed_out, failed)
+        except Exception as e:
+            _report_error(controller, e, timed_out, failed)
+    return PollResult(False, None, timed_out, failed)
+
+
+async def poll_controllers_concurrently(controllers: List[Controller]) -> PollResult:
+    """Checks all controllers at the same time and returns as soon as one is active.
+
+    Each controller is given its own `POLL_TIMEOUT_SECONDS` deadline. Checks still
+    running once an active controller is found are cancelled. Controllers that
+    missed their deadline are reported in `timed_out`, and those that raised an
+    error or are skipped because they keep failing in `failed`."""
+    tasks = {
+        asyncio.create_task(check_controller(controller)): controller
+        for controller in controllers
+    }
+    order = {task: index for index, task in enumerate(tasks)}
+    pending = set(tasks)
+    timed_out: List[str] = []
+    failed: List[str] = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            # Prefer the controller listed first when several finish together
+            for task in sorted(done, key=order.__getitem__):
+                controller = tasks[task]
+                try:
+                    if task.result():
+                        return PollResult(True, controller.NAME, timed_out, failed)
+                except Exception as e:
+                    _report_error(controller, e, timed_out, failed)
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return PollResult(False, None, timed_out, failed)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from enum import Enum
+from typing import Callable, Optional, Set
+
+from src.controllers.smart_plug_controller import SmartPlugController, query_plugs
+from src.utils.clock import SYSTEM_CLOCK, Clock
+from src.utils.sequencer import Edge, PowerSequencer, Rule
+
+
+class PowerState(Enum):
+    """Power state of the speakers and the mixer that feeds them."""
+
+    OFF = "off"
+    WARMING_MIXER = "warming_mixer"
+    STANDBY = "standby"  # Mixer pre-warmed, speakers still off
+    ON = "on"
+    COOLING_DOWN = "cooling_down"
+
+
+class PowerStateMachine:
+    """
+    Sequences the mixer and speakers plugs and remembers their known state, so
+    that requesting the state the system is already in costs no device I/O.
+
+    The plugs are switched by a `PowerSequencer`. By default the mixer turns on
+    `mixer_delay_seconds` before the speakers, and the speakers turn off that
+    long before the mixer.
+
+    Attributes:
+        state (Optional[PowerState]): The current power state, or None if unknown.
+        sequencer (PowerSequencer): Switches the plugs in order. It must include
+            the speakers and mixer plugs, and may include others.
+        resync_interval_seconds (float): How long a known state is trusted before
+            the plugs are checked again, to catch changes made outside the app.
+        lock (asyncio.Lock): Held while the plugs are being switched. Anything
+            else that switches them should hold it too.
+        on_state_change (Optional[Callable]): Called with the new state whenever
+            it changes, e.g. to record it.
+        clock (Clock): Tells the time, for the resync interval and the default
+            sequence's delay.
+    """
+
+    def __init__(
+        self,
+        speakers_controller: SmartPlugController,
+        mixer_controller: SmartPlugController,
+        mixer_delay_seconds: float = 2,
+        resync_interval_seconds: float = 600,
+        sequencer: Optional[PowerSequencer] = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self.speakers_controller = speakers_controller
+        self.mixer_controller = mixer_controller
+        self.clock = clock
+        self.sequencer = sequencer or PowerSequencer(
+            {"mixer": mixer_controller, "speakers": speakers_controller},
+            [Edge("mixer", "speakers", Rule.DELAY, mixer_delay_seconds)],
+            clock=clock,
+        )
+        self.resync_interval_seconds = resync_interval_seconds
+        self.state: Optional[PowerState] = None
+        self._state_known_at = 0.0
+        self.lock = asyncio.Lock()
+        self.on_state_change: Optional[Callable[[Optional[PowerState]], None]] = None
+
+    def _set_state(self, state: Optional[PowerState]) -> None:
+        if state != self.state:
+            logging.info(
+                "Power state changed from %s to %s.",
+                self.state.value if self.state else "unknown",
+                state.value if state else "unknown",
+            )
+            self.state = state
+            if self.on_state_change:
+                self.on_state_change(state)
+        self._state_known_at = self.clock.monotonic()
+
+    def _is_settled(self, state: PowerState) -> bool:
+        """Whether the system is known to already be in the given state."""
+        return (
+            self.state == state
+            and self.clock.monotonic() - self._state_known_at
+            < self.resync_interval_seconds
+        )
+
+    def invalidate(self) -> None:
+        """Forgets the known state, e.g. after the plugs were switched elsewhere."""
+        self.state = None
+
+    def observe_speakers(self, speakers_on: bool) -> None:
+        """Reconciles the known state with an observed speakers plug state."""
+        if self.state == PowerState.ON and not speakers_on:
+            self.invalidate()
+        elif self.state in (PowerState.OFF, PowerState.STANDBY) and speakers_on:
+            self.invalidate()
+
+    async def turn_on(self) -> bool:
+        """Turns on the mixer, then the speakers. Returns whether any plug was
+        switched, which a resync of plugs already on doesn't."""
+        if self._is_settled(PowerState.ON):
+            return False
+        async with self.lock:
+            if self._is_settled(PowerState.ON):
+                return False
+            return await self._switch(True)
+
+    async def turn_off(self) -> bool:
+        """Turns off the speakers, then the mixer. Returns whether any plug was
+        switched, which a resync of plugs already off doesn't."""
+        if self._is_settled(PowerState.OFF):
+            return False
+        async with self.lock:
+            if self._is_settled(PowerState.OFF):
+                return False
+            return await self._switch(False)
+
+    async def toggle(self) -> bool:
+        """Turns the speakers off if they are on, and on otherwise, whatever the
+        known state. Returns whether they were turned on."""
+        async with self.lock:
+            turn_on = not await self.speakers_controller.is_on(fresh=True)
+            await self._switch(turn_on)
+            return turn_on
+
+    async def _switch(self, on: bool) -> bool:
+        """Runs the power sequence. The lock must be held. Returns whether any
+        plug was switched."""
+        await self._refresh_plugs()
+        if all(c.known_state is on for c in self.sequencer.plugs.values()):
+            # A resync of plugs already in the state, which passes through no
+            # other state
+            self._settle(PowerState.ON if on else PowerState.OFF, on)
+            return False
+        self._set_state(PowerState.WARMING_MIXER if on else PowerState.COOLING_DOWN)
+        switched = await self.sequencer.switch(on)
+        self._settle(PowerState.ON if on else PowerState.OFF, on)
+        return switched
+
+    async def prewarm(self) -> bool:
+        """Turns on only the plugs the speakers depend on, ahead of expected use,
+        so that a later `turn_on` only needs to switch the speakers. Does nothing
+        unless the system is off. Returns whether anything ran."""
+        upstream = self.sequencer.upstream_of(self._speakers_name())
+        if not upstream or self.state not in (None, PowerState.OFF):
+            return False
+        async with self.lock:
+            if self.state not in (None, PowerState.OFF):
+                return False
+            await self._refresh_plugs()
+            if self.speakers_controller.known_state is not False:
+                return False  # In use, or unreachable
+            self._set_state(PowerState.WARMING_MIXER)
+            await self.sequencer.switch(True, upstream)
+            self._settle(PowerState.STANDBY, True, upstream)
+            return True
+
+    def _speakers_name(self) -> str:
+        return next(
+            name
+            for name, controller in self.sequencer.plugs.items()
+            if controller is self.speakers_controller
+        )
+
+    async def _refresh_plugs(self) -> None:
+        """Queries every plug in one parallel round-trip, so the sequence itself
+        only needs to send commands."""
+        await query_plugs(list(self.sequencer.plugs.values()))
+
+    def _settle(
+        self, state: PowerState, expected: bool, names: Optional[Set[str]] = None
+    ) -> None:
+        """Enters `state` if the plugs, or those in `names`, confirmed it.
+        Otherwise forgets the state so that the next request retries the
+        sequence."""
+        if all(
+            controller.known_state is expected
+            for name, controller in self.sequencer.plugs.items()
+            if names is None or name in names
+        ):
+            self._set_state(state)
+        else:
+            logging.warning("Power sequence to %s did not complete.", state.value)
+            self._set_state(None)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Collection, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.utils.history import query_events, record_event
+
+if TYPE_CHECKING:
+    from src.zones import Zone
+
+# How far back usage is learned from, and how often it is learned again
+LOOKBACK_WEEKS = 8
+LEARN_INTERVAL_SECONDS = 3600
+
+# Seconds between checks for an expected session
+CHECK_INTERVAL_SECONDS = 30
+
+
+class UsagePredictor:
+    """
+    Learns when sessions usually start, per weekday and service.
+
+    A time is expected when sessions of a service started within `window_minutes`
+    of it on at least `min_days` different days of the same weekday. The
+    earliest such start is used, so that pre-warming happens before the usual
+    session rather than in the middle of it.
+
+    Attributes:
+        window_minutes (int): How close together starts must be to count together.
+        min_days (int): Days with a start needed before a time is expected.
+        expected (Dict[int, List[Tuple[int, str]]]): Expected starts per weekday,
+            as minutes after midnight and the service, in order.
+    """
+
+    def __init__(self, window_minutes: int = 15, min_days: int = 3):
+        self.window_minutes = window_minutes
+        self.min_days = min_days
+        self.expected: Dict[int, List[Tuple[int, str]]] = {}
+
+    def learn(self, starts: Iterable[Tuple[datetime, str]]) -> None:
+        """Replaces what was learned with the given session starts and services."""
+        days: Dict[Tuple[int, str], List[Tuple[int, object]]] = defaultdict(list)
+        for start, service in starts:
+            minute = start.hour * 60 + start.minute
+            days[(start.weekday(), service)].append((minute, start.date()))
+
+        expected: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+        for (weekday, service), minutes in days.items():
+            minutes.sort()
+            last_expected: Optional[int] = None
+            for index, (minute, _) in enumerate(minutes):
+                if last_expected is not None and minute < last_expected + self.window_minutes:
+                    continue  # Part of the session already expected
+                dates: Set[object] = set()
+                for other, date in minutes[index:]:
+                    if other >= minute + self.window_minutes:
+                        break
+                    dates.add(date)
+                if len(dates) >= self.min_days:
+                    expected[weekday].append((minute, service))
+                    last_expected = minute
+        self.expected = {weekday: sorted(starts) for weekday, starts in expected.items()}
+
+    def next_start(self, now: datetime) -> Optional[Tuple[datetime, str]]:
+        """Returns the next expected start after `now` within a day, and its
+        service, or None if no session is expected."""
+        for days in (0, 1):
+            midnight = (now + timedelta(days=days)).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            for minute, service in self.expected.get(midnight.weekday(), []):
+                start = midnight + timedelta(minutes=minute)
+                if start > now:
+                    return start, service
+        return None
+
+
+def load_session_starts(
+    zone_name: str, now: datetime, triggers: Collection[str]
+) -> List[Tuple[datetime, str]]:
+    """Returns when each session of the zone started and through which service,
+    from the recorded history. Blocks on the database.
+
+    Only sessions of the `triggers` count: other services are also used without
+    the speakers, e.g. Spotify on headphones, and can't turn them on anyway."""
+    since = now - timedelta(weeks=LOOKBACK_WEEKS)
+    events = query_events(
+        since.timestamp(),
+        now.timestamp(),
+        zone=zone_name,
+        kind="state",
+        name="service",
+        limit=1_000_000,
+    )
+    return [
+        (datetime.fromtimestamp(event["time"]), event["value"])
+        for event in events
+        if event["value"] in triggers
+    ]
+
+
+class Prewarmer:
+    """
+    Turns on the mixer of each zone shortly before a session is expected, so the
+    speakers come on without waiting for it.
+
+    A zone is pre-warmed only while off. Its idle counter is reset, so a wrong
+    prediction turns the mixer off again after the usual idle time.
+
+    Attributes:
+        zones (List[Zone]): The zones to pre-warm.
+        lead_minutes (float): How long before an expected start to pre-warm.
+        predictors (Dict[str, UsagePredictor]): What was learned, per zone.
+    """
+
+    def __init__(self, zones: List["Zone"], lead_minutes: float):
+        self.zones = zones
+        self.lead_minutes = lead_minutes
+        self.predictors = {zone.name: UsagePredictor() for zone in zones}
+        self._prewarmed_for: Dict[str, datetime] = {}
+
+    async def learn(self) -> None:
+        """Learns each zone's usage again from the recorded history."""
+        now = datetime.now()
+        for zone in self.zones:
+            triggers = {controller.NAME for controller in zone.triggers}
+            starts = await asyncio.to_thread(
+                load_session_starts, zone.name, now, triggers
+            )
+            self.predictors[zone.name].learn(starts)
+
+    async def check(self, now: Optional[datetime] = None) -> None:
+        """Pre-warms every zone with a session expected within the lead time."""
+        now = now or datetime.now()
+        await asyncio.gather(*(self._check_zone(zone, now) for zone in self.zones))
+
+    async def _check_zone(self, zone: "Zone", now: datetime) -> None:
+        expected = self.predictors[zone.name].next_start(now)
+        if expected is None:
+            return
+        start, service = expected
+        if start - now > timedelta(minutes=self.lead_minutes):
+            return
+        if self._prewarmed_for.get(zone.name) == start:
+            return  # Only once per expected session
+        self._prewarmed_for[zone.name] = start
+        if await zone.power_state_machine.prewarm():
+            zone.playback_counter.reset()
+            logging.info(
+                "%s: Pre-warmed the mixer for %s expected at %s.",
+                zone.name,
+                service,
+                start.strftime("%H:%M"),
+            )
+            record_event(zone.name, "power", "prewarm", service)
+
+    async def run(self) -> None:
+        """Learns and pre-warms until cancelled."""
+        learned_at: Optional[float] = None
+        while True:
+            if learned_at is None or time.monotonic() - learned_at > LEARN_INTERVAL_SECONDS:
+                try:
+                    await self.learn()
+                except Exception as e:
+                    logging.error("Unable to learn usage patterns: %s", e)
+                learned_at = time.monotonic()
+            try:
+                await self.check()
+            except Exception as e:
+                logging.error("Unable to pre-warm: %s", e)
+            await asyncio.sleep(CHECK_INTERVAL_SECONDS)
@@ -0,0 +1,54 @@
+import logging
+import time
+from collections import deque
+from typing import Deque
+
+
+class RequestBudget:
+    """
+    Rolling-window request budget shared by everything using the same key, e.g.
+    all controllers polling with the same Spotify client ID.
+
+    Attributes:
+        key (str): What the budget is shared by.
+        max_requests (int): Requests allowed in any rolling window.
+        window_seconds (float): Length of the rolling window.
+    """
+
+    _instances = {}
+
+    def __new__(cls, key, max_requests=20, window_seconds=30.0):
+        if key not in cls._instances:
+            cls._instances[key] = super().__new__(cls)
+            cls._instances[key].__init__(key, max_requests, window_seconds)
+        return cls._instances[key]
+
+    def __init__(self, key: str, max_requests: int = 20, window_seconds: float = 30.0):
+        if hasattr(self, "initialized"):
+            return
+        self.key = key
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self._sent: Deque[float] = deque()
+        self._blocked_until = 0.0
+        self.initialized = True
+
+    def _expire(self, now: float) -> None:
+        while self._sent and now - self._sent[0] >= self.window_seconds:
+            self._sent.popleft()
+
+    def try_acquire(self) -> bool:
+        """Records a request if the budget allows one now. Returns whether it did."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return False
+        self._expire(now)
+        if len(self._sent) >= self.max_requests:
+            return False
+        self._sent.append(now)
+        return True
+
+    def block_for(self, seconds: float) -> None:
+        """Stops handing out requests for `seconds`, e.g. from a Retry-After header."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logging.warning("Rate limited on %s for %s seconds.", self.key, seconds)
@@ -0,0 +1,486 @@
+"""Replays recorded controller activity through the monitor's decision logic.
+
+Usage: python -m src.utils.replay --since 2024-05-01T00:00 [--until ...]
+       [--zone Main] [--trigger TV] [--idle-minutes 20]
+
+Prints when the speakers would have been turned on and off, e.g. to try another
+idle time against real usage.
+"""
+
+import argparse
+import math
+import re
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.controllers.controller_interface import Controller
+from src.controllers.singleton_base import SingletonMeta
+from src.controllers.smart_plug_controller import SmartPlugController
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.clock import Clock, VirtualClock
+from src.utils.counter import PlaybackCounter
+from src.utils.history import HISTORY_DB_FILE, Event, capture_events, query_events
+from src.utils.polling import controller_breaker
+from src.utils.power_state import PowerState, PowerStateMachine
+from src.utils.scheduler import PollIntervals, PollScheduler
+from src.zones import Zone
+
+# When a controller became active or inactive, in seconds since the start
+Timeline = List[Tuple[float, bool]]
+
+# Most poll results loaded from the history for one replay
+MAX_RECORDED_EVENTS = 1_000_000
+
+TIME_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+SCRIPTED_STATES = {
+    "on": True,
+    "playing": True,
+    "active": True,
+    "off": False,
+    "paused": False,
+    "stopped": False,
+    "idle": False,
+    "inactive": False,
+}
+SCRIPT_STEP = re.compile(
+    r"^(?P<name>.+?)\s+(?P<state>\w+)\s+at\s+(?:t\s*=\s*)?"
+    r"(?P<time>\d+(?:\.\d+)?)\s*(?P<unit>[smhd]?)$"
+)
+
+
+def parse_script(script: str) -> Dict[str, Timeline]:
+    """Parses a scripted scenario into a timeline per controller, e.g.
+    "TV on at t=0, Spotify playing at 5m, TV off at 6m, Spotify paused at 1h".
+
+    Steps are separated by commas, semicolons or new lines. Times are in seconds
+    unless followed by m, h or d."""
+    timelines: Dict[str, Timeline] = {}
+    for step in re.split(r"[,;\n]", script):
+        step = step.strip()
+        if not step:
+            continue
+        match = SCRIPT_STEP.match(step)
+        if match is None or match["state"].lower() not in SCRIPTED_STATES:
+            raise ValueError(f"Unable to parse scenario step {step!r}")
+        seconds = float(match["time"]) * TIME_UNITS[match["unit"] or "s"]
+        timelines.setdefault(match["name"], []).append(
+            (seconds, SCRIPTED_STATES[match["state"].lower()])
+        )
+    for timeline in timelines.values():
+        timeline.sort()
+    return timelines
+
+
+def load_timelines(
+    zone: str, since: datetime, until: datetime, path: str = HISTORY_DB_FILE
+) -> Dict[str, Timeline]:
+    """Builds a timeline per controller from the poll results recorded for the
+    zone. Polls that found a controller unreachable are skipped."""
+    start = since.timestamp()
+    events = query_events(
+        start, until.timestamp(), zone, "poll", MAX_RECORDED_EVENTS, path
+    )
+    timelines: Dict[str, Timeline] = {}
+    for event in events:
+        if event["value"] in ("active", "inactive"):
+            timelines.setdefault(event["name"], []).append(
+                (event["time"] - start, event["value"] == "active")
+            )
+    return timelines
+
+
+class ScriptedController(Controller):
+    """Follows a timeline on a virtual clock instead of asking a device."""
+
+    def __init__(
+        self,
+        name: str,
+        timeline: Tuple[Tuple[float, bool], ...],
+        clock: Clock,
+        started_at: float = 0.0,
+    ):
+        self.name = name
+        self.clock = clock
+        self.started_at = started_at
+        # Only the steps that change the state matter, e.g. of recorded polls
+        self._times: List[float] = []
+        self._states: List[bool] = []
+        for seconds, is_active in timeline:
+            if is_active != (self._states[-1] if self._states else False):
+                self._times.append(seconds)
+                self._states.append(is_active)
+        self.polls = 0
+
+    @property
+    def NAME(self) -> str:
+        return self.name
+
+    async def is_active(self) -> bool:
+        self.polls += 1
+        index = bisect_right(self._times, self.clock.monotonic() - self.started_at)
+        return self._states[index - 1] if index else False
+
+    def last_change(self, seconds: float) -> float:
+        """Returns when the state last changed by `seconds` since the start, or 0."""
+        index = bisect_right(self._times, seconds)
+        return self._times[index - 1] if index else 0.0
+
+    def next_change(self, seconds: float) -> float:
+        """Returns when the state next changes after `seconds` since the start."""
+        index = bisect_right(self._times, seconds)
+        return self._times[index] if index < len(self._times) else math.inf
+
+
+class _Snapshot(NamedTuple):
+    seconds: float
+    cycles: int
+    polls: Tuple[int, ...]
+    events: int
+    next_polls: Tuple[float, ...]
+
+
+class _FastForward:
+    """
+    Skips a replay ahead over repeats of a steady state.
+
+    While no timeline changes, the zone settles into a round of cycles that
+    repeats every period: the least common multiple of the poll intervals. Once
+    the last two periods went by with the same cycles and nothing but polls,
+    the clock is advanced over the steady stretch, up to a period before the
+    next change, the end of the replay or the last minutes before a shutoff,
+    and the scheduler postpones its polls by as much. The skipped periods'
+    cycles, polls and events are copies of the last one.
+    """
+
+    def __init__(
+        self,
+        zone: Zone,
+        controllers: List[ScriptedController],
+        clock: VirtualClock,
+        started_at: float,
+        duration_seconds: float,
+    ):
+        self.zone = zone
+        self.controllers = controllers
+        self.clock = clock
+        self.started_at = started_at
+        self.duration_seconds = duration_seconds
+        self._snapshots: List[_Snapshot] = []
+
+    def after_cycle(self, events: List[Event], cycles: int) -> int:
+        """Takes note of the cycle just run, then skips ahead if the zone is in
+        a steady state. Returns the cycles skipped."""
+        now = self.clock.monotonic() - self.started_at
+        scheduler = self.zone.poll_scheduler
+        self._snapshots.append(
+            _Snapshot(
+                now,
+                cycles,
+                tuple(c.polls for c in self.controllers),
+                len(events),
+                tuple(scheduler.next_poll_time(c.NAME) for c in self.controllers),
+            )
+        )
+        speakers_on = self.zone.power_state_machine.state not in (
+            PowerState.OFF,
+            PowerState.STANDBY,
+        )
+        is_active = scheduler.last_active_name is not None
+
+        # In milliseconds, so that fractional intervals have a common multiple
+        period_ms = 1
+        for controller in self.controllers:
+            interval = scheduler.get_interval(
+                controller.NAME, speakers_on, is_active, controller.KIND
+            )
+            period_ms = math.lcm(period_ms, round(interval * 1000))
+        period = period_ms / 1000
+        # Older cycles are of no use to compare with
+        while self._snapshots[0].seconds < now - 2 * period - 1e-6:
+            self._snapshots.pop(0)
+
+        horizon = min(
+            [c.next_change(now) for c in self.controllers] + [self.duration_seconds]
+        )
+        if speakers_on and not is_active:
+            minutes_left = self.zone.playback_counter.get_minutes_left()
+            # Until the countdown is close enough for the intervals to change
+            horizon = min(
+                horizon,
+                now + (minutes_left - scheduler.near_shutoff_minutes) * 60,
+            )
+        # The last period before the horizon is run, so that what the cycles keep
+        # up to date, such as the countdown while playing, catches up with the clock
+        repeats = math.ceil((horizon - now) / period) - 2
+        if repeats < 1 or not self._is_steady(events, now, period):
+            return 0
+
+        last = self._snapshots[self._index(now - period)]
+        current = self._snapshots[-1]
+        copied = events[last.events :]
+        for repeat in range(1, repeats + 1):
+            events.extend(
+                event._replace(time=event.time + repeat * period) for event in copied
+            )
+        for controller, before, after in zip(
+            self.controllers, last.polls, current.polls
+        ):
+            controller.polls += repeats * (after - before)
+        skipped = repeats * period
+        self.clock.advance(skipped)
+        scheduler.postpone(skipped)
+        # Cycles from before the skip can't be compared with those after it
+        self._snapshots.clear()
+        return repeats * (current.cycles - last.cycles)
+
+    def _is_steady(self, events: List[Event], now: float, period: float) -> bool:
+        """Whether the last period repeated the one before, with nothing but
+        polls and no timeline change in either, and left every controller due
+        a period later than the one before did."""
+        if any(c.last_change(now) > now - 2 * period for c in self.controllers):
+            return False
+        first, last = self._index(now - 2 * period), self._index(now - period)
+        if first is None or last is None:
+            return False
+        previous = self._snapshots[first : last + 1]
+        current = self._snapshots[last:]
+        if len(previous) != len(current) or any(
+            abs(b - a - period) > 1e-6
+            for a, b in zip(previous[-1].next_polls, current[-1].next_polls)
+        ):
+            return False
+        for a, b, c, d in zip(previous, previous[1:], current, current[1:]):
+            # Each cycle a period later, doing the same as its counterpart
+            if (
+                abs(d.seconds - b.seconds - period) > 1e-6
+                or d.cycles - c.cycles != b.cycles - a.cycles
+                or d.events - c.events != b.events - a.events
+                or [y - x for x, y in zip(c.polls, d.polls)]
+                != [y - x for x, y in zip(a.polls, b.polls)]
+            ):
+                return False
+        previous_events = events[previous[0].events : current[0].events]
+        current_events = events[current[0].events :]
+        return len(previous_events) == len(current_events) and all(
+            a.kind == b.kind == "poll"
+            and (a.name, a.value) == (b.name, b.value)
+            and abs(b.time - a.time - period) < 1e-3
+            for a, b in zip(previous_events, current_events)
+        )
+
+    def _index(self, seconds: float) -> Optional[int]:
+        """Returns the index of the cycle run at `seconds` since the start, if any."""
+        for index, snapshot in enumerate(self._snapshots):
+            if abs(snapshot.seconds - seconds) < 1e-6:
+                return index
+        return None
+
+
+class _ReplayPlug:
+    """Stands in for a Kasa plug, switching instantly."""
+
+    def __init__(self, is_on: bool):
+        self.is_on = is_on
+
+    async def update(self) -> None:
+        pass
+
+    async def turn_on(self) -> None:
+        self.is_on = True
+
+    async def turn_off(self) -> None:
+        self.is_on = False
+
+    async def disconnect(self) -> None:
+        pass
+
+
+@contextmanager
+def _own_registries() -> Iterator[None]:
+    """Gives the block empty registries of controllers, plugs and circuit
+    breakers, and restores the app's afterwards, so that a replay neither shares
+    state with the app or other replays nor keeps its objects alive."""
+    registries = (
+        SingletonMeta._instances,
+        SmartPlugController._instances,
+        CircuitBreaker._instances,
+    )
+    saved = [dict(registry) for registry in registries]
+    for registry in registries:
+        registry.clear()
+    try:
+        yield
+    finally:
+        for registry, instances in zip(registries, saved):
+            registry.clear()
+            registry.update(instances)
+
+
+class ReplayResult(NamedTuple):
+    """
+    What the monitor did during a replay.
+
+    Attributes:
+        events (List[Event]): Events recorded during the replay, as they would be
+            in the history, but timed in seconds since its start.
+        cycles (int): Monitor cycles, including those skipped over.
+        polls (Dict[str, int]): Checks of each controller.
+        cycles_run (int): Monitor cycles actually run, the rest having been
+            skipped over as repeats of a steady state.
+    """
+
+    events: List[Event]
+    cycles: int
+    polls: Dict[str, int]
+    cycles_run: int
+
+    def power_actions(self) -> List[Tuple[float, str]]:
+        """Returns when the speakers were turned on or off, e.g. (1200.0, "turn_off")."""
+        return [(event.time, event.name) for event in self.events if event.kind == "power"]
+
+
+def replay(
+    timelines: Dict[str, Timeline],
+    triggers: Iterable[str],
+    duration_seconds: float,
+    idle_minutes: float = 20,
+    intervals: Optional[Dict[str, PollIntervals]] = None,
+    mixer_delay_seconds: float = 2,
+    speakers_on: bool = False,
+    start: Optional[datetime] = None,
+    fast_forward: bool = True,
+) -> ReplayResult:
+    """
+    Runs the monitor's decision logic for one zone against controller timelines,
+    on virtual time, and returns what it did.
+
+    The controllers named in `triggers` turn the speakers on, and the rest only
+    keep them on. The zone is polled as often as the monitor would, with the
+    default poll intervals unless given, but each sleep takes no real time.
+    With `fast_forward`, the steady stretches between changes of the timelines
+    are skipped rather than run, with the same outcome, so a day of activity
+    replays in milliseconds.
+    """
+    clock = VirtualClock(start)
+    loop = clock.new_event_loop()
+    try:
+        with _own_registries():
+            return loop.run_until_complete(
+                _replay(
+                    clock,
+                    timelines,
+                    set(triggers),
+                    duration_seconds,
+                    idle_minutes,
+                    intervals,
+                    mixer_delay_seconds,
+                    speakers_on,
+                    fast_forward,
+                )
+            )
+    finally:
+        loop.close()
+
+
+async def _replay(
+    clock: VirtualClock,
+    timelines: Dict[str, Timeline],
+    triggers: set,
+    duration_seconds: float,
+    idle_minutes: float,
+    intervals: Optional[Dict[str, PollIntervals]],
+    mixer_delay_seconds: float,
+    speakers_on: bool,
+    fast_forward: bool,
+) -> ReplayResult:
+    # Imported here since they build on the whole app
+    from src.controllers.utils.instances import POLL_INTERVALS
+    from src.main import run_zone_cycle
+    from src.system_state import SystemState
+
+    speakers, mixer = (
+        SmartPlugController("replay", name, clock=clock)
+        for name in ("Replay speakers", "Replay mixer")
+    )
+    speakers.plug = _ReplayPlug(speakers_on)
+    mixer.plug = _ReplayPlug(speakers_on)
+    power_state_machine = PowerStateMachine(
+        speakers, mixer, mixer_delay_seconds, clock=clock
+    )
+    # Start from a known state, so that it isn't switched again by the replay
+    await (power_state_machine.turn_on() if speakers_on else power_state_machine.turn_off())
+
+    started_at = clock.monotonic()
+    start = clock.now().timestamp()
+    controllers = {
+        name: ScriptedController(name, tuple(timeline), clock, started_at)
+        for name, timeline in timelines.items()
+    }
+    for controller in controllers.values():
+        # Made ahead of polling, so that their cooldowns run on virtual time
+        controller_breaker(controller, clock)
+    playback_counter = PlaybackCounter(idle_minutes, clock=clock)
+    zone = Zone(
+        name="Replay",
+        triggers=[c for name, c in controllers.items() if name in triggers],
+        sources=[c for name, c in controllers.items() if name not in triggers],
+        power_state_machine=power_state_machine,
+        playback_counter=playback_counter,
+        poll_scheduler=PollScheduler(
+            playback_counter,
+            POLL_INTERVALS if intervals is None else intervals,
+            clock=clock,
+        ),
+        system_state=SystemState(speakers, playback_counter, power_state_machine),
+    )
+
+    skipping = _FastForward(
+        zone, list(controllers.values()), clock, started_at, duration_seconds
+    )
+    cycles = cycles_run = 0
+    with capture_events(clock) as events:
+        while clock.monotonic() - started_at < duration_seconds:
+            wait = await run_zone_cycle(zone)
+            cycles += 1
+            cycles_run += 1
+            if fast_forward:
+                cycles += skipping.after_cycle(events, cycles)
+            await zone.poll_scheduler.sleep(wait)
+    return ReplayResult(
+        [event._replace(time=event.time - start) for event in events],
+        cycles,
+        {name: controller.polls for name, controller in controllers.items()},
+        cycles_run,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--since", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=datetime.now())
+    parser.add_argument("--zone", default="Main")
+    parser.add_argument(
+        "--trigger", action="append", help="Controllers that turn the speakers on"
+    )
+    parser.add_argument("--idle-minutes", type=float, default=20)
+    args = parser.parse_args()
+
+    timelines = load_timelines(args.zone, args.since, args.until)
+    result = replay(
+        timelines,
+        args.trigger or ["TV"],
+        (args.until - args.since).total_seconds(),
+        idle_minutes=args.idle_minutes,
+        start=args.since,
+    )
+    for seconds, action in result.power_actions():
+        print(f"{datetime.fromtimestamp(args.since.timestamp() + seconds)} {action}")
+    print(
+        f"{result.cycles} cycles ({result.cycles_run} run), polls: {result.polls}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.controllers.controller_interface import Controller
+from src.utils.clock import SYSTEM_CLOCK, Clock
+from src.utils.counter import PlaybackCounter
+
+
+@dataclass
+class PollIntervals:
+    """Seconds to wait between polls of a controller in each situation."""
+
+    speakers_off: float = 30
+    playing: float = 60
+    idle: float = 30
+    near_shutoff: float = 10
+
+
+class PollScheduler:
+    """
+    Chooses when each controller should next be polled based on the current
+    situation: rarely while the speakers are off, moderately during playback and
+    more often as the shutoff time approaches. Unreachable controllers are backed
+    off exponentially.
+
+    Attributes:
+        playback_counter (PlaybackCounter): Counter used to find the shutoff time.
+        intervals (Dict[str, PollIntervals]): Intervals for each controller by
+            name, or by kind for every controller of that kind, e.g. "TV".
+        default_intervals (PollIntervals): Intervals for controllers not in `intervals`.
+        near_shutoff_minutes (float): Minutes before shutoff when polling speeds up.
+        max_backoff_seconds (float): Longest wait between polls of an unreachable controller.
+        last_active_name (Optional[str]): The controller last found to be active.
+        wake (asyncio.Event): Set by `poll_now` to end `sleep` early. Schedulers
+            that share it, such as those of each zone, wake up together.
+        clock (Clock): Tells the time. `sleep` uses the event loop's time, which
+            should follow the same clock.
+    """
+
+    def __init__(
+        self,
+        playback_counter: PlaybackCounter,
+        intervals: Optional[Dict[str, PollIntervals]] = None,
+        default_intervals: Optional[PollIntervals] = None,
+        near_shutoff_minutes: float = 2,
+        max_backoff_seconds: float = 600,
+        wake: Optional[asyncio.Event] = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self.playback_counter = playback_counter
+        self.intervals = intervals or {}
+        self.default_intervals = default_intervals or PollIntervals()
+        self.near_shutoff_minutes = near_shutoff_minutes
+        self.max_backoff_seconds = max_backoff_seconds
+        self.last_active_name: Optional[str] = None
+        self._next_poll_at: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self.wake = wake or asyncio.Event()
+        self.clock = clock
+
+    def due_controllers(self, controllers: List[Controller]) -> List[Controller]:
+        """Returns the controllers whose next poll time has come."""
+        now = self.clock.monotonic()
+        return [
+            controller
+            for controller in controllers
+            if self._next_poll_at.get(controller.NAME, 0) <= now
+        ]
+
+    def next_poll_time(self, name: str) -> float:
+        """Returns when the controller is due next, on the scheduler's clock."""
+        return self._next_poll_at.get(name, 0)
+
+    def resolve_activity(
+        self, polled: List[Controller], active_name: Optional[str]
+    ) -> Optional[str]:
+        """Returns the active controller, carrying over the last active one if it
+        was not polled this cycle."""
+        if active_name is None and self.last_active_name is not None:
+            if all(controller.NAME != self.last_active_name for controller in polled):
+                return self.last_active_name
+        self.last_active_name = active_name
+        return active_name
+
+    def get_interval(
+        self, name: str, speakers_on: bool, is_active: bool, kind: str = ""
+    ) -> float:
+        """Returns the seconds to wait before polling the controller again, using
+        the intervals of its name, else of its kind."""
+        intervals = self.intervals.get(name) or self.intervals.get(
+            kind, self.default_intervals
+        )
+        minutes_left = self.playback_counter.get_minutes_left()
+        if not speakers_on:
+            interval = intervals.speakers_off
+        elif is_active:
+            interval = intervals.playing
+        elif 0 <= minutes_left <= self.near_shutoff_minutes:
+            interval = intervals.near_shutoff
+        else:
+            interval = intervals.idle
+
+        failures = self._failures.get(name, 0)
+        if failures:
+            interval = min(interval * 2**failures, self.max_backoff_seconds)
+        return interval
+
+    def schedule(
+        self,
+        polled: List[Controller],
+        unreachable: List[str],
+        speakers_on: bool,
+        is_active: bool,
+    ) -> None:
+        """Sets the next poll time of every controller polled this cycle."""
+        now = self.clock.monotonic()
+        for controller in polled:
+            name = controller.NAME
+            if name in unreachable:
+                self._failures[name] = self._failures.get(name, 0) + 1
+            else:
+                self._failures.pop(name, None)
+            interval = self.get_interval(
+                name, speakers_on, is_active, controller.KIND
+            )
+            if name in unreachable:
+                logging.info("%s is unreachable, next poll in %s seconds.", name, interval)
+            self._next_poll_at[name] = now + interval
+
+    def seconds_until_next_poll(self, speakers_on: bool, is_active: bool) -> float:
+        """Returns how long to sleep before the next cycle. While the speakers are
+        on and idle, the loop also wakes up in time for the shutoff."""
+        now = self.clock.monotonic()
+        wait = min(
+            (poll_at - now for poll_at in self._next_poll_at.values()),
+            default=self.default_intervals.idle,
+        )
+        minutes_left = self.playback_counter.get_minutes_left()
+        if speakers_on and not is_active and minutes_left >= 0:
+            wait = min(wait, minutes_left * 60)
+        return max(wait, 1)
+
+    def postpone(self, seconds: float) -> None:
+        """Moves every controller's next poll later by `seconds`, e.g. when a
+        replay skips over polls that would have repeated the ones before."""
+        for name in self._next_poll_at:
+            self._next_poll_at[name] += seconds
+
+    def poll_now(self, name: str) -> None:
+        """Makes the controller due immediately and wakes up a sleeping loop."""
+        self._next_poll_at[name] = 0
+        self.wake.set()
+
+    async def sleep(self, seconds: float) -> None:
+        """Sleeps until the next cycle, or until `poll_now` is called."""
+        try:
+            await asyncio.wait_for(self.wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self.wake.clear()
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from enum import Enum
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from src.controllers.smart_plug_controller import SmartPlugController
+from src.utils.circuit_breaker import CircuitOpenError
+from src.utils.clock import SYSTEM_CLOCK, Clock
+from src.utils.metrics import POWER_SEQUENCE_SECONDS
+
+# How often a plug is queried while waiting for it to be ready, and for how long
+READY_POLL_SECONDS = 0.1
+READY_TIMEOUT_SECONDS = 10.0
+
+
+class Rule(Enum):
+    """How long a plug waits for one it depends on."""
+
+    READY = "ready"  # Until the plug reports that it has switched
+    DELAY = "delay"  # A minimum time after the plug switched
+
+
+class Edge(NamedTuple):
+    """`target` turns on after `source`, and off before it.
+
+    With `Rule.DELAY`, `delay_seconds` are counted from when `source` switched,
+    so no time is spent waiting if it switched long enough ago."""
+
+    source: str
+    target: str
+    rule: Rule = Rule.READY
+    delay_seconds: float = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Edge":
+        """Builds an edge from its configuration, e.g.
+        {"from": "mixer", "to": "speakers", "rule": "delay", "seconds": 2}"""
+        return cls(
+            config["from"],
+            config["to"],
+            Rule(config.get("rule", "ready")),
+            float(config.get("seconds", 0)),
+        )
+
+
+class PowerSequencer:
+    """
+    Switches a group of plugs in the order given by a dependency graph.
+
+    Each plug switches as soon as the plugs it depends on allow, so independent
+    branches of the graph switch at the same time. Plugs turn on from the
+    sources of the graph to its sinks, and off the other way around.
+
+    Attributes:
+        plugs (Dict[str, SmartPlugController]): The plugs by their name in the graph.
+        edges (List[Edge]): The dependencies between the plugs.
+        clock (Clock): Tells the time delays and readiness timeouts are
+            measured in.
+    """
+
+    def __init__(
+        self,
+        plugs: Dict[str, SmartPlugController],
+        edges: Iterable[Edge],
+        ready_poll_seconds: float = READY_POLL_SECONDS,
+        ready_timeout_seconds: float = READY_TIMEOUT_SECONDS,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self.plugs = plugs
+        self.clock = clock
+        self.edges = list(edges)
+        self.ready_poll_seconds = ready_poll_seconds
+        self.ready_timeout_seconds = ready_timeout_seconds
+        for edge in self.edges:
+            for name in (edge.source, edge.target):
+                if name not in plugs:
+                    raise ValueError(f"Unknown plug {name!r} in power sequence")
+        self._order = self._sort()
+        # When each plug was last switched by the sequencer
+        self._switched_at: Dict[str, float] = {}
+
+    def _sort(self) -> List[str]:
+        """Orders the plugs so that each comes after those it depends on."""
+        order: List[str] = []
+        remaining = {
+            name: {edge.source for edge in self.edges if edge.target == name}
+            for name in self.plugs
+        }
+        while remaining:
+            ready = [name for name, sources in remaining.items() if not sources]
+            if not ready:
+                raise ValueError(f"Power sequence has a cycle among {sorted(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for sources in remaining.values():
+                sources.difference_update(ready)
+        return order
+
+    def upstream_of(self, name: str) -> Set[str]:
+        """Returns every plug that `name` depends on, directly or not."""
+        upstream: Set[str] = set()
+        pending = [name]
+        while pending:
+            target = pending.pop()
+            for edge in self.edges:
+                if edge.target == target and edge.source not in upstream:
+                    upstream.add(edge.source)
+                    pending.append(edge.source)
+        return upstream
+
+    async def switch(self, on: bool, names: Optional[Set[str]] = None) -> bool:
+        """Turns the plugs on or off, or only those in `names`. Returns whether
+        any of them had to be switched.
+
+        A plug isn't switched if one it depends on failed to."""
+        included = [name for name in self._order if names is None or name in names]
+        if not on:
+            included.reverse()
+        tasks: Dict[str, "asyncio.Task[bool]"] = {}
+
+        async def switch_plug(name: str) -> bool:
+            for edge in self.edges:
+                if on:
+                    source, target = edge.source, edge.target
+                else:
+                    # Turning off, the dependencies point the other way
+                    source, target = edge.target, edge.source
+                if target != name or source not in tasks:
+                    continue
+                source_switched = await tasks[source]
+                if not await self._wait_for(edge, source, on, source_switched):
+                    logging.warning(
+                        "%s is not ready, so not switching %s.", source, name
+                    )
+                    return False
+            controller = self.plugs[name]
+            switched = await (controller.turn_on() if on else controller.turn_off())
+            if switched:
+                self._switched_at[name] = self.clock.monotonic()
+            return switched
+
+        with POWER_SEQUENCE_SECONDS.time("on" if on else "off"):
+            for name in included:
+                tasks[name] = asyncio.create_task(switch_plug(name))
+            try:
+                results = await asyncio.gather(*tasks.values())
+            finally:
+                for task in tasks.values():
+                    task.cancel()
+        return any(results)
+
+    async def _wait_for(
+        self, edge: Edge, source: str, on: bool, source_switched: bool
+    ) -> bool:
+        """Waits until the edge allows switching past `source`. Returns whether
+        it does."""
+        if edge.rule == Rule.READY:
+            if not source_switched and self.plugs[source].known_state is on:
+                return True  # It was already in the state before the sequence
+            return await self._wait_until_ready(source, on)
+        switched_at = self._switched_at.get(source)
+        if switched_at is not None:
+            elapsed = self.clock.monotonic() - switched_at
+            await asyncio.sleep(max(edge.delay_seconds - elapsed, 0))
+        return self.plugs[source].known_state is on
+
+    async def _wait_until_ready(self, name: str, on: bool) -> bool:
+        """Polls the plug until it reports the state, or the timeout passes."""
+        controller = self.plugs[name]
+        deadline = self.clock.monotonic() + self.ready_timeout_seconds
+        while True:
+            try:
+                if await controller.is_on(fresh=True) is on:
+                    return True
+            except CircuitOpenError:
+                return False  # Not worth waiting for a plug that keeps failing
+            except Exception:
+                pass  # Logged by is_on, and retried until the deadline
+            if self.clock.monotonic() + self.ready_poll_seconds > deadline:
+                return False
+            await asyncio.sleep(self.ready_poll_seconds)
@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional
+
+from src.controllers.controller_interface import Controller
+from src.utils.counter import PlaybackCounter
+from src.utils.power_state import PowerStateMachine
+from src.utils.scheduler import PollScheduler
+
+if TYPE_CHECKING:
+    from src.system_state import SystemState
+
+
+@dataclass
+class Zone:
+    """
+    A group of speakers with its own controllers, plugs and idle counter.
+
+    Attributes:
+        name (str): The name of the zone, e.g. the room it is in.
+        triggers (List[Controller]): Controllers that turn the speakers on when
+            active, e.g. a TV.
+        sources (List[Controller]): Controllers that only keep the speakers on
+            while active, e.g. Spotify. May be shared with other zones.
+        power_state_machine (PowerStateMachine): Sequences the zone's plugs.
+        playback_counter (PlaybackCounter): Counts down to turning off idle speakers.
+        poll_scheduler (PollScheduler): Chooses when the zone's controllers are polled.
+        system_state (Optional[SystemState]): What the zone is doing, for display.
+            Created by the monitor loop if not given.
+    """
+
+    name: str
+    triggers: List[Controller]
+    sources: List[Controller]
+    power_state_machine: PowerStateMachine
+    playback_counter: PlaybackCounter
+    poll_scheduler: PollScheduler
+    system_state: Optional["SystemState"] = None
@@ -0,0 +1,90 @@
+"""Measures the CPU and memory cost of listening to an audio input.
+
+Usage: python -m tests.benchmark_audio_level [--seconds 60] [--rate 8000]
+
+Writes synthetic audio to a WAV file, measures it with the audio level
+controller as fast as it can be read, and reports the processing time per chunk
+and as a share of one core at real-time speed, along with the memory allocated.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+from src.controllers.audio_level_controller import (
+    CHUNK_SECONDS,
+    AudioLevelController,
+    LevelMeter,
+)
+
+
+def write_wav(path: str, seconds: float, rate: int) -> None:
+    """Writes alternating minutes of music-like noise and near silence."""
+    generator = np.random.default_rng(0)
+    samples = generator.normal(0, 0.001, int(seconds * rate))
+    for start in range(0, len(samples), 120 * rate):
+        samples[start : start + 60 * rate] *= 100
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def measure_chunks(rate: int, chunks: int) -> list:
+    """Times `LevelMeter.measure` alone, without reading the audio."""
+    meter = LevelMeter(int(rate * CHUNK_SECONDS), round(5 / CHUNK_SECONDS))
+    meter.samples[:] = np.random.default_rng(0).integers(
+        -3000, 3000, len(meter.samples), dtype=np.int16
+    )
+    timings = []
+    for _ in range(chunks):
+        start = time.perf_counter()
+        meter.measure()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=600, help="Audio to measure")
+    parser.add_argument("--rate", type=int, default=8000, help="Samples per second")
+    args = parser.parse_args()
+
+    timings = measure_chunks(args.rate, 10000)
+    per_chunk = statistics.median(timings)
+    print(
+        f"measure: p50={per_chunk * 1e6:.1f}us "
+        f"p99={sorted(timings)[int(len(timings) * 0.99)] * 1e6:.1f}us per "
+        f"{CHUNK_SECONDS * 1000:.0f}ms chunk"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "audio.wav")
+        write_wav(path, args.seconds, args.rate)
+        controller = AudioLevelController(path, name="Benchmark")
+
+        tracemalloc.start()
+        cpu_start = time.process_time()
+        asyncio.run(controller.is_active())
+        controller.capture._reader.join()  # type: ignore
+        cpu = time.process_time() - cpu_start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(
+        f"capture: {cpu * 1000:.0f}ms of CPU for {args.seconds:.0f}s of audio, "
+        f"{cpu / args.seconds * 100:.3f}% of one core in real time"
+    )
+    print(f"memory: {peak / 1024:.1f} KB allocated at peak")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Runs the monitor loop against local device simulators and reports how it performs.
+
+Usage: python -m tests.benchmark_monitor_loop [--duration 30] [--push] [--latency 0.2]
+       [--zones 20] [--sequence ready] [--accounts 4]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+from src.controllers.smart_plug_controller import disconnect_plugs
+from src.utils.http_client import close_http_session
+from src.utils.metrics import CONTROLLER_CHECK_SECONDS
+from src.utils.sequencer import Edge, PowerSequencer
+from tests.simulators.base import SimulatorBehavior
+from tests.simulators.kasa_plug import KasaPlugSimulator
+from tests.simulators.sony_tv import SonyTVSimulator
+from tests.simulators.spotify import SpotifySimulator
+
+
+def summarize(name: str, values: List[float]) -> str:
+    if not values:
+        return f"{name}: no samples"
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return (
+        f"{name}: n={len(values)} "
+        f"p50={statistics.median(values) * 1000:.1f}ms "
+        f"p95={p95 * 1000:.1f}ms "
+        f"max={values[-1] * 1000:.1f}ms"
+    )
+
+
+async def measure_loop_lag(samples: List[float], interval: float = 0.01) -> None:
+    """Records how late the event loop wakes up from short sleeps."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(time.perf_counter() - start - interval, 0))
+
+
+async def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+async def run(args) -> None:
+    behavior = SimulatorBehavior(
+        latency_seconds=args.latency, failure_rate=args.failure_rate, seed=1
+    )
+    tv = SonyTVSimulator(behavior=behavior)
+    # One simulator per Spotify account, since each account has its own tokens
+    spotify_simulators = [
+        SpotifySimulator(behavior=behavior) for _ in range(args.accounts)
+    ]
+    spotify = spotify_simulators[0]
+    speakers = KasaPlugSimulator(alias="Speakers", behavior=behavior)
+    mixer = KasaPlugSimulator(alias="Mixer", behavior=behavior)
+    # Extra zones, each with its own TV and plugs
+    extra_simulators: List = []
+    sequence_edge = {
+        "from": "mixer",
+        "to": "speakers",
+        "rule": args.sequence,
+        "seconds": args.mixer_delay,
+    }
+    zone_configs = []
+    for i in range(1, args.zones):
+        zone_tv = SonyTVSimulator(behavior=behavior)
+        zone_mixer = KasaPlugSimulator(alias=f"Zone {i} mixer", behavior=behavior)
+        zone_speakers = KasaPlugSimulator(alias=f"Zone {i} speakers", behavior=behavior)
+        zone_configs.append(
+            {
+                "name": f"Zone {i}",
+                "triggers": [{"type": "tv", "ip": await zone_tv.start()}],
+                "sources": [{"type": "spotify"}],
+                "mixer": await zone_mixer.start(),
+                "speakers": await zone_speakers.start(),
+                "sequence": [sequence_edge],
+            }
+        )
+        extra_simulators += [zone_tv, zone_mixer, zone_speakers]
+    if zone_configs:
+        zones_file = os.path.join(tempfile.mkdtemp(), "zones.json")
+        with open(zones_file, "w") as file:
+            json.dump(zone_configs, file)
+        os.environ["ZONES_FILE"] = zones_file
+
+    # Point the app at the simulators before it builds its controllers
+    os.environ["TV_IP"] = await tv.start()
+    os.environ["SPEAKERS_IP"] = await speakers.start()
+    os.environ["MIXER_IP"] = await mixer.start()
+    for simulator in spotify_simulators:
+        await simulator.start()
+    os.environ["SPOTIFY_ACCOUNTS"] = ",".join(
+        f"account{i}" for i in range(1, args.accounts)
+    )
+    os.environ["TV_PUSH_NOTIFICATIONS"] = "true" if args.push else "false"
+    intervals = {"speakers_off": args.interval, "playing": args.interval}
+    intervals.update(idle=args.interval, near_shutoff=args.interval)
+    os.environ["POLL_INTERVALS"] = json.dumps({"TV": intervals, "Spotify": intervals})
+
+    from src import main
+    from src.controllers.utils.instances import (
+        get_poll_scheduler,
+        get_power_state_machine,
+        get_spotify_account_names,
+        get_spotify_controller,
+        get_tv_controller,
+    )
+    from src.system_state import SystemState
+
+    token_directory = tempfile.mkdtemp()
+    for name, simulator in zip(get_spotify_account_names(), spotify_simulators):
+        spotify_controller = get_spotify_controller(name)
+        spotify_controller.token_file = os.path.join(token_directory, f"{name}.txt")
+        spotify_controller.token_url = simulator.token_url
+        spotify_controller.player_url = simulator.player_url
+        spotify_controller.access_token = "expired"
+        spotify_controller.refresh_token = "refresh"
+    power_state_machine = get_power_state_machine()
+    power_state_machine.sequencer = PowerSequencer(
+        power_state_machine.sequencer.plugs, [Edge.from_config(sequence_edge)]
+    )
+    poll_scheduler = get_poll_scheduler()
+
+    cycle_times: List[float] = []
+    lag_samples: List[float] = []
+    reaction_times: List[float] = []
+    original_sleep = poll_scheduler.sleep
+    cycle_started = time.perf_counter()
+
+    async def timed_sleep(seconds: float) -> None:
+        nonlocal cycle_started
+        cycle_times.append(time.perf_counter() - cycle_started)
+        await original_sleep(seconds)
+        cycle_started = time.perf_counter()
+
+    poll_scheduler.sleep = timed_sleep  # type: ignore
+
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples))
+    monitor_task = asyncio.create_task(
+        main.monitor_and_control_speakers(SystemState())
+    )
+    deadline = time.monotonic() + args.duration
+    try:
+        await asyncio.sleep(1)
+        while time.monotonic() < deadline:
+            # Device change: the TV turns on; action: the speakers plug turns on
+            started = time.perf_counter()
+            await tv.set_power(True)
+            if await wait_until(lambda: speakers.is_on, timeout=args.interval * 3 + 10):
+                reaction_times.append(time.perf_counter() - started)
+            await asyncio.sleep(1)
+            await tv.set_power(False)
+            await main.turn_off_speakers()
+            await asyncio.sleep(1)
+    finally:
+        monitor_task.cancel()
+        lag_task.cancel()
+        await asyncio.gather(monitor_task, lag_task, return_exceptions=True)
+        await get_tv_controller().stop_notifications()
+        await close_http_session()
+        await disconnect_plugs()
+        for simulator in [tv, speakers, mixer] + spotify_simulators + extra_simulators:
+            await simulator.stop()
+
+    print(summarize("Cycle latency", cycle_times))
+    print(summarize("Event loop lag", lag_samples))
+    print(summarize("TV on to speakers on", reaction_times))
+    checks = CONTROLLER_CHECK_SECONDS.get_count("Spotify")
+    if checks:
+        mean = CONTROLLER_CHECK_SECONDS.get_sum("Spotify") / checks
+        print(f"Spotify check ({args.accounts} accounts): n={checks} mean={mean * 1000:.1f}ms")
+    print(
+        f"Requests: TV={tv.requests} "
+        f"Spotify={sum(s.requests for s in spotify_simulators)} "
+        f"Speakers={speakers.requests} Mixer={mixer.requests}"
+    )
+    if extra_simulators:
+        print(f"Extra zones: {args.zones - 1}, requests: {sum(s.requests for s in extra_simulators)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--push", action="store_true", help="Use TV notifications")
+    parser.add_argument("--interval", type=float, default=2, help="Poll interval")
+    parser.add_argument("--latency", type=float, default=0.05, help="Device latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--mixer-delay", type=float, default=2.0)
+    parser.add_argument(
+        "--sequence",
+        choices=["delay", "ready"],
+        default="delay",
+        help="Wait the mixer delay, or until the mixer is ready, before the speakers",
+    )
+    parser.add_argument("--zones", type=int, default=1, help="Zones to simulate")
+    parser.add_argument(
+        "--accounts", type=int, default=1, help="Spotify accounts to simulate"
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
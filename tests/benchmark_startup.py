@@ -0,0 +1,86 @@
+"""Measures how long each entry point takes to start, and which slow libraries it loads.
+
+Usage: python -m tests.benchmark_startup [--runs 5]
+
+Each run imports the entry point in a fresh interpreter and then builds the
+zones, which is what the service does before its first cycle.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Libraries worth keeping off the startup path
+HEAVY_MODULES = ["quart", "kasa", "numpy", "aiohttp"]
+
+ENTRY_POINTS = {
+    "monitor (python -m src.main)": "src.main",
+    "web (python -m src.api)": "src.api",
+}
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from src.controllers.utils.instances import get_zones
+get_zones()
+built = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "zones": built - imported,
+    "modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(module: str, runs: int, cwd: str) -> dict:
+    results = []
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.getcwd(),
+        "SPEAKERS_IP": "127.0.0.1",
+        "MIXER_IP": "127.0.0.1",
+        "TV_IP": "127.0.0.1",
+    }
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return {
+        "import": statistics.median(r["import"] for r in results),
+        "zones": statistics.median(r["zones"] for r in results),
+        "modules": results[-1]["modules"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per entry point")
+    args = parser.parse_args()
+
+    # Run elsewhere so no log or database files are left in the repository
+    cwd = tempfile.mkdtemp()
+    for name, module in ENTRY_POINTS.items():
+        result = measure(module, args.runs, cwd)
+        print(
+            f"{name}: import p50={result['import'] * 1000:.0f}ms "
+            f"zones p50={result['zones'] * 1000:.0f}ms "
+            f"loaded: {', '.join(result['modules']) or 'none'}"
+        )
+    leftovers = os.listdir(cwd)
+    print(f"Files created on import: {', '.join(leftovers) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
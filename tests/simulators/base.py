@@ -0,0 +1,114 @@
+import asyncio
+import random
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from aiohttp import web
+
+
+@dataclass
+class SimulatorBehavior:
+    """How a simulated device misbehaves.
+
+    Attributes:
+        latency_seconds (float): Delay added before every response.
+        failure_rate (float): Fraction of requests that fail, from 0 to 1.
+        flap_interval_seconds (Optional[float]): Toggle the device state this often.
+        seed (Optional[int]): Seed for failures, to make runs repeatable.
+    """
+
+    latency_seconds: float = 0.0
+    failure_rate: float = 0.0
+    flap_interval_seconds: Optional[float] = None
+    seed: Optional[int] = None
+    _random: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+
+    async def delay(self) -> None:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+
+    def should_fail(self) -> bool:
+        return self._random.random() < self.failure_rate
+
+
+class Simulator(ABC):
+    """Base for local device stand-ins with configurable behavior."""
+
+    def __init__(self, behavior: Optional[SimulatorBehavior] = None):
+        self.behavior = behavior or SimulatorBehavior()
+        self.requests = 0
+        self.address: Optional[str] = None
+        self._flap_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> str:
+        """Starts the simulator on a free local port and returns its address."""
+        self.address = await self._start_server()
+        if self.behavior.flap_interval_seconds:
+            self._flap_task = asyncio.create_task(self._flap())
+        return self.address
+
+    async def stop(self) -> None:
+        if self._flap_task is not None:
+            self._flap_task.cancel()
+            await asyncio.gather(self._flap_task, return_exceptions=True)
+        await self._stop_server()
+
+    async def _flap(self) -> None:
+        while True:
+            await asyncio.sleep(self.behavior.flap_interval_seconds)  # type: ignore
+            await self.toggle()
+
+    @abstractmethod
+    async def toggle(self) -> None:
+        """Flips the simulated device state."""
+        pass
+
+    @abstractmethod
+    async def _start_server(self) -> str:
+        pass
+
+    @abstractmethod
+    async def _stop_server(self) -> None:
+        pass
+
+
+class HTTPSimulator(Simulator):
+    """Simulator serving an aiohttp application."""
+
+    def __init__(self, behavior: Optional[SimulatorBehavior] = None):
+        super().__init__(behavior)
+        self._runner: Optional[web.AppRunner] = None
+
+    @abstractmethod
+    def add_routes(self, app: web.Application) -> None:
+        pass
+
+    def misbehaving(self, handler: Callable) -> Callable:
+        """Wraps a handler with the configured latency and failures."""
+
+        async def wrapper(request: web.Request):
+            self.requests += 1
+            await self.behavior.delay()
+            if self.behavior.should_fail():
+                return web.Response(status=503, text="Simulated failure")
+            return await handler(request)
+
+        return wrapper
+
+    async def _start_server(self) -> str:
+        app = web.Application()
+        self.add_routes(app)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        return f"127.0.0.1:{port}"
+
+    async def _stop_server(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
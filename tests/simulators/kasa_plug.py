@@ -0,0 +1,158 @@
+import asyncio
+import json
+import struct
+from typing import Optional, Set
+
+from tests.simulators.base import Simulator, SimulatorBehavior
+
+
+def encrypt(payload: str) -> bytes:
+    """Encrypts a payload with the Kasa XOR autokey cipher, length-prefixed."""
+    key = 171
+    encrypted = bytearray()
+    for byte in payload.encode():
+        key ^= byte
+        encrypted.append(key)
+    return struct.pack(">I", len(encrypted)) + bytes(encrypted)
+
+
+def decrypt(payload: bytes) -> str:
+    key = 171
+    decrypted = bytearray()
+    for byte in payload:
+        decrypted.append(key ^ byte)
+        key = byte
+    return decrypted.decode()
+
+
+class KasaPlugSimulator(Simulator):
+    """Local stand-in for a Kasa smart plug speaking the legacy TCP protocol."""
+
+    def __init__(
+        self,
+        is_on: bool = False,
+        alias: str = "Simulated Plug",
+        behavior: Optional[SimulatorBehavior] = None,
+        power_watts: Optional[float] = None,
+    ):
+        super().__init__(behavior)
+        self.is_on = is_on
+        self.alias = alias
+        # Power drawn while on, for plugs with an energy meter
+        self.power_watts = power_watts
+        self.connections = 0
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    async def toggle(self) -> None:
+        self.is_on = not self.is_on
+
+    def sysinfo(self) -> dict:
+        return {
+            "sw_ver": "1.0.0 Build 000000 Rel.000000",
+            "hw_ver": "1.0",
+            "type": "IOT.SMARTPLUGSWITCH",
+            "model": "HS103(US)",
+            "mac": "00:00:00:00:00:00",
+            "deviceId": "simulated",
+            "hwId": "simulated",
+            "oemId": "simulated",
+            "alias": self.alias,
+            "dev_name": "Smart Wi-Fi Plug",
+            "icon_hash": "",
+            "relay_state": int(self.is_on),
+            "on_time": 0,
+            "active_mode": "none",
+            "feature": "TIM" if self.power_watts is None else "TIM:ENE",
+            "updating": 0,
+            "rssi": -50,
+            "led_off": 0,
+            "latitude_i": 0,
+            "longitude_i": 0,
+            "err_code": 0,
+        }
+
+    def handle_request(self, request: dict) -> dict:
+        response: dict = {}
+        for module, methods in request.items():
+            if module == "emeter" and self.power_watts is not None:
+                response[module] = self.handle_emeter_request(methods)
+                continue
+            if module != "system":
+                response[module] = {"err_code": -1, "err_msg": "module not support"}
+                continue
+            response[module] = {}
+            for method, params in methods.items():
+                if method == "get_sysinfo":
+                    response[module][method] = self.sysinfo()
+                elif method == "set_relay_state":
+                    self.commands += 1
+                    self.is_on = bool(params["state"])
+                    response[module][method] = {"err_code": 0}
+                else:
+                    response[module][method] = {"err_code": -2, "err_msg": "member not support"}
+        return response
+
+    def handle_emeter_request(self, methods: dict) -> dict:
+        response: dict = {}
+        for method in methods:
+            if method == "get_realtime":
+                power = self.power_watts if self.is_on else 0.0
+                response[method] = {
+                    "power_mw": int(power * 1000),
+                    "voltage_mv": 120000,
+                    "current_ma": int(power / 120 * 1000),
+                    "total_wh": 0,
+                    "err_code": 0,
+                }
+            elif method == "get_daystat":
+                response[method] = {"day_list": [], "err_code": 0}
+            elif method == "get_monthstat":
+                response[method] = {"month_list": [], "err_code": 0}
+            else:
+                response[method] = {"err_code": -2, "err_msg": "member not support"}
+        return response
+
+    async def _handle_connection(self, reader, writer) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                length = struct.unpack(">I", await reader.readexactly(4))[0]
+                request = json.loads(decrypt(await reader.readexactly(length)))
+                self.requests += 1
+                await self.behavior.delay()
+                if self.behavior.should_fail():
+                    break
+                writer.write(encrypt(json.dumps(self.handle_request(request))))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _start_server(self) -> str:
+        self._server = await asyncio.start_server(
+            self._handle_connection, "127.0.0.1", 0
+        )
+        port = self._server.sockets[0].getsockname()[1]
+        return f"127.0.0.1:{port}"
+
+    async def _stop_server(self) -> None:
+        for writer in list(self._writers):
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def main():
+    plug = KasaPlugSimulator()
+    print(f"Kasa plug simulator listening on {await plug.start()}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Optional, Set
+
+from aiohttp import WSMsgType, web
+
+from tests.simulators.base import HTTPSimulator, SimulatorBehavior
+
+
+class SonyTVSimulator(HTTPSimulator):
+    """Local stand-in for the `/sony/system` JSON-RPC API of a Bravia TV.
+
+    Answers getPowerStatus over HTTP POST and over WebSocket, and pushes
+    notifyPowerStatus events to subscribed WebSocket clients."""
+
+    def __init__(
+        self, power_on: bool = False, behavior: Optional[SimulatorBehavior] = None
+    ):
+        super().__init__(behavior)
+        self.power_on = power_on
+        self.rpc_requests = 0
+        self._sockets: Set[web.WebSocketResponse] = set()
+        self._subscribed: Set[web.WebSocketResponse] = set()
+
+    @property
+    def status(self) -> str:
+        return "active" if self.power_on else "standby"
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_get("/sony/system", self._handle_websocket)
+        app.router.add_post("/sony/system", self.misbehaving(self._handle_rpc))
+
+    async def _stop_server(self) -> None:
+        await self.drop_connections()
+        await super()._stop_server()
+
+    async def toggle(self) -> None:
+        await self.set_power(not self.power_on)
+
+    async def set_power(self, power_on: bool) -> None:
+        """Changes the power state and notifies subscribed clients."""
+        self.power_on = power_on
+        notification = {
+            "method": "notifyPowerStatus",
+            "params": [{"status": self.status}],
+            "version": "1.0",
+        }
+        for ws in list(self._subscribed):
+            await ws.send_json(notification)
+
+    async def drop_connections(self) -> None:
+        """Closes every WebSocket connection, as when the TV loses network."""
+        for ws in list(self._sockets):
+            await ws.close()
+
+    def _reply(self, request_id, method: str) -> dict:
+        if method == "getPowerStatus":
+            return {"result": [{"status": self.status}], "id": request_id}
+        if method == "switchNotifications":
+            return {
+                "result": [
+                    {"enabled": [{"name": "notifyPowerStatus", "version": "1.0"}]}
+                ],
+                "id": request_id,
+            }
+        return {"error": [12, "No Such Method"], "id": request_id}
+
+    async def _handle_rpc(self, request: web.Request) -> web.Response:
+        self.rpc_requests += 1
+        payload = await request.json()
+        return web.json_response(self._reply(payload.get("id"), payload.get("method")))
+
+    async def _handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.add(ws)
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(message.data)
+                if payload.get("method") == "switchNotifications":
+                    self._subscribed.add(ws)
+                await self.behavior.delay()
+                await ws.send_json(
+                    self._reply(payload.get("id"), payload.get("method"))
+                )
+        finally:
+            self._sockets.discard(ws)
+            self._subscribed.discard(ws)
+        return ws
+
+
+async def main():
+    tv = SonyTVSimulator()
+    print(f"Sony TV simulator listening on {await tv.start()}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
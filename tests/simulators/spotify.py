@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Optional
+
+from aiohttp import web
+
+from tests.simulators.base import HTTPSimulator, SimulatorBehavior
+
+
+class SpotifySimulator(HTTPSimulator):
+    """Local stand-in for the Spotify token endpoint and `/v1/me/player`."""
+
+    def __init__(
+        self,
+        is_playing: bool = False,
+        has_device: bool = True,
+        expires_in: int = 3600,
+        behavior: Optional[SimulatorBehavior] = None,
+    ):
+        super().__init__(behavior)
+        self.is_playing = is_playing
+        self.has_device = has_device
+        self.expires_in = expires_in
+        self.token_requests = 0
+        self.player_requests = 0
+        self.access_token = "access-0"
+        self._throttled_until = 0.0
+        self._retry_after = 0
+
+    @property
+    def token_url(self) -> str:
+        return f"http://{self.address}/api/token"
+
+    @property
+    def player_url(self) -> str:
+        return f"http://{self.address}/v1/me/player"
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_post("/api/token", self.misbehaving(self._handle_token))
+        app.router.add_get("/v1/me/player", self.misbehaving(self._handle_player))
+
+    async def toggle(self) -> None:
+        self.is_playing = not self.is_playing
+
+    def throttle(self, retry_after: int) -> None:
+        """Answers 429 with the given Retry-After for that many seconds."""
+        self._retry_after = retry_after
+        self._throttled_until = time.monotonic() + retry_after
+
+    async def _handle_token(self, request: web.Request) -> web.Response:
+        self.token_requests += 1
+        form = await request.post()
+        if form.get("grant_type") not in ("authorization_code", "refresh_token"):
+            return web.json_response({"error": "unsupported_grant_type"}, status=400)
+        self.access_token = f"access-{self.token_requests}"
+        return web.json_response(
+            {
+                "access_token": self.access_token,
+                "refresh_token": "refresh",
+                "expires_in": self.expires_in,
+                "token_type": "Bearer",
+            }
+        )
+
+    async def _handle_player(self, request: web.Request) -> web.Response:
+        self.player_requests += 1
+        if time.monotonic() < self._throttled_until:
+            return web.Response(
+                status=429, headers={"Retry-After": str(self._retry_after)}
+            )
+        if request.headers.get("Authorization") != f"Bearer {self.access_token}":
+            return web.json_response({"error": {"status": 401}}, status=401)
+        if not self.has_device:
+            return web.Response(status=204)
+        return web.json_response({"is_playing": self.is_playing})
+
+
+async def main():
+    spotify = SpotifySimulator()
+    print(f"Spotify simulator listening on {await spotify.start()}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
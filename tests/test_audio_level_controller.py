@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+import time
+import wave
+
+import numpy as np
+
+from src.controllers.audio_level_controller import (
+    AudioCapture,
+    AudioLevelController,
+    LevelMeter,
+)
+
+RATE = 8000
+
+
+def tone(seconds, amplitude):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * 440 * t)).astype("<i2").tobytes()
+
+
+def write_wav(path, frames, channels=1):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(frames)
+
+
+def read_all(controller):
+    asyncio.run(controller.is_active())  # Starts reading
+    controller.capture._reader.join(timeout=5)
+    return asyncio.run(controller.is_active())
+
+
+def test_level_meter_averages_over_its_window():
+    meter = LevelMeter(chunk_samples=4, window_chunks=2)
+    assert meter.level_db is None
+    meter.samples[:] = [16384, -16384, 16384, -16384]  # Half of full scale
+    meter.measure()
+    assert round(meter.level_db, 1) == -6.0
+    meter.samples[:] = 0
+    meter.measure()
+    assert round(meter.level_db, 1) == -9.0
+    meter.measure()
+    assert meter.level_db == -100.0
+
+
+def test_music_is_active_and_silence_is_not(tmp_path):
+    # A record starts after a second of silence, at about -23 dBFS
+    write_wav(tmp_path / "playing.wav", tone(1, 0) + tone(2, 0.1))
+    # Surface noise between records, around -70 dBFS
+    write_wav(tmp_path / "quiet.wav", tone(3, 0.0003), channels=2)
+
+    playing = AudioLevelController(str(tmp_path / "playing.wav"), window_seconds=1)
+    quiet = AudioLevelController(str(tmp_path / "quiet.wav"), window_seconds=1)
+
+    assert read_all(playing)
+    assert not read_all(quiet)
+    assert -24 < playing.capture.meter.level_db < -22
+
+
+def test_follows_a_live_stream_until_it_ends(tmp_path):
+    path = tmp_path / "capture.fifo"
+    os.mkfifo(path)
+    controller = AudioLevelController(str(path), window_seconds=0.3)
+    playing = threading.Event()
+    stopped = threading.Event()
+
+    def stream():
+        # Written in real time, like a capture device
+        with open(path, "wb") as fifo:
+            for chunk in range(10):
+                fifo.write(tone(0.1, 0.1))
+                fifo.flush()
+                time.sleep(0.1)
+            playing.set()
+            for chunk in range(10):
+                fifo.write(tone(0.1, 0))
+                fifo.flush()
+                time.sleep(0.1)
+            stopped.set()
+
+    assert not asyncio.run(controller.is_active())  # Nothing has arrived yet
+    writer = threading.Thread(target=stream)
+    writer.start()
+    playing.wait()
+    assert asyncio.run(controller.is_active())
+    stopped.wait()
+    assert not asyncio.run(controller.is_active())
+    writer.join()
+    controller.capture._reader.join(timeout=5)
+    # Once the stream has ended there is no audio to go by
+    time.sleep(0.3)
+    assert not asyncio.run(controller.is_active())
+
+
+def test_controllers_of_one_input_share_its_capture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_wav(tmp_path / "capture.wav", tone(1, 0.01))  # About -43 dBFS
+    # A relative path is a file rather than an ALSA device
+    main = AudioLevelController("capture.wav", window_seconds=1)
+    zone = AudioLevelController("capture.wav", name="Kitchen audio", threshold_db=-40)
+    assert main.capture is zone.capture and not main.capture.is_device
+    assert AudioCapture("plughw:1,0").is_device
+
+    assert read_all(main)
+    assert not asyncio.run(zone.is_active())  # Its threshold is higher
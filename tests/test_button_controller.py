@@ -0,0 +1,66 @@
+import asyncio
+import importlib
+import sys
+import threading
+import types
+
+from src.utils.metrics import BUTTON_PRESS_SECONDS
+from src.utils.power_state import PowerStateMachine
+from tests.test_smart_plug_controller import make_controller
+
+
+def load_button_controller(monkeypatch):
+    """Imports button_controller with a stand-in for RPi.GPIO, which only
+    installs on a Raspberry Pi."""
+    gpio = types.SimpleNamespace(
+        BCM="BCM",
+        IN="IN",
+        PUD_DOWN="PUD_DOWN",
+        RISING="RISING",
+        setmode=lambda mode: None,
+        setup=lambda *args, **kwargs: None,
+        add_event_detect=lambda *args, **kwargs: None,
+        input=lambda pin: 0,
+    )
+    rpi = types.ModuleType("RPi")
+    rpi.GPIO = gpio  # type: ignore
+    monkeypatch.setitem(sys.modules, "RPi", rpi)
+    monkeypatch.setitem(sys.modules, "RPi.GPIO", gpio)
+    monkeypatch.delitem(sys.modules, "src.controllers.button_controller", raising=False)
+    return importlib.import_module("src.controllers.button_controller")
+
+
+def test_presses_from_the_gpio_thread_are_debounced_and_serialized(monkeypatch):
+    button_controller = load_button_controller(monkeypatch)
+    speakers = make_controller("ButtonSpeakers", is_on=True)
+    mixer = make_controller("ButtonMixer", is_on=True)
+    power_state_machine = PowerStateMachine(speakers, mixer, mixer_delay_seconds=0)
+    monkeypatch.setattr(
+        button_controller, "get_power_state_machine", lambda: power_state_machine
+    )
+    events = []
+    monkeypatch.setattr(button_controller, "record_event", lambda *args: events.append(args))
+    button = button_controller.ButtonController(debounce_seconds=0.2)
+    presses_before = BUTTON_PRESS_SECONDS.get_count()
+
+    async def press():
+        task = button.start()
+        async with power_state_machine.lock:
+            # A bounce right after the press is ignored
+            gpio_thread = threading.Thread(
+                target=lambda: [button.button_callback(2) for _ in range(3)]
+            )
+            gpio_thread.start()
+            gpio_thread.join()
+            await asyncio.sleep(0.05)
+            # The press waits for whoever is switching the plugs
+            assert speakers.plug.is_on
+        await asyncio.sleep(0.3)
+        task.cancel()
+
+    asyncio.run(press())
+    # The whole power sequence ran, the mixer turning off after the speakers
+    assert not speakers.plug.is_on and not mixer.plug.is_on
+    assert speakers.plug.commands == 1
+    assert events == [("Main", "power", "button", "off")]
+    assert BUTTON_PRESS_SECONDS.get_count() == presses_before + 1
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from src.controllers.singleton_base import SingletonMeta
+from src.controllers.tv_controller import TVController
+from src.system_state import SystemState
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from src.utils.clock import VirtualClock
+from src.utils.http_client import close_http_session
+from src.utils.polling import poll_controllers_concurrently
+from tests.test_polling import FakeController
+from tests.simulators.base import SimulatorBehavior
+from tests.simulators.sony_tv import SonyTVSimulator
+from tests.test_smart_plug_controller import make_controller
+
+
+@pytest.fixture(autouse=True)
+def forget_breakers():
+    # Breakers are shared by key, so don't let open ones leak into other tests
+    yield
+    CircuitBreaker._instances.clear()
+
+
+def test_opens_after_repeated_failures_and_probes_once_cooled_down():
+    clock = VirtualClock()
+    breaker = CircuitBreaker(
+        "plug:Flaky", failure_threshold=2, cooldown_seconds=30, clock=clock
+    )
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    clock.advance(29)
+    assert breaker.state == CircuitState.OPEN
+    clock.advance(1)
+    # Only one probe at a time
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    # The failed probe doubles the cooldown
+    clock.advance(30)
+    assert not breaker.allow_request()
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker._cooldown == 30
+
+
+def test_unreachable_controller_stops_costing_its_timeout():
+    calls = []
+
+    class HungController(FakeController):
+        async def is_active(self):
+            calls.append(self)
+            return await super().is_active()
+
+    hung = HungController("Unplugged", delay=5, active=True, timeout=0.1)
+    idle = FakeController("Quiet", delay=0.01, active=False)
+
+    async def poll_repeatedly():
+        for _ in range(3):
+            assert (await poll_controllers_concurrently([hung, idle])).timed_out
+        return await poll_controllers_concurrently([hung, idle])
+
+    result = asyncio.run(poll_repeatedly())
+    # Skipped without waiting on it again
+    assert result == (False, None, [], ["Unplugged"])
+    assert len(calls) == 3
+    assert CircuitBreaker("controller:Unplugged").state == CircuitState.OPEN
+
+
+def test_tv_that_keeps_timing_out_opens_its_breaker():
+    async def poll_repeatedly():
+        tv = SonyTVSimulator(behavior=SimulatorBehavior(latency_seconds=1))
+        SingletonMeta._instances.clear()
+        controller = TVController(await tv.start(), name="Unplugged TV")
+        controller.POLL_TIMEOUT_SECONDS = 0.05
+        try:
+            for _ in range(3):
+                result = await poll_controllers_concurrently([controller])
+                assert result.timed_out == ["Unplugged TV"]
+            requests = tv.requests
+            result = await poll_controllers_concurrently([controller])
+            # Skipped without sending the TV another request
+            assert result.failed == ["Unplugged TV"]
+            assert tv.requests == requests
+        finally:
+            await close_http_session()
+            await tv.stop()
+
+    asyncio.run(poll_repeatedly())
+    assert CircuitBreaker("controller:Unplugged TV").state == CircuitState.OPEN
+
+
+def test_offline_plug_is_skipped_and_reported_in_the_status():
+    speakers = make_controller("BreakerSpeakers")
+    offline = make_controller("BreakerOffline", delay=0.01)
+    offline.plug.reachable = False
+    system_state = SystemState(speakers_controller=speakers)
+
+    async def check():
+        await speakers.turn_on()
+        for _ in range(3):
+            assert not await offline.turn_on()
+        with pytest.raises(CircuitOpenError):
+            await offline.is_on()
+
+    asyncio.run(check())
+    assert offline.plug.updates == 3
+    assert system_state.circuit_states()["plug:BreakerOffline"] == "open"
+    system_state.publish()
+    assert system_state.describe() == (
+        "Speakers are ON. Not responding: BreakerOffline."
+    )
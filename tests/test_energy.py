@@ -0,0 +1,63 @@
+import asyncio
+
+from src.controllers.smart_plug_controller import SmartPlugController
+from src.utils.energy import EnergyHistory, EnergyMonitor, RingBuffer
+from tests.simulators.kasa_plug import KasaPlugSimulator
+
+
+def test_ring_buffer_keeps_the_newest_readings_in_constant_memory():
+    buffer = RingBuffer(5)
+    memory = buffer.times.nbytes + buffer.readings.nbytes
+    for i in range(12):
+        buffer.append(i, i, i, i)
+
+    times, readings = buffer.window()
+    assert times.tolist() == [7, 8, 9, 10, 11]
+    assert readings[:, 0].tolist() == [7, 8, 9, 10, 11]
+    assert buffer.times.nbytes + buffer.readings.nbytes == memory
+    assert buffer.window(9, 11)[0].tolist() == [9, 10]
+
+
+def test_readings_are_rolled_up_into_minutes_and_hours():
+    history = EnergyHistory()
+    start = 1_700_000_000 // 3600 * 3600
+    # Two hours of readings, alternating between 10 and 20 watts
+    for second in range(0, 7200 + 1, 10):
+        history.add(start + second, 10 if second % 20 else 20)
+
+    minutes = history.query("minute")
+    assert len(minutes) == 120
+    assert minutes[0] == [start, 15, 10, 20]
+    hours = history.query("hour")
+    assert hours == [[start, 15, 10, 20], [start + 3600, 15, 10, 20]]
+    assert history.latest() == 20
+    assert len(history.query("minute", since=start + 3600)) == 60
+
+
+async def sample_simulated_plugs():
+    metered = KasaPlugSimulator(is_on=True, power_watts=12.5)
+    unmetered = KasaPlugSimulator(is_on=True)
+    controllers = [
+        SmartPlugController(await metered.start(), "Metered"),
+        SmartPlugController(await unmetered.start(), "Unmetered"),
+    ]
+    monitor = EnergyMonitor()
+    try:
+        await monitor.sample(controllers)
+        metered.is_on = False
+        controllers[0].invalidate()
+        await monitor.sample(controllers)
+    finally:
+        for controller in controllers:
+            await controller.disconnect()
+        await metered.stop()
+        await unmetered.stop()
+    return monitor
+
+
+def test_monitor_samples_only_plugs_with_an_energy_meter():
+    monitor = asyncio.run(sample_simulated_plugs())
+    assert list(monitor.histories) == ["Metered"]
+    assert monitor.histories["Metered"].latest() == 0
+    readings = monitor.histories["Metered"].query("second")
+    assert [reading[1] for reading in readings] == [12.5, 0]
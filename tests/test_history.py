@@ -0,0 +1,60 @@
+import time
+
+from src.utils.history import Event, HistoryWriter, connect, query_events
+
+
+def test_events_are_written_in_batches_and_queried_by_range(tmp_path):
+    path = str(tmp_path / "history.db")
+    writer = HistoryWriter(path, interval=0.2)
+    writer.start()
+    now = time.time()
+    for i in range(100):
+        writer.submit(Event(now + i, "Kitchen" if i % 2 else "Main", "poll", "TV", "inactive"))
+    writer.submit(Event(now + 50.5, "Main", "power", "turn_on", "on"))
+    writer.stop()
+
+    events = query_events(now + 40, now + 60, zone="Main", path=path)
+    assert len(events) == 12  # 11 polls and the power action
+    assert events[0]["time"] == now + 40
+    assert query_events(now, now + 100, kind="power", path=path)[0]["value"] == "on"
+
+    # WAL mode lets readers use the database while the writer has it open
+    assert connect(path).execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_range_queries_stay_fast_over_months_of_events(tmp_path):
+    path = str(tmp_path / "history.db")
+    connection = connect(path)
+    start = time.time() - 90 * 86400
+    zones = [f"Zone {i}" for i in range(10)]
+    with connection:
+        connection.executemany(
+            "INSERT INTO events (time, zone, kind, name, value) VALUES (?, ?, ?, ?, ?)",
+            ((start + i * 30, zones[i % 10], "poll", "TV", "inactive") for i in range(250_000)),
+        )
+    connection.close()
+
+    begin = time.perf_counter()
+    events = query_events(start + 45 * 86400, start + 46 * 86400, zone="Zone 3", path=path)
+    assert time.perf_counter() - begin < 0.05
+    assert len(events) == 288
+
+
+def test_compaction_deletes_events_past_retention(tmp_path):
+    path = str(tmp_path / "history.db")
+    writer = HistoryWriter(path, retention_days=30)
+    connection = connect(path)
+    now = time.time()
+    with connection:
+        connection.executemany(
+            "INSERT INTO events (time, zone, kind, name, value) VALUES (?, ?, ?, ?, ?)",
+            [(now - 40 * 86400, "Main", "poll", "TV", "active"), (now, "Main", "poll", "TV", "active")],
+        )
+    writer.compact(connection)
+
+    assert [event["time"] for event in query_events(0, now + 1, path=path)] == [now]
+
+
+def test_querying_before_anything_was_recorded(tmp_path):
+    assert query_events(0, time.time(), path=str(tmp_path / "missing.db")) == []
+    assert not (tmp_path / "missing.db").exists()
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from src.utils.http_client import close_http_session, get_http_session, make_timeout
+
+
+async def start_server(handler):
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def check_slow_endpoint_does_not_block_loop():
+    async def slow_handler(request):
+        await asyncio.sleep(2)
+        return web.json_response({})
+
+    runner, base_url = await start_server(slow_handler)
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    start = time.monotonic()
+    try:
+        session = get_http_session()
+        try:
+            async with session.get(base_url, timeout=make_timeout(read=0.2)):
+                pass
+            raise AssertionError("Expected the read deadline to expire")
+        except asyncio.TimeoutError:
+            elapsed = time.monotonic() - start
+    finally:
+        heartbeat_task.cancel()
+        await close_http_session()
+        await runner.cleanup()
+
+    assert elapsed < 1
+    # The loop kept running other tasks while the request was waiting
+    assert ticks >= 5
+
+
+async def check_connections_are_reused():
+    async def handler(request):
+        return web.json_response({"peer": request.transport.get_extra_info("peername")})
+
+    runner, base_url = await start_server(handler)
+    try:
+        session = get_http_session()
+        peers = set()
+        for _ in range(3):
+            async with session.get(base_url) as response:
+                peers.add(tuple((await response.json())["peer"]))
+        assert get_http_session() is session
+    finally:
+        await close_http_session()
+        await runner.cleanup()
+
+    assert len(peers) == 1
+
+
+def test_slow_endpoint_does_not_block_loop():
+    asyncio.run(check_slow_endpoint_does_not_block_loop())
+
+
+def test_connections_are_reused():
+    asyncio.run(check_connections_are_reused())
+
+
+def test_session_is_closed_when_its_loop_ends():
+    async def handler(request):
+        return web.json_response({})
+
+    async def request_and_leave_open():
+        runner, base_url = await start_server(handler)
+        async with get_http_session().get(base_url):
+            pass
+        await runner.cleanup()
+        return get_http_session()
+
+    session = asyncio.run(request_and_leave_open())
+    assert session.closed
+
+    async def get_next_session():
+        try:
+            return get_http_session()
+        finally:
+            await close_http_session()
+
+    assert asyncio.run(get_next_session()) is not session
@@ -0,0 +1,103 @@
+import asyncio
+import os
+from datetime import datetime
+
+from src.utils.log_reader import (
+    LineFilter,
+    follow_lines,
+    read_page,
+    tail_lines,
+)
+
+
+def write_log(path, count):
+    with open(path, "w") as file:
+        for i in range(count):
+            level = "ERROR" if i % 10 == 0 else "INFO"
+            file.write(f"2024-05-01 12:{i // 60:02d}:{i % 60:02d},000 - {level} - Line {i}\n")
+
+
+def test_tail_reads_only_the_end_of_the_file(tmp_path):
+    path = str(tmp_path / "app.log")
+    write_log(path, 5000)
+
+    lines, size = tail_lines(path, 3)
+
+    assert [line.split(" - ")[2] for line in lines] == ["Line 4997\n", "Line 4998\n", "Line 4999\n"]
+    assert size == os.path.getsize(path)
+
+
+def test_pages_follow_each_other_on_line_boundaries(tmp_path):
+    path = str(tmp_path / "app.log")
+    write_log(path, 500)
+
+    cursor = 0
+    pages = []
+    while True:
+        lines, cursor = read_page(path, cursor, 1000)
+        if not lines:
+            break
+        pages.append(lines)
+
+    assert len(pages) > 1
+    assert all(line.endswith("\n") for page in pages for line in page)
+    assert sum(pages, []) == open(path).readlines()
+
+
+def test_filters_keep_continuation_lines_with_their_record():
+    lines = [
+        "2024-05-01 12:00:00,000 - INFO - Starting\n",
+        "2024-05-01 12:00:01,000 - ERROR - Failed\n",
+        "Traceback (most recent call last):\n",
+        "2024-05-01 12:00:02,000 - INFO - Recovered\n",
+        "2024-05-01 12:05:00,000 - ERROR - Failed again\n",
+    ]
+
+    errors = LineFilter(min_level=40, until=datetime(2024, 5, 1, 12, 1))(lines)
+
+    assert errors == lines[1:3]
+
+
+def test_follow_yields_new_lines_and_restarts_after_rotation(tmp_path):
+    path = str(tmp_path / "app.log")
+    write_log(path, 2)
+
+    async def follow():
+        seen = []
+        lines = follow_lines(path, os.path.getsize(path), poll_interval=0.01)
+        with open(path, "a") as file:
+            file.write("appended\npartial")
+        seen.append(await lines.__anext__())
+        with open(path, "w") as file:
+            file.write("rotated\n")
+        seen.append(await lines.__anext__())
+        await lines.aclose()
+        return seen
+
+    assert asyncio.run(follow()) == ["appended\n", "rotated\n"]
+
+
+def test_followed_records_keep_their_continuation_lines(tmp_path):
+    path = str(tmp_path / "app.log")
+    write_log(path, 1)
+    record = [
+        "2024-05-01 12:00:01,000 - ERROR - Failed\n",
+        "Traceback (most recent call last):\n",
+        '  File "main.py", line 1, in <module>\n',
+        "2024-05-01 12:00:02,000 - INFO - Recovered\n",
+        "2024-05-01 12:00:03,000 - ERROR - Failed again\n",
+    ]
+
+    async def follow():
+        line_filter = LineFilter(min_level=40)
+        lines = follow_lines(path, os.path.getsize(path), poll_interval=0.01)
+        with open(path, "a") as file:
+            file.writelines(record)
+        seen = []
+        for _ in record:
+            # Filtered one line at a time, as they are streamed
+            seen.extend(line_filter([await lines.__anext__()]))
+        await lines.aclose()
+        return seen
+
+    assert asyncio.run(follow()) == record[:3] + record[4:]
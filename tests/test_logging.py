@@ -0,0 +1,50 @@
+import logging
+import os
+import time
+
+from src.utils import logging as app_logging
+from src.utils.logging import HealthLogWriter, get_health_entries
+
+
+def test_health_updates_are_batched_and_written_atomically(tmp_path):
+    path = str(tmp_path / "health.log")
+    writer = HealthLogWriter(path, interval=0.2)
+    writer.start()
+
+    writer.submit("first\n")
+    time.sleep(0.05)
+    for i in range(100):
+        writer.submit(f"update {i}\n")
+    assert open(path).read() == "first\n"
+
+    writer.stop()
+    assert open(path).read() == "update 99\n"
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_health_entries_are_kept_in_a_bounded_ring_buffer(tmp_path, monkeypatch):
+    writer = HealthLogWriter(str(tmp_path / "health.log"))
+    writer.start()
+    monkeypatch.setattr(app_logging, "_health_writer", writer)
+
+    for i in range(app_logging.HEALTH_HISTORY_SIZE + 10):
+        app_logging.update_health_log(f"Status {i}")
+    writer.stop()
+
+    entries = get_health_entries()
+    assert len(entries) == app_logging.HEALTH_HISTORY_SIZE
+    assert entries[-1].startswith(f"Status {app_logging.HEALTH_HISTORY_SIZE + 9} - ")
+
+
+def test_log_records_are_handled_off_the_calling_thread(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    try:
+        app_logging.set_up_logging()
+        logging.info("Queued record")
+        app_logging.shutdown_logging()
+    finally:
+        root.handlers = handlers
+
+    assert "Queued record" in open(tmp_path / "app.log").read()
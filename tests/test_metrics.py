@@ -0,0 +1,46 @@
+import asyncio
+
+from src.utils.metrics import (
+    CONTROLLER_CHECK_SECONDS,
+    Counter,
+    Histogram,
+    render_metrics,
+)
+from src.utils.polling import poll_controllers_concurrently
+from tests.test_polling import FakeController
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Test latency.", ["device"], (0.1, 1))
+    histogram.observe(0.05, "tv")
+    histogram.observe(0.5, "tv")
+    histogram.observe(5, "tv")
+
+    lines = histogram.render()
+
+    assert 'test_latency_seconds_bucket{device="tv",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{device="tv",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{device="tv",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_sum{device="tv"} 5.55' in lines
+    assert 'test_latency_seconds_count{device="tv"} 3' in lines
+
+
+def test_counter_is_exposed():
+    counter = Counter("test_events_total", "Test events.", ["result"])
+    counter.inc("success")
+    counter.inc("success")
+
+    output = render_metrics()
+
+    assert "# TYPE test_events_total counter" in output
+    assert 'test_events_total{result="success"} 2' in output
+
+
+def test_controller_checks_are_timed():
+    fast = FakeController("MetricsFast", delay=0.01, active=True)
+    slow = FakeController("MetricsSlow", delay=1, active=True)
+    asyncio.run(poll_controllers_concurrently([fast, slow]))
+
+    assert CONTROLLER_CHECK_SECONDS.get_count("MetricsFast") == 1
+    # The cancelled check is not recorded
+    assert CONTROLLER_CHECK_SECONDS.get_count("MetricsSlow") == 0
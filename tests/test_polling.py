@@ -0,0 +1,126 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from src.utils import concurrency
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.polling import (
+    check_controller,
+    poll_controllers_concurrently,
+    poll_controllers_sequentially,
+)
+
+
+class FakeController:
+    def __init__(self, name, delay, active, timeout=1.0, kind=""):
+        self.NAME = name
+        self.KIND = kind
+        self.POLL_TIMEOUT_SECONDS = timeout
+        self.delay = delay
+        self.active = active
+        self.cancelled = False
+
+    async def is_active(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.active
+
+
+def test_first_active_wins_and_cancels_the_rest():
+    slow = FakeController("Slow", delay=0.5, active=True)
+    fast = FakeController("Fast", delay=0.05, active=True)
+
+    start = time.monotonic()
+    result = asyncio.run(poll_controllers_concurrently([slow, fast]))
+
+    assert result.is_active and result.active_name == "Fast"
+    assert time.monotonic() - start < 0.3
+    assert slow.cancelled
+
+
+def test_reports_timed_out_controllers():
+    hung = FakeController("Hung", delay=5, active=True, timeout=0.1)
+    idle = FakeController("Idle", delay=0.01, active=False)
+
+    result = asyncio.run(poll_controllers_concurrently([hung, idle]))
+
+    assert result == (False, None, ["Hung"], [])
+
+
+def test_errors_do_not_hide_other_controllers():
+    class BrokenController(FakeController):
+        async def is_active(self):
+            raise RuntimeError("unreachable")
+
+    broken = BrokenController("Broken", delay=0, active=False)
+    playing = FakeController("Playing", delay=0.05, active=True)
+
+    result = asyncio.run(poll_controllers_concurrently([broken, playing]))
+
+    assert result.active_name == "Playing"
+    assert result.failed == ["Broken"]
+
+
+def test_polling_one_after_another_reports_errors_too(monkeypatch):
+    from src import main
+
+    class BrokenController(FakeController):
+        async def is_active(self):
+            raise RuntimeError("unreachable")
+
+    broken = BrokenController("Sequential broken", delay=0, active=False)
+    idle = FakeController("Sequential idle", delay=0, active=False)
+    playing = FakeController("Sequential playing", delay=0, active=True)
+    monkeypatch.setattr(
+        main, "get_settings", lambda: SimpleNamespace(concurrent_polling=False)
+    )
+
+    try:
+        result = asyncio.run(poll_controllers_sequentially([broken, playing]))
+        assert result == (True, "Sequential playing", [], ["Sequential broken"])
+
+        # Reported as unreachable to the cycle instead of aborting it
+        checked = asyncio.run(main.check_controllers([broken], [idle]))
+        assert checked == (False, None, False, ["Sequential broken"])
+    finally:
+        CircuitBreaker._instances.clear()
+
+
+def test_concurrent_checks_of_a_shared_controller_make_one_call():
+    shared = FakeController("Shared", delay=0.05, active=True)
+    calls = []
+    original = shared.is_active
+
+    async def counting_is_active():
+        calls.append(1)
+        return await original()
+
+    shared.is_active = counting_is_active
+
+    async def check_from_many_zones():
+        return await asyncio.gather(*(check_controller(shared) for _ in range(5)))
+
+    assert asyncio.run(check_from_many_zones()) == [True] * 5
+    assert len(calls) == 1
+
+
+def test_device_io_is_bounded(monkeypatch):
+    monkeypatch.setattr(concurrency, "MAX_CONCURRENT_DEVICE_IO", 2)
+    monkeypatch.setattr(concurrency, "_semaphore", None)
+    running = []
+    peak = []
+
+    class CountingController(FakeController):
+        async def is_active(self):
+            running.append(self)
+            peak.append(len(running))
+            await asyncio.sleep(self.delay)
+            running.remove(self)
+            return False
+
+    controllers = [CountingController(f"Zone {i}", 0.02, False) for i in range(6)]
+    asyncio.run(poll_controllers_concurrently(controllers))
+    assert max(peak) == 2
@@ -0,0 +1,99 @@
+import asyncio
+
+from src.controllers.smart_plug_controller import SmartPlugController
+from src.utils.power_state import PowerState, PowerStateMachine
+from tests.test_smart_plug_controller import FakePlug
+
+
+def make_state_machine(name, mixer_delay_seconds=0.01):
+    speakers = SmartPlugController("127.0.0.1", f"{name} speakers")
+    mixer = SmartPlugController("127.0.0.1", f"{name} mixer")
+    speakers.plug = FakePlug(delay=0)
+    mixer.plug = FakePlug(delay=0)
+    return PowerStateMachine(speakers, mixer, mixer_delay_seconds=mixer_delay_seconds)
+
+
+def test_steady_state_does_no_io():
+    state_machine = make_state_machine("Steady")
+
+    async def run_cycles():
+        assert await state_machine.turn_on()
+        for _ in range(10):
+            assert not await state_machine.turn_on()
+
+    asyncio.run(run_cycles())
+    assert state_machine.state == PowerState.ON
+    assert state_machine.speakers_controller.plug.updates == 1
+    assert state_machine.mixer_controller.plug.updates == 1
+
+
+def record_switches(plug, name, switches):
+    turn_on, turn_off = plug.turn_on, plug.turn_off
+
+    async def record_on():
+        switches.append((name, "on"))
+        await turn_on()
+
+    async def record_off():
+        switches.append((name, "off"))
+        await turn_off()
+
+    plug.turn_on, plug.turn_off = record_on, record_off
+
+
+def test_transitions_switch_both_plugs_in_order():
+    state_machine = make_state_machine("Ordered")
+    speakers = state_machine.speakers_controller.plug
+    mixer = state_machine.mixer_controller.plug
+    switches = []
+    record_switches(speakers, "speakers", switches)
+    record_switches(mixer, "mixer", switches)
+
+    async def cycle():
+        await state_machine.turn_on()
+        assert speakers.is_on and mixer.is_on
+        await state_machine.turn_off()
+
+    asyncio.run(cycle())
+    assert state_machine.state == PowerState.OFF
+    assert not speakers.is_on and not mixer.is_on
+    # The mixer comes on before the speakers and goes off after them
+    assert switches == [
+        ("mixer", "on"),
+        ("speakers", "on"),
+        ("speakers", "off"),
+        ("mixer", "off"),
+    ]
+
+
+def test_observed_change_triggers_new_sequence():
+    state_machine = make_state_machine("Observed")
+
+    async def cycle():
+        await state_machine.turn_on()
+        # Speakers switched off outside the app and then seen by a status check
+        state_machine.speakers_controller.plug.is_on = False
+        speakers_on = await state_machine.speakers_controller.is_on(fresh=True)
+        state_machine.observe_speakers(speakers_on)
+        return await state_machine.turn_on()
+
+    assert asyncio.run(cycle())
+    assert state_machine.speakers_controller.plug.is_on
+
+
+def test_resync_of_plugs_already_in_state_switches_nothing():
+    state_machine = make_state_machine("Resync")
+    state_machine.resync_interval_seconds = 0  # Every request checks the plugs
+    transitions = []
+
+    async def cycles():
+        assert await state_machine.turn_off() is False  # Already off
+        assert await state_machine.turn_on()
+        state_machine.on_state_change = transitions.append
+        assert await state_machine.turn_on() is False
+        return await state_machine.turn_on()
+
+    assert asyncio.run(cycles()) is False
+    assert state_machine.state == PowerState.ON
+    # Nor is a transition recorded for them
+    assert transitions == []
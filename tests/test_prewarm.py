@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime, timedelta
+from functools import partial
+
+from src.controllers.controller_interface import Controller
+from src.utils.counter import PlaybackCounter
+from src.utils.history import connect, query_events
+from src.utils.power_state import PowerState
+from src.utils.prewarm import Prewarmer, UsagePredictor
+from src.utils.scheduler import PollScheduler
+from src.zones import Zone
+from tests.test_power_state import make_state_machine
+
+# A Monday
+MONDAY = datetime(2024, 5, 6)
+
+
+def test_predictor_learns_usual_start_times_per_weekday_and_service():
+    starts = [
+        # The TV comes on around 8 pm on most Mondays
+        (MONDAY - timedelta(weeks=1, hours=-20, minutes=-5), "TV"),
+        (MONDAY - timedelta(weeks=2, hours=-19, minutes=-58), "TV"),
+        (MONDAY - timedelta(weeks=4, hours=-20, minutes=-2), "TV"),
+        # Spotify in the morning, but not often enough to expect it
+        (MONDAY - timedelta(weeks=1, hours=-8), "Spotify"),
+        (MONDAY - timedelta(weeks=3, hours=-8), "Spotify"),
+        # Other weekdays don't count towards Mondays
+        (MONDAY - timedelta(days=1, hours=-8), "Spotify"),
+    ]
+    predictor = UsagePredictor(window_minutes=15, min_days=3)
+    predictor.learn(starts)
+
+    assert predictor.expected == {0: [(19 * 60 + 58, "TV")]}
+    assert predictor.next_start(MONDAY + timedelta(hours=12)) == (
+        MONDAY + timedelta(hours=19, minutes=58),
+        "TV",
+    )
+    # Nothing is expected later on Monday or on Tuesday
+    assert predictor.next_start(MONDAY + timedelta(hours=21)) is None
+
+
+class NamedController(Controller):
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def NAME(self):
+        return self.name
+
+    async def is_active(self):
+        return False
+
+
+def make_zone(name, threshold_minutes=20, mixer_delay_seconds=0.01, triggers=(), sources=()):
+    state_machine = make_state_machine(name, mixer_delay_seconds)
+    playback_counter = PlaybackCounter(threshold_minutes=threshold_minutes)
+    return Zone(
+        name=name,
+        triggers=list(triggers),
+        sources=list(sources),
+        power_state_machine=state_machine,
+        playback_counter=playback_counter,
+        poll_scheduler=PollScheduler(playback_counter, {}),
+    )
+
+
+def test_prewarmed_mixer_leaves_only_the_speakers_to_turn_on(monkeypatch):
+    monkeypatch.setattr("src.utils.prewarm.record_event", lambda *args: None)
+    zone = make_zone("Prewarm")
+    state_machine = zone.power_state_machine
+    prewarmer = Prewarmer([zone], lead_minutes=5)
+    prewarmer.predictors[zone.name].expected = {0: [(20 * 60, "TV")]}
+
+    async def run():
+        await state_machine.turn_off()
+        # Too early, then within the lead time
+        await prewarmer.check(MONDAY + timedelta(hours=19, minutes=50))
+        assert state_machine.state == PowerState.OFF
+        await prewarmer.check(MONDAY + timedelta(hours=19, minutes=56))
+        assert state_machine.state == PowerState.STANDBY
+        assert state_machine.mixer_controller.plug.is_on
+        assert not state_machine.speakers_controller.plug.is_on
+
+        mixer_commands = state_machine.mixer_controller.plug.commands
+        assert await state_machine.turn_on()
+        # Only the speakers were left to switch, the mixer being on already
+        return state_machine.mixer_controller.plug.commands - mixer_commands
+
+    assert asyncio.run(run()) == 0
+    assert state_machine.state == PowerState.ON
+    assert state_machine.speakers_controller.plug.is_on
+
+
+def test_wrong_prediction_still_shuts_down_when_idle(monkeypatch):
+    monkeypatch.setattr("src.utils.prewarm.record_event", lambda *args: None)
+    zone = make_zone("Wrong prediction")
+    state_machine = zone.power_state_machine
+    prewarmer = Prewarmer([zone], lead_minutes=5)
+    prewarmer.predictors[zone.name].expected = {0: [(20 * 60, "TV")]}
+
+    async def run():
+        await state_machine.turn_off()
+        zone.playback_counter.shutoff_time = datetime.now()
+        await prewarmer.check(MONDAY + timedelta(hours=19, minutes=56))
+        # The counter starts over, so the mixer stays on for the idle time
+        assert not zone.playback_counter.should_turn_off_speakers()
+        # Once it runs out nobody used the speakers, so everything turns off
+        zone.playback_counter.shutoff_time = datetime.now()
+        assert zone.playback_counter.should_turn_off_speakers()
+        assert await state_machine.turn_off()
+        # The same expected session isn't pre-warmed again
+        await prewarmer.check(MONDAY + timedelta(hours=19, minutes=58))
+
+    asyncio.run(run())
+    assert state_machine.state == PowerState.OFF
+    assert not state_machine.mixer_controller.plug.is_on
+
+
+def test_prewarm_leaves_speakers_in_use_alone(monkeypatch):
+    monkeypatch.setattr("src.utils.prewarm.record_event", lambda *args: None)
+    zone = make_zone("In use")
+    state_machine = zone.power_state_machine
+
+    async def run():
+        await state_machine.turn_on()
+        return await state_machine.prewarm()
+
+    assert not asyncio.run(run())
+    assert state_machine.state == PowerState.ON
+
+
+def test_sources_used_without_the_speakers_are_not_learned(monkeypatch, tmp_path):
+    monkeypatch.setattr("src.utils.prewarm.record_event", lambda *args: None)
+    path = str(tmp_path / "history.db")
+    monkeypatch.setattr("src.utils.prewarm.query_events", partial(query_events, path=path))
+    zone = make_zone(
+        "Headphones", triggers=[NamedController("TV")], sources=[NamedController("Spotify")]
+    )
+    prewarmer = Prewarmer([zone], lead_minutes=5)
+    # Spotify at 8 pm on the same weekday every week, e.g. on headphones
+    today = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0)
+    connection = connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO events (time, zone, kind, name, value) VALUES (?, ?, ?, ?, ?)",
+            [
+                ((today - timedelta(weeks=weeks)).timestamp(), zone.name, "state", "service", "Spotify")
+                for weeks in range(1, 5)
+            ],
+        )
+    connection.close()
+
+    async def run():
+        await zone.power_state_machine.turn_off()
+        await prewarmer.learn()
+        await prewarmer.check(today - timedelta(minutes=4))
+
+    asyncio.run(run())
+    assert prewarmer.predictors[zone.name].expected == {}
+    assert zone.power_state_machine.state == PowerState.OFF
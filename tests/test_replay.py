@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.controllers.singleton_base import SingletonMeta
+from src.controllers.smart_plug_controller import SmartPlugController
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.clock import VirtualClock
+from src.utils.counter import PlaybackCounter
+from src.utils.history import connect
+from src.utils.replay import load_timelines, parse_script, replay
+
+
+def test_counter_runs_on_the_clock_it_is_given():
+    clock = VirtualClock(datetime(2024, 5, 6, 20, 0, 30))
+    counter = PlaybackCounter(threshold_minutes=20, clock=clock)
+    counter.reset()
+    clock.advance(19 * 60)
+    assert not counter.should_turn_off_speakers()
+    clock.advance(60)
+    assert counter.should_turn_off_speakers()
+
+
+def test_scripted_scenario_turns_off_once_idle_for_the_threshold():
+    timelines = parse_script(
+        "TV on at t=0, Spotify playing at 5m, TV off at 6m, Spotify paused at 1h"
+    )
+    assert timelines["Spotify"] == [(300, True), (3600, False)]
+
+    result = replay(timelines, triggers=["TV"], duration_seconds=86400)
+
+    (on_at, on), (off_at, off) = result.power_actions()
+    # On once the mixer had time to warm up, off 20 minutes after the music stopped
+    assert on == "turn_on" and on_at == pytest.approx(2, abs=0.01)
+    assert off == "turn_off" and 3600 + 19 * 60 <= off_at <= 3600 + 21 * 60
+    # A day of polling, most of it skipped over as steady stretches
+    assert result.cycles > 2000
+    assert result.cycles_run < 100
+
+
+def test_fast_forward_does_what_running_every_cycle_does():
+    timelines = parse_script(
+        "TV on at 0, TV off at 10m, TV on at 3h, Spotify playing at 185m, "
+        "TV off at 190m, Spotify paused at 9h, Spotify playing at 570m, "
+        "Spotify paused at 20h"
+    )
+    start = datetime(2024, 5, 6, 8, 0, 17)
+
+    for speakers_on in (False, True):
+        full = replay(
+            timelines,
+            ["TV"],
+            2 * 86400,
+            speakers_on=speakers_on,
+            start=start,
+            fast_forward=False,
+        )
+        fast = replay(
+            timelines, ["TV"], 2 * 86400, speakers_on=speakers_on, start=start
+        )
+
+        assert fast.cycles_run < full.cycles_run / 10
+        assert (fast.cycles, fast.polls) == (full.cycles, full.polls)
+        assert [e[1:] for e in fast.events] == [e[1:] for e in full.events]
+        assert [e.time for e in fast.events] == pytest.approx(
+            [e.time for e in full.events], abs=1e-3
+        )
+
+
+def test_sources_alone_do_not_turn_the_speakers_on():
+    result = replay(
+        parse_script("Spotify playing at 0; Spotify paused at 2h"),
+        triggers=["TV"],
+        duration_seconds=3 * 3600,
+    )
+    assert result.power_actions() == []
+
+    result = replay(
+        parse_script("Spotify playing at 0; Spotify paused at 2h"),
+        triggers=["TV"],
+        duration_seconds=3 * 3600,
+        speakers_on=True,
+        idle_minutes=5,
+    )
+    # Kept on while playing, then off after the shorter idle time
+    [(off_at, off)] = result.power_actions()
+    assert off == "turn_off" and 7200 + 4 * 60 <= off_at <= 7200 + 6 * 60
+
+
+def test_recorded_history_can_be_replayed(tmp_path):
+    path = str(tmp_path / "history.db")
+    since = datetime(2024, 5, 6, 19, 0)
+    start = since.timestamp()
+    connection = connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO events (time, zone, kind, name, value) VALUES (?, ?, ?, ?, ?)",
+            [
+                (start + 60, "Main", "poll", "TV", "inactive"),
+                (start + 90, "Main", "poll", "TV", "active"),
+                (start + 95, "Kitchen", "poll", "TV", "inactive"),
+                (start + 1800, "Main", "poll", "TV", "unreachable"),
+                (start + 3600, "Main", "poll", "TV", "inactive"),
+            ],
+        )
+    connection.close()
+
+    timelines = load_timelines("Main", since, since + timedelta(hours=3), path)
+    assert timelines == {"TV": [(60, False), (90, True), (3600, False)]}
+
+    result = replay(timelines, ["TV"], 3 * 3600, start=since)
+    assert [action for _, action in result.power_actions()] == ["turn_on", "turn_off"]
+
+
+def test_replays_leave_the_registries_as_they_were():
+    registries = (
+        SingletonMeta._instances,
+        SmartPlugController._instances,
+        CircuitBreaker._instances,
+    )
+    sizes = [len(registry) for registry in registries]
+
+    for _ in range(50):
+        replay(parse_script("TV on at 0, TV off at 10m"), ["TV"], 3600)
+
+    assert [len(registry) for registry in registries] == sizes
+
+
+def test_unparseable_steps_are_rejected():
+    with pytest.raises(ValueError):
+        parse_script("TV on at noon")
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from src.utils.clock import VirtualClock
+from src.utils.counter import PlaybackCounter
+from src.utils.scheduler import PollIntervals, PollScheduler
+from tests.test_polling import FakeController
+
+INTERVALS = PollIntervals(speakers_off=300, playing=60, idle=30, near_shutoff=5)
+
+
+def make_scheduler(minutes_left=10):
+    counter = PlaybackCounter()
+    counter.shutoff_time = datetime.now() + timedelta(minutes=minutes_left)
+    return PollScheduler(counter, default_intervals=INTERVALS, max_backoff_seconds=100)
+
+
+def test_interval_depends_on_situation():
+    scheduler = make_scheduler()
+
+    assert scheduler.get_interval("TV", speakers_on=False, is_active=False) == 300
+    assert scheduler.get_interval("TV", speakers_on=True, is_active=True) == 60
+    assert scheduler.get_interval("TV", speakers_on=True, is_active=False) == 30
+
+    scheduler.playback_counter.shutoff_time = datetime.now() + timedelta(minutes=1)
+    assert scheduler.get_interval("TV", speakers_on=True, is_active=False) == 5
+
+
+def test_unreachable_controllers_back_off_exponentially():
+    scheduler = make_scheduler()
+    tv = FakeController("TV", delay=0, active=False)
+
+    intervals = []
+    for _ in range(3):
+        scheduler.schedule([tv], ["TV"], speakers_on=True, is_active=False)
+        intervals.append(scheduler.get_interval("TV", True, False))
+    assert intervals == [60, 100, 100]
+
+    scheduler.schedule([tv], [], speakers_on=True, is_active=False)
+    assert scheduler.get_interval("TV", True, False) == 30
+
+
+def test_only_due_controllers_are_polled():
+    scheduler = make_scheduler()
+    tv = FakeController("TV", delay=0, active=False)
+    spotify = FakeController("Spotify", delay=0, active=True)
+
+    assert scheduler.due_controllers([tv, spotify]) == [tv, spotify]
+    scheduler.schedule([spotify], [], speakers_on=True, is_active=True)
+    assert scheduler.due_controllers([tv, spotify]) == [tv]
+
+
+def test_last_activity_carries_over_until_polled_again():
+    scheduler = make_scheduler()
+    tv = FakeController("TV", delay=0, active=False)
+    spotify = FakeController("Spotify", delay=0, active=True)
+
+    assert scheduler.resolve_activity([tv, spotify], "Spotify") == "Spotify"
+    assert scheduler.resolve_activity([tv], None) == "Spotify"
+    assert scheduler.resolve_activity([tv, spotify], None) is None
+
+
+def test_wakes_up_for_shutoff():
+    scheduler = make_scheduler(minutes_left=0.1)
+    tv = FakeController("TV", delay=0, active=False)
+    scheduler.schedule([tv], [], speakers_on=True, is_active=False)
+
+    assert scheduler.seconds_until_next_poll(speakers_on=True, is_active=False) <= 6
+
+
+def test_poll_now_wakes_up_sleep():
+    scheduler = make_scheduler()
+    tv = FakeController("TV", delay=0, active=False)
+    scheduler.schedule([tv], [], speakers_on=False, is_active=False)
+
+    async def sleep_and_wake():
+        asyncio.get_running_loop().call_later(0.05, scheduler.poll_now, "TV")
+        start = time.monotonic()
+        await scheduler.sleep(10)
+        return time.monotonic() - start
+
+    assert asyncio.run(sleep_and_wake()) < 1
+    assert scheduler.due_controllers([tv]) == [tv]
+
+
+def test_intervals_of_a_kind_apply_to_every_controller_of_it():
+    clock = VirtualClock()
+    scheduler = PollScheduler(
+        PlaybackCounter(clock=clock),
+        {"TV": INTERVALS, "Bedroom TV": PollIntervals(speakers_off=15)},
+        default_intervals=PollIntervals(speakers_off=30),
+        clock=clock,
+    )
+    kitchen = FakeController("Kitchen TV", delay=0, active=False, kind="TV")
+    bedroom = FakeController("Bedroom TV", delay=0, active=False, kind="TV")
+    other = FakeController("Other", delay=0, active=False)
+    controllers = [kitchen, bedroom, other]
+
+    scheduler.schedule(controllers, [], speakers_on=False, is_active=False)
+    # By kind, unless the name has its own intervals
+    clock.advance(15)
+    assert scheduler.due_controllers(controllers) == [bedroom]
+    clock.advance(15)
+    assert scheduler.due_controllers(controllers) == [bedroom, other]
+    clock.advance(270)
+    assert scheduler.due_controllers(controllers) == controllers
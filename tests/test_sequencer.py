@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from src.utils.sequencer import Edge, PowerSequencer, Rule
+from tests.test_smart_plug_controller import FakePlug, make_controller
+
+
+class WarmingPlug(FakePlug):
+    """A plug that only reports being on some time after it was switched on."""
+
+    def __init__(self, warm_up_seconds, **kwargs):
+        super().__init__(**kwargs)
+        self.warm_up_seconds = warm_up_seconds
+        self.switched = []
+        self._on_at = None
+
+    @property
+    def is_on(self):
+        return self._on_at is not None and time.monotonic() >= self._on_at
+
+    @is_on.setter
+    def is_on(self, value):
+        self._on_at = time.monotonic() if value else None
+
+    async def turn_on(self):
+        self.commands += 1
+        self.switched.append(time.monotonic())
+        self._on_at = time.monotonic() + self.warm_up_seconds
+
+
+def make_plugs(name, **names):
+    plugs = {}
+    for plug, plug_class in names.items():
+        controller = make_controller(f"{name} {plug}", ttl=0, delay=0)
+        if plug_class is not FakePlug:
+            controller.plug = plug_class
+        plugs[plug] = controller
+    return plugs
+
+
+def test_ready_rule_waits_only_as_long_as_the_plug_needs():
+    plugs = make_plugs(
+        "Ready", mixer=WarmingPlug(0.15, delay=0), speakers=WarmingPlug(0, delay=0)
+    )
+    sequencer = PowerSequencer(
+        plugs, [Edge("mixer", "speakers", Rule.READY)], ready_poll_seconds=0.02
+    )
+
+    start = time.monotonic()
+    assert asyncio.run(sequencer.switch(True))
+    elapsed = time.monotonic() - start
+
+    mixer, speakers = plugs["mixer"].plug, plugs["speakers"].plug
+    waited = speakers.switched[0] - mixer.switched[0]
+    assert 0.15 <= waited < 0.25
+    assert elapsed < 0.3
+
+
+def test_independent_branches_switch_in_parallel_and_off_in_reverse():
+    plugs = make_plugs("Branches", mixer=FakePlug, speakers=FakePlug, subwoofer=FakePlug)
+    edges = [
+        Edge("mixer", "speakers", Rule.DELAY, 0.1),
+        Edge("mixer", "subwoofer", Rule.DELAY, 0.1),
+    ]
+    sequencer = PowerSequencer(plugs, edges)
+
+    async def cycle():
+        start = time.monotonic()
+        await sequencer.switch(True)
+        on_seconds = time.monotonic() - start
+        assert all(plug.plug.is_on for plug in plugs.values())
+        # Nothing to wait for once the mixer has been on long enough
+        start = time.monotonic()
+        assert not await sequencer.switch(True)
+        assert time.monotonic() - start < 0.05
+
+        start = time.monotonic()
+        await sequencer.switch(False)
+        return on_seconds, time.monotonic() - start
+
+    on_seconds, off_seconds = asyncio.run(cycle())
+    # Both branches waited on the mixer at the same time, not one after another
+    assert 0.1 <= on_seconds < 0.18
+    assert 0.1 <= off_seconds < 0.18
+    assert not any(plug.plug.is_on for plug in plugs.values())
+
+
+def test_plug_is_not_switched_when_its_dependency_never_gets_ready():
+    plugs = make_plugs("Stuck", mixer=WarmingPlug(60, delay=0), speakers=FakePlug)
+    sequencer = PowerSequencer(
+        plugs,
+        [Edge("mixer", "speakers", Rule.READY)],
+        ready_poll_seconds=0.01,
+        ready_timeout_seconds=0.05,
+    )
+
+    asyncio.run(sequencer.switch(True))
+    assert not plugs["speakers"].plug.is_on
+    assert plugs["speakers"].plug.commands == 0
+
+
+def test_cycles_and_unknown_plugs_are_rejected():
+    plugs = make_plugs("Invalid", mixer=FakePlug, speakers=FakePlug)
+    with pytest.raises(ValueError):
+        PowerSequencer(plugs, [Edge("mixer", "speakers"), Edge("speakers", "mixer")])
+    with pytest.raises(ValueError):
+        PowerSequencer(plugs, [Edge("mixer", "amplifier")])
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from src.controllers.smart_plug_controller import SmartPlugController
+from src.utils.http_client import close_http_session
+from tests.simulators.base import SimulatorBehavior
+from tests.simulators.kasa_plug import KasaPlugSimulator
+from tests.simulators.spotify import SpotifySimulator
+from tests.test_spotify_controller import make_controller
+
+
+async def check_plug_controller_against_simulator():
+    simulator = KasaPlugSimulator(is_on=False)
+    address = await simulator.start()
+    controller = SmartPlugController(address, "Simulated", state_ttl_seconds=0)
+    try:
+        assert not await controller.is_on()
+        assert await controller.turn_on()
+        assert simulator.is_on
+        assert await controller.is_on()
+    finally:
+        await controller.disconnect()
+        await simulator.stop()
+    # Every query and command went over one persistent connection
+    assert simulator.connections == 1
+    assert simulator.commands == 1
+
+
+async def check_spotify_controller_against_simulator(tmp_path):
+    behavior = SimulatorBehavior(latency_seconds=0.05)
+    simulator = SpotifySimulator(is_playing=True, behavior=behavior)
+    await simulator.start()
+    controller = make_controller(tmp_path, f"http://{simulator.address}", "simulated")
+    controller.token_url = simulator.token_url
+    controller.refresh_token = "refresh"
+    controller.token_issued_at = None  # Forces a refresh against the simulator
+    try:
+        # Polling doesn't refresh the token itself, so it can't be used yet
+        assert not await controller.is_active()
+        start = time.monotonic()
+        await controller.ensure_token_valid()
+        assert await controller.is_active()
+        assert time.monotonic() - start >= 0.1
+        simulator.has_device = False
+        assert not await controller.is_active()
+    finally:
+        await close_http_session()
+        await simulator.stop()
+    assert simulator.token_requests == 1
+    assert simulator.player_requests == 2
+
+
+def test_plug_controller_against_simulator():
+    asyncio.run(check_plug_controller_against_simulator())
+
+
+def test_spotify_controller_against_simulator(tmp_path):
+    asyncio.run(check_spotify_controller_against_simulator(tmp_path))
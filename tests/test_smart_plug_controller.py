@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from src.controllers.smart_plug_controller import SmartPlugController, query_plugs
+
+
+class FakePlug:
+    """Stands in for kasa.SmartPlug and counts round-trips."""
+
+    def __init__(self, is_on=False, delay=0.05):
+        self.is_on = is_on
+        self.delay = delay
+        self.updates = 0
+        self.commands = 0
+        self.disconnects = 0
+        self.reachable = True
+
+    async def update(self):
+        self.updates += 1
+        await asyncio.sleep(self.delay)
+        if not self.reachable:
+            raise ConnectionError("Unable to connect to the device")
+
+    async def disconnect(self):
+        self.disconnects += 1
+
+    async def turn_on(self):
+        self.commands += 1
+        self.is_on = True
+
+    async def turn_off(self):
+        self.commands += 1
+        self.is_on = False
+
+
+def make_controller(name, ttl=5.0, **plug_kwargs):
+    controller = SmartPlugController("127.0.0.1", name, ttl)
+    controller.plug = FakePlug(**plug_kwargs)
+    return controller
+
+
+def test_concurrent_checks_share_one_update():
+    controller = make_controller("Coalesced")
+
+    async def check_many():
+        return await asyncio.gather(*(controller.is_on() for _ in range(10)))
+
+    assert asyncio.run(check_many()) == [False] * 10
+    assert controller.plug.updates == 1
+
+
+def test_cached_state_is_reused_until_fresh_is_requested():
+    controller = make_controller("Cached", is_on=True)
+
+    async def check():
+        await controller.is_on()
+        await controller.is_on()
+        await controller.is_on(fresh=True)
+
+    asyncio.run(check())
+    assert controller.plug.updates == 2
+
+
+def test_expired_state_is_queried_again():
+    controller = make_controller("Expiring", ttl=0.01)
+
+    async def check():
+        await controller.is_on()
+        await asyncio.sleep(0.02)
+        await controller.is_on()
+
+    asyncio.run(check())
+    assert controller.plug.updates == 2
+
+
+def test_commands_write_through_to_the_cache():
+    controller = make_controller("WriteThrough")
+
+    async def toggle():
+        await controller.turn_on()
+        assert await controller.is_on()
+        await controller.turn_on()
+        await controller.turn_off()
+        return await controller.is_on()
+
+    assert asyncio.run(toggle()) is False
+    assert controller.plug.updates == 1
+    assert controller.plug.commands == 2
+
+
+def test_query_plugs_fetches_all_plugs_concurrently():
+    speakers = make_controller("BatchSpeakers", delay=0.1, is_on=True)
+    mixer = make_controller("BatchMixer", delay=0.1)
+    offline = make_controller("BatchOffline", delay=0.1)
+    offline.plug.reachable = False
+
+    start = time.monotonic()
+    states = asyncio.run(query_plugs([speakers, mixer, offline]))
+
+    assert time.monotonic() - start < 0.2
+    assert states == {"BatchSpeakers": True, "BatchMixer": False, "BatchOffline": None}
+    # The broken connection is dropped so the next query reconnects
+    assert offline.plug.disconnects == 1
+    assert speakers.plug.disconnects == 0
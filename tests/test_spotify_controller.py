@@ -0,0 +1,207 @@
+import asyncio
+import time
+from urllib.parse import parse_qs, urlparse
+
+from aiohttp import web
+
+from src.controllers.singleton_base import SingletonMeta
+from src.controllers.spotify_controller import SpotifyAccounts, SpotifyController
+from src.utils.http_client import close_http_session
+from tests.test_http_client import start_server
+
+
+def make_controller(tmp_path, base_url, client_id, max_requests=20, account=""):
+    SingletonMeta._instances.clear()
+    controller = SpotifyController(
+        client_id,
+        "secret",
+        "http://localhost/callback",
+        token_file=str(tmp_path / f"token{account}.txt"),
+        max_requests=max_requests,
+        account=account,
+    )
+    controller.player_url = f"{base_url}/v1/me/player"
+    controller.access_token = "token"
+    controller.expires_in = 3600
+    controller.token_issued_at = time.time()
+    return controller
+
+
+async def poll(tmp_path, handler, times, client_id, max_requests=20):
+    requests = []
+
+    async def recording_handler(request):
+        requests.append(request)
+        return handler(request, len(requests))
+
+    runner, base_url = await start_server(recording_handler)
+    controller = make_controller(tmp_path, base_url, client_id, max_requests)
+    try:
+        results = [await controller.is_active() for _ in range(times)]
+    finally:
+        await close_http_session()
+        await runner.cleanup()
+    return results, requests
+
+
+def test_no_active_device_is_not_a_failure(tmp_path):
+    results, _ = asyncio.run(
+        poll(tmp_path, lambda request, n: web.Response(status=204), 1, "no-device")
+    )
+    assert results == [False]
+
+
+def test_retry_after_is_obeyed(tmp_path):
+    def handler(request, n):
+        if n == 1:
+            return web.json_response({"is_playing": True})
+        return web.Response(status=429, headers={"Retry-After": "60"})
+
+    results, requests = asyncio.run(poll(tmp_path, handler, 4, "retry-after"))
+    assert results == [True, True, True, True]
+    assert len(requests) == 2
+
+
+def test_conditional_requests_reuse_unchanged_state(tmp_path):
+    def handler(request, n):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({"is_playing": True}, headers={"ETag": '"v1"'})
+
+    results, requests = asyncio.run(poll(tmp_path, handler, 3, "etag"))
+    assert results == [True, True, True]
+    assert "If-None-Match" in requests[-1].headers
+
+
+def test_request_budget_is_respected(tmp_path):
+    handler = lambda request, n: web.json_response({"is_playing": False})
+    _, requests = asyncio.run(poll(tmp_path, handler, 5, "budget", max_requests=2))
+    assert len(requests) == 2
+
+
+def test_token_is_refreshed_ahead_of_expiry_once(tmp_path):
+    refreshes = []
+
+    async def token_handler(request):
+        refreshes.append(await request.post())
+        await asyncio.sleep(0.05)
+        return web.json_response({"access_token": f"new-{len(refreshes)}", "expires_in": 3600})
+
+    async def run():
+        runner, base_url = await start_server(token_handler)
+        controller = make_controller(tmp_path, base_url, "token-manager")
+        controller.token_url = base_url
+        controller.refresh_token = "refresh"
+        # Still valid, but within the refresh margin
+        controller.token_issued_at = time.time() - 3500
+        try:
+            manager = controller.start_token_manager()
+            await asyncio.gather(*(controller.ensure_token_valid() for _ in range(5)))
+            await asyncio.sleep(0.1)
+            manager.cancel()
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+        return controller
+
+    controller = asyncio.run(run())
+    assert len(refreshes) == 1
+    assert controller.access_token == "new-1"
+    assert not controller.should_refresh_token()
+    assert "access_token=new-1\n" in open(tmp_path / "token.txt").read()
+    assert not (tmp_path / "token.txt.tmp").exists()
+
+
+def test_polling_never_waits_on_an_expired_token(tmp_path):
+    async def run():
+        requests = []
+
+        async def handler(request):
+            requests.append(request)
+            return web.json_response({"is_playing": False})
+
+        runner, base_url = await start_server(handler)
+        controller = make_controller(tmp_path, base_url, "expired")
+        controller.token_issued_at = time.time() - 7200
+        controller.is_playing = True
+        try:
+            return await controller.is_active(), requests
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    is_active, requests = asyncio.run(run())
+    # The last known state is reused without asking Spotify with a stale token
+    assert is_active is True
+    assert requests == []
+
+
+def test_accounts_are_polled_together(tmp_path):
+    in_flight = []
+    peak = []
+
+    async def handler(request):
+        in_flight.append(request)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.1)
+        in_flight.remove(request)
+        if request.headers["Authorization"] == "Bearer token-broken":
+            return web.Response(status=500)
+        playing = request.headers["Authorization"] == "Bearer token-bob"
+        return web.json_response({"is_playing": playing})
+
+    async def run(names):
+        runner, base_url = await start_server(handler)
+        accounts = []
+        for name in names:
+            account = make_controller(tmp_path, base_url, "household", account=name)
+            account.access_token = f"token-{name}"
+            accounts.append(account)
+        try:
+            spotify = SpotifyAccounts(*accounts)
+            return await spotify.is_active(), spotify.active_account
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    is_active, active_account = asyncio.run(run(["alice", "bob", "carol", "broken"]))
+    # Music from any account counts, and one failing doesn't hide the others
+    assert is_active and active_account == "bob"
+    # All four accounts were asked at once rather than one after another
+    assert max(peak) == 4
+    assert asyncio.run(run(["alice", "carol"])) == (False, None)
+
+
+def test_accounts_have_their_own_tokens_and_share_a_budget(tmp_path):
+    handler = lambda request, n: web.json_response({"is_playing": False})
+
+    async def run():
+        requests = []
+
+        async def recording_handler(request):
+            requests.append(request)
+            return handler(request, len(requests))
+
+        runner, base_url = await start_server(recording_handler)
+        alice = make_controller(tmp_path, base_url, "shared", max_requests=3, account="alice")
+        bob = make_controller(tmp_path, base_url, "shared", max_requests=3, account="bob")
+        try:
+            spotify = SpotifyAccounts(alice, bob)
+            for _ in range(3):
+                await spotify.is_active()
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+        return alice, bob, requests
+
+    alice, bob, requests = asyncio.run(run())
+    assert alice.request_budget is bob.request_budget
+    assert len(requests) == 3
+    assert alice.NAME == "Spotify (alice)"
+    assert "state=bob" in bob.get_authorization_url()
+    # Names that aren't URL-safe come back to the callback unchanged
+    url = SpotifyController("id", "secret", "uri", account="Bob & Zoë #2").get_authorization_url()
+    assert parse_qs(urlparse(url).query)["state"] == ["Bob & Zoë #2"]
+    assert SpotifyController("id", "secret", "uri", account="carol").token_file == (
+        "spotify_token_carol.txt"
+    )
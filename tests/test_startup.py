@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = """
+import json, logging, sys
+import src.main
+print(json.dumps({
+    "modules": [name for name in ("quart", "kasa", "numpy", "RPi") if name in sys.modules],
+    "handlers": len(logging.getLogger().handlers),
+}))
+"""
+
+
+def test_importing_the_monitor_has_no_side_effects(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", SCRIPT],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": root},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output)
+
+    # The web stack and slow device libraries are only loaded when needed
+    assert result["modules"] == []
+    # Logging is only set up by an entry point, so nothing is written on import
+    assert result["handlers"] == 0
+    assert os.listdir(tmp_path) == []
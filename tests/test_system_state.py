@@ -0,0 +1,33 @@
+import asyncio
+
+from src.system_state import SystemState
+from tests.test_smart_plug_controller import make_controller
+
+
+def test_subscribers_get_changes_without_querying_the_plug():
+    system_state = SystemState()
+    speakers = make_controller("StateSpeakers")
+    system_state.speakers_controller = speakers
+
+    async def watch():
+        await speakers.turn_on()
+        system_state.publish()
+        updates = system_state.subscribe()
+        first = await updates.__anext__()
+
+        system_state.update_state(current_service="TV")
+        system_state.publish()
+        system_state.publish()  # Unchanged, so not sent again
+        system_state.update_state(current_service="Spotify")
+        system_state.publish()
+        # Only the latest unread message is kept
+        latest = await updates.__anext__()
+        await updates.aclose()
+        return first, latest
+
+    first, latest = asyncio.run(watch())
+    assert first == "Speakers are ON."
+    assert latest == "Speakers are ON and being used by Spotify."
+    # Only turn_on queried the plug
+    assert speakers.plug.updates == 1
+    assert not system_state._subscribers
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from src.controllers.singleton_base import SingletonMeta
+from src.controllers.tv_controller import TVController
+from src.utils.http_client import close_http_session
+from tests.simulators.sony_tv import SonyTVSimulator
+
+
+def make_controller(address):
+    SingletonMeta._instances.clear()
+    return TVController(address, push_notifications=True)
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+async def check_power_changes_are_pushed():
+    tv = SonyTVSimulator(power_on=False)
+    controller = make_controller(await tv.start())
+    changes = []
+    try:
+        controller.start_notifications(changes.append)
+        await wait_for(lambda: controller.pushed_power is False)
+
+        start = time.monotonic()
+        await tv.set_power(True)
+        await wait_for(lambda: changes == [False, True])
+        latency = time.monotonic() - start
+
+        assert await controller.is_active()
+        assert tv.rpc_requests == 0
+    finally:
+        await controller.stop_notifications()
+        await close_http_session()
+        await tv.stop()
+    return latency
+
+
+async def check_falls_back_to_polling_when_subscription_drops():
+    tv = SonyTVSimulator(power_on=True)
+    controller = make_controller(await tv.start())
+    try:
+        controller.start_notifications()
+        await wait_for(lambda: controller.pushed_power is True)
+
+        await tv.drop_connections()
+        await wait_for(lambda: controller.pushed_power is None)
+        assert await controller.is_active()
+        assert tv.rpc_requests == 1
+
+        # Re-subscribes once the TV is reachable again
+        await wait_for(lambda: controller.pushed_power is True)
+    finally:
+        await controller.stop_notifications()
+        await close_http_session()
+        await tv.stop()
+
+
+def test_power_changes_are_pushed():
+    assert asyncio.run(check_power_changes_are_pushed()) < 0.5
+
+
+def test_falls_back_to_polling_when_subscription_drops():
+    asyncio.run(check_falls_back_to_polling_when_subscription_drops())
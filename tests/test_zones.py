@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from src.controllers.utils import instances
+from src.controllers.utils.instances import _make_zone, get_spotify_accounts, get_spotify_controller
+from src.utils.counter import PlaybackCounter
+from src.utils.scheduler import PollScheduler
+
+
+def test_zones_are_built_from_configuration():
+    scheduler = PollScheduler(PlaybackCounter())
+    configs = [
+        {
+            "name": "Kitchen",
+            "triggers": [{"type": "tv", "ip": "192.0.2.10"}],
+            "sources": [{"type": "spotify"}],
+            "mixer": "192.0.2.20",
+            "speakers": "192.0.2.21",
+            "idle_minutes": 5,
+        },
+        {
+            "name": "Den",
+            "triggers": [{"type": "tv", "ip": "192.0.2.11", "name": "Projector"}],
+            "sources": [{"type": "spotify"}, {"type": "spotify", "account": "den"}],
+            "mixer": "192.0.2.30",
+            "speakers": "192.0.2.31",
+        },
+    ]
+
+    kitchen, den = (_make_zone(config, scheduler) for config in configs)
+
+    assert [c.NAME for c in kitchen.triggers + den.triggers] == ["Kitchen TV", "Projector"]
+    # Each zone has its own plugs and counter, but they share the Spotify accounts
+    assert kitchen.power_state_machine.speakers_controller.name == "Kitchen speakers"
+    assert den.power_state_machine.mixer_controller.ip_address == "192.0.2.30"
+    assert kitchen.playback_counter.threshold_minutes == 5
+    assert den.playback_counter is not kitchen.playback_counter
+    assert kitchen.sources[0] is den.sources[0] is get_spotify_accounts()
+    assert den.sources[1] is get_spotify_controller("den")
+    # One wake event lets one loop sleep until any zone needs it
+    assert kitchen.poll_scheduler.wake is den.poll_scheduler.wake is scheduler.wake
+
+
+def test_main_zone_is_only_built_when_configured(monkeypatch, tmp_path):
+    zones_file = tmp_path / "zones.json"
+    zones_file.write_text(
+        json.dumps(
+            [{"name": "Attic", "triggers": [], "mixer": "192.0.2.40", "speakers": "192.0.2.41"}]
+        )
+    )
+    for name in ("SPEAKERS_IP", "MIXER_IP", "TV_IP"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("ZONES_FILE", str(zones_file))
+    monkeypatch.setattr(instances, "_zones", None)
+
+    assert [zone.name for zone in instances.get_zones()] == ["Attic"]
+
+    # Some of the main zone's hosts set, but not all, is a mistake
+    monkeypatch.setenv("SPEAKERS_IP", "192.0.2.50")
+    monkeypatch.setattr(instances, "_zones", None)
+    with pytest.raises(ValueError, match="MIXER_IP, TV_IP"):
+        instances.get_zones()
+
+
+def test_zone_without_a_plug_host_is_rejected():
+    with pytest.raises(ValueError, match="speakers"):
+        _make_zone({"name": "Porch", "mixer": "192.0.2.60"}, PollScheduler(PlaybackCounter()))